@@ -1,5 +1,14 @@
+import os
 from django.contrib import admin
-from .models import Product
+from django.core.exceptions import PermissionDenied
+from django.http import FileResponse, Http404
+from django.shortcuts import get_object_or_404
+from django.urls import path, reverse
+from django.utils import timezone
+from django.utils.html import format_html
+from . import best_products, snapshot, tracing
+from .companies import invalidate as invalidate_aliases
+from .models import Company, Product, RequestProfile, ScrapeTrace
 
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
@@ -22,3 +31,134 @@ class ProductAdmin(admin.ModelAdmin):
             'classes': ('collapse',)
         }),
     )
+
+    def save_model(self, request, obj, form, change):
+        company_id = obj.company_id
+        super().save_model(request, obj, form, change)
+        if company_id != obj.company_id:
+            # Moved to another company: release it from the old best row first
+            best_products.recompute([company_id])
+        best_products.products_written([obj])
+        snapshot.changed()
+
+    def delete_model(self, request, obj):
+        company_id = obj.company_id
+        super().delete_model(request, obj)
+        best_products.recompute([company_id])
+        snapshot.changed()
+
+    def delete_queryset(self, request, queryset):
+        company_ids = set(queryset.values_list('company_id', flat=True))
+        super().delete_queryset(request, queryset)
+        best_products.recompute(company_ids)
+        snapshot.changed()
+
+@admin.register(RequestProfile)
+class RequestProfileAdmin(admin.ModelAdmin):
+    list_display = ('created_at', 'method', 'path', 'status_code', 'duration_ms', 'sql_count', 'http_count', 'trigger', 'downloads')
+    list_filter = ('trigger', 'method', 'status_code')
+    search_fields = ('path', 'profile_id')
+    ordering = ('-created_at',)
+    list_per_page = 50
+    readonly_fields = [field.name for field in RequestProfile._meta.fields]
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def delete_model(self, request, obj):
+        obj.delete_files()
+        super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        for profile in queryset:
+            profile.delete_files()
+        super().delete_queryset(request, queryset)
+
+    def get_urls(self):
+        urls = [
+            path(
+                '<int:pk>/download/<str:kind>/',
+                self.admin_site.admin_view(self.download_view),
+                name='api_requestprofile_download'
+            ),
+        ]
+        return urls + super().get_urls()
+
+    @admin.display(description='Download')
+    def downloads(self, obj):
+        links = []
+        if obj.stats_file:
+            links.append(('cProfile', reverse('admin:api_requestprofile_download', args=[obj.pk, 'stats'])))
+        if obj.timeline_file:
+            links.append(('Timeline', reverse('admin:api_requestprofile_download', args=[obj.pk, 'timeline'])))
+        return format_html(' | '.join('<a href="{}">{}</a>' for _ in links), *[
+            value for label, url in links for value in (url, label)
+        ])
+
+    def download_view(self, request, pk, kind):
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        profile = get_object_or_404(RequestProfile, pk=pk)
+        file_path = {'stats': profile.stats_file, 'timeline': profile.timeline_file}.get(kind)
+        if not file_path or not os.path.exists(file_path):
+            raise Http404('Profile file not found')
+        return FileResponse(open(file_path, 'rb'), as_attachment=True, filename=os.path.basename(file_path))
+
+@admin.register(Company)
+class CompanyAdmin(admin.ModelAdmin):
+    list_display = ('name', 'last_scraped_at', 'created_at')
+    search_fields = ('name',)
+    readonly_fields = ('created_at',)
+    ordering = ('name',)
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if change and 'name' in form.changed_data:
+            # Products and the best row carry the company's display name;
+            # bumping updated_at lets snapshots re-read the renamed rows
+            Product.objects.filter(company=obj).update(company_name=obj.name, updated_at=timezone.now())
+            best_products.recompute([obj.id])
+            snapshot.changed()
+        invalidate_aliases()
+
+    def delete_model(self, request, obj):
+        company_id = obj.id
+        super().delete_model(request, obj)
+        best_products.recompute([company_id])
+        snapshot.changed()
+        invalidate_aliases()
+
+    def delete_queryset(self, request, queryset):
+        company_ids = set(queryset.values_list('id', flat=True))
+        super().delete_queryset(request, queryset)
+        best_products.recompute(company_ids)
+        snapshot.changed()
+        invalidate_aliases()
+
+@admin.register(ScrapeTrace)
+class ScrapeTraceAdmin(admin.ModelAdmin):
+    list_display = ('dispatched_at', 'company_name', 'status', 'total_ms', 'dispatch_ms', 'make_ms', 'parse_ms',
+                    'validate_ms', 'queue_ms', 'local_write_ms', 'supabase_write_ms')
+    list_filter = ('status', 'dispatched_at')
+    search_fields = ('company_name', 'trace_id')
+    ordering = ('-dispatched_at',)
+    list_per_page = 50
+    readonly_fields = [field.name for field in ScrapeTrace._meta.fields]
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def changelist_view(self, request, extra_context=None):
+        # Latency distributions of the last day above the trace list
+        summary = tracing.latency(24)['aggregate']
+        rows = [('End to end', summary['total'])] + [
+            (name.replace('_', ' ').capitalize(), values) for name, values in summary['spans'].items()
+        ]
+        extra_context = {**(extra_context or {}), 'latency_rows': rows, 'latency_statuses': summary['statuses']}
+        return super().changelist_view(request, extra_context=extra_context)
@@ -0,0 +1,153 @@
+"""
+Competitive-positioning metrics computed in batch with NumPy.
+
+Products of all requested companies are loaded into flat arrays (price,
+rating, reviews, company code) and every metric is derived with array
+operations, so the cost per product is a handful of vectorized passes
+instead of a Python loop.
+
+The catalog has no category field, so percentiles and z-scores are taken
+against the requested competitive set: all products of the requested
+companies, or for z-scores, the products of the *other* companies.
+"""
+import numpy as np
+
+from .companies import resolve_many
+from .models import Product
+
+
+def load_product_arrays(companies):
+    """Load the requested companies' products as column arrays."""
+    known = {match[0]: match[1] for match in resolve_many(companies).values() if match}
+    rows = list(
+        Product.objects.filter(company_id__in=known)
+        .order_by()
+        .values_list('company_id', 'product_name', 'price', 'rating', 'reviews')
+    )
+    names = sorted({known[row[0]] for row in rows})
+    codes = {company_id: names.index(name) for company_id, name in known.items() if name in names}
+    return {
+        'company_names': names,
+        'company': np.fromiter((codes[row[0]] for row in rows), dtype=np.int32, count=len(rows)),
+        'product_name': [row[1] for row in rows],
+        'price': np.fromiter((row[2] for row in rows), dtype=np.float64, count=len(rows)),
+        'rating': np.fromiter((row[3] for row in rows), dtype=np.float64, count=len(rows)),
+        'reviews': np.fromiter((row[4] for row in rows), dtype=np.float64, count=len(rows)),
+    }
+
+
+def compute_insights(company, price, rating, reviews, n_companies):
+    """
+    Return per-product and per-company metric arrays.
+
+    company holds integer codes in [0, n_companies). NaN marks metrics that
+    are undefined (no competitors, zero rating, no reviews).
+    """
+    n = len(price)
+    result = {}
+
+    # Price percentile: share of the set priced at or below each product
+    sorted_prices = np.sort(price)
+    result['price_percentile'] = np.searchsorted(sorted_prices, price, side='right') * 100.0 / max(n, 1)
+
+    # Rating z-score against competitors: moments of all products minus
+    # the product's own company, from per-company sums.
+    count_c = np.bincount(company, minlength=n_companies).astype(np.float64)
+    sum_c = np.bincount(company, weights=rating, minlength=n_companies)
+    sumsq_c = np.bincount(company, weights=rating * rating, minlength=n_companies)
+    other_count = n - count_c
+    with np.errstate(divide='ignore', invalid='ignore'):
+        other_mean = (rating.sum() - sum_c) / other_count
+        other_var = (np.dot(rating, rating) - sumsq_c) / other_count - other_mean ** 2
+        other_std = np.sqrt(np.maximum(other_var, 0))
+        other_std[other_std == 0] = np.nan
+        result['rating_z'] = (rating - other_mean[company]) / other_std[company]
+
+        # Bayesian reviews-weighted rating: pulls ratings with few reviews
+        # towards the set's mean, with the median review count as prior weight
+        prior_mean = rating.mean() if n else 0.0
+        prior_weight = np.median(reviews) if n else 0.0
+        denominator = reviews + prior_weight
+        result['weighted_rating'] = np.where(
+            denominator > 0,
+            (reviews * rating + prior_weight * prior_mean) / denominator,
+            rating
+        )
+
+        result['price_per_rating_point'] = np.where(rating > 0, price / rating, np.nan)
+
+        # Per-company aggregates
+        reviews_c = np.bincount(company, weights=reviews, minlength=n_companies)
+        price_sum_c = np.bincount(company, weights=price, minlength=n_companies)
+        result['company'] = {
+            'product_count': count_c,
+            'avg_price': price_sum_c / count_c,
+            'avg_rating': sum_c / count_c,
+            'reviews_weighted_rating': np.bincount(company, weights=rating * reviews, minlength=n_companies) / reviews_c,
+            'total_reviews': reviews_c,
+            'mean_rating_z': np.bincount(
+                company, weights=np.nan_to_num(result['rating_z']), minlength=n_companies
+            ) / count_c,
+            'mean_price_percentile': np.bincount(
+                company, weights=result['price_percentile'], minlength=n_companies
+            ) / count_c,
+        }
+        # Without competitors, or when they all share one rating, a company's
+        # products have no z-scores at all
+        result['company']['mean_rating_z'][np.isnan(other_std)] = np.nan
+    return result
+
+
+def _clean(value, digits=4):
+    value = float(value)
+    return None if np.isnan(value) or np.isinf(value) else round(value, digits)
+
+
+def build_insights(companies, limit=100, offset=0):
+    """Compute insights for the requested companies and shape the response."""
+    arrays = load_product_arrays(companies)
+    names = arrays['company_names']
+    metrics = compute_insights(
+        arrays['company'], arrays['price'], arrays['rating'], arrays['reviews'], len(names)
+    )
+
+    per_company = metrics['company']
+    company_rows = [
+        {
+            'company_name': name,
+            'product_count': int(per_company['product_count'][code]),
+            'avg_price': _clean(per_company['avg_price'][code], 2),
+            'avg_rating': _clean(per_company['avg_rating'][code]),
+            'reviews_weighted_rating': _clean(per_company['reviews_weighted_rating'][code]),
+            'total_reviews': int(per_company['total_reviews'][code]),
+            'mean_rating_z': _clean(per_company['mean_rating_z'][code]),
+            'mean_price_percentile': _clean(per_company['mean_price_percentile'][code], 2),
+        }
+        for code, name in enumerate(names)
+    ]
+
+    # Only the requested page of products is converted to Python objects
+    order = np.argsort(-metrics['weighted_rating'], kind='stable')[offset:offset + limit]
+    product_rows = [
+        {
+            'company_name': names[arrays['company'][i]],
+            'product_name': arrays['product_name'][i],
+            'price': _clean(arrays['price'][i], 2),
+            'rating': _clean(arrays['rating'][i], 2),
+            'reviews': int(arrays['reviews'][i]),
+            'price_percentile': _clean(metrics['price_percentile'][i], 2),
+            'rating_z': _clean(metrics['rating_z'][i]),
+            'weighted_rating': _clean(metrics['weighted_rating'][i]),
+            'price_per_rating_point': _clean(metrics['price_per_rating_point'][i], 2),
+        }
+        for i in order
+    ]
+    found = resolve_many(companies)
+    return {
+        'companies': company_rows,
+        'products': product_rows,
+        'total_products': len(arrays['price']),
+        'missing_companies': [
+            c for c in companies if found[c] is None or found[c][1] not in names
+        ],
+    }
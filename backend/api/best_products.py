@@ -0,0 +1,92 @@
+"""
+Maintenance of the CompanyBestProduct table.
+
+A company's best product is the one with the highest rating, then the
+most reviews, then the lowest id. Writers report the product rows they
+created or changed with products_written(); each company's current best is
+replaced when a written row outranks it, and recomputed from the
+product_company_rank_idx index only when the current best itself got
+worse. Deletions go through recompute(). compare_products then reads one
+row per company.
+"""
+from django.utils import timezone
+
+from .models import CompanyBestProduct, Product
+
+BEST_FIELDS = ['company_name', 'product_name', 'price', 'rating', 'reviews']
+
+
+def rank(rating, reviews, product_id):
+    return (round(float(rating), 2), int(reviews), -product_id)
+
+
+def _best_row(company_id, product):
+    return CompanyBestProduct(
+        company_id=company_id,
+        product_id=product.id if isinstance(product, Product) else product['id'],
+        **{field: getattr(product, field) if isinstance(product, Product) else product[field] for field in BEST_FIELDS},
+        updated_at=timezone.now(),
+    )
+
+
+def _save(rows):
+    if rows:
+        CompanyBestProduct.objects.bulk_create(
+            rows, update_conflicts=True, unique_fields=['company'],
+            update_fields=['product'] + BEST_FIELDS + ['updated_at'],
+        )
+
+
+def recompute(company_ids):
+    """Rebuild the best row of each company from its products."""
+    company_ids = set(company_ids) - {None}
+    rows = []
+    for company_id in company_ids:
+        product = (
+            Product.objects.filter(company_id=company_id)
+            .order_by('-rating', '-reviews', 'id')
+            .values('id', *BEST_FIELDS)
+            .first()
+        )
+        if product is not None:
+            rows.append(_best_row(company_id, product))
+    found = {row.company_id for row in rows}
+    CompanyBestProduct.objects.filter(company_id__in=company_ids - found).delete()
+    _save(rows)
+
+
+def products_written(products):
+    """Update best rows after products were created or changed."""
+    by_company = {}
+    for product in products:
+        if product.company_id is not None:
+            by_company.setdefault(product.company_id, []).append(product)
+    if not by_company:
+        return
+
+    current = {best.company_id: best for best in CompanyBestProduct.objects.filter(company_id__in=by_company)}
+    replace = []
+    stale = []
+    for company_id, written in by_company.items():
+        top = max(written, key=lambda p: rank(p.rating, p.reviews, p.id))
+        best = current.get(company_id)
+        if best is None:
+            replace.append(_best_row(company_id, top))
+            continue
+
+        best_rank = rank(best.rating, best.reviews, best.product_id)
+        rewritten = next((p for p in written if p.id == best.product_id), None)
+        if rewritten is not None and rank(rewritten.rating, rewritten.reviews, rewritten.id) < best_rank:
+            # The best product got worse; another product may now lead
+            stale.append(company_id)
+        elif rank(top.rating, top.reviews, top.id) >= best_rank:
+            replace.append(_best_row(company_id, top))
+
+    _save(replace)
+    if stale:
+        recompute(stale)
+
+
+def lookup(company_ids):
+    """Best rows for the given companies, keyed by company id."""
+    return {best.company_id: best for best in CompanyBestProduct.objects.filter(company_id__in=company_ids)}
@@ -0,0 +1,335 @@
+"""
+SQLite-file cache backend shared by every worker process on a host.
+
+The default LocMem cache is per process, so throttling counters and cached
+data are duplicated in each gunicorn worker. This backend keeps entries in a
+single WAL-mode SQLite file instead: reads never block behind writers, and
+read-modify-write operations (incr, add) run inside ``BEGIN IMMEDIATE`` so
+they are atomic across processes.
+
+``get_or_set`` adds stampede protection: entries are recomputed slightly
+before they expire with a probability that grows as expiry approaches
+(probabilistic early expiration), and only the caller holding a short lock
+recomputes a missing entry while the others wait for its result.
+"""
+import math
+import os
+import pickle
+import random
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache_entries (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    expires REAL,
+    delta REAL NOT NULL DEFAULT 0
+)
+"""
+
+
+class SQLiteCache(BaseCache):
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+    _missing = object()
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._path = location
+        self._busy_timeout = int(options.get('BUSY_TIMEOUT', 5000))
+        self._beta = float(options.get('EARLY_EXPIRY_BETA', 1.0))
+        self._lock_timeout = float(options.get('LOCK_TIMEOUT', 10))
+        self._local = threading.local()
+
+    # Connection handling
+
+    def _connection(self):
+        # Connections are per thread and per process, so a worker forked
+        # after the parent touched the cache opens its own handle.
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        directory = os.path.dirname(self._path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self._path, timeout=self._busy_timeout / 1000, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(f'PRAGMA busy_timeout={self._busy_timeout}')
+        conn.execute(SCHEMA)
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    @contextmanager
+    def _write(self):
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        else:
+            conn.execute('COMMIT')
+
+    def close(self, **kwargs):
+        # Keep the per-thread connection open between requests; opening a
+        # SQLite handle and re-applying the pragmas costs more than a lookup.
+        pass
+
+    # Encoding: integers are stored natively so incr() can be done in SQL.
+
+    def _encode(self, value):
+        if type(value) is int and -2**63 <= value < 2**63:
+            return value
+        return sqlite3.Binary(pickle.dumps(value, self.pickle_protocol))
+
+    def _decode(self, value):
+        if isinstance(value, int):
+            return value
+        return pickle.loads(value)
+
+    def _is_live(self, expires, now):
+        return expires is None or expires > now
+
+    # Cache API
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        expires = self.get_backend_timeout(timeout)
+        now = time.time()
+        with self._write() as conn:
+            row = conn.execute('SELECT expires FROM cache_entries WHERE key = ?', (key,)).fetchone()
+            if row is not None and self._is_live(row[0], now):
+                return False
+            conn.execute(
+                'INSERT OR REPLACE INTO cache_entries (key, value, expires, delta) VALUES (?, ?, ?, 0)',
+                (key, self._encode(value), expires)
+            )
+        return True
+
+    def get(self, key, default=None, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        row = self._connection().execute(
+            'SELECT value, expires FROM cache_entries WHERE key = ?', (key,)
+        ).fetchone()
+        if row is None or not self._is_live(row[1], time.time()):
+            return default
+        return self._decode(row[0])
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        self._set_many([(key, value, 0)], timeout)
+
+    def _set_many(self, items, timeout):
+        expires = self.get_backend_timeout(timeout)
+        with self._write() as conn:
+            # Culled before writing, as Django's database cache does, so a
+            # CULL_FREQUENCY of 0 never drops the entries being set
+            self._cull(conn)
+            conn.executemany(
+                'INSERT OR REPLACE INTO cache_entries (key, value, expires, delta) VALUES (?, ?, ?, ?)',
+                [(key, self._encode(value), expires, delta) for key, value, delta in items]
+            )
+
+    def _cull(self, conn):
+        if random.random() > 1 / max(self._cull_frequency, 1):
+            return
+        conn.execute('DELETE FROM cache_entries WHERE expires IS NOT NULL AND expires <= ?', (time.time(),))
+        count = conn.execute('SELECT COUNT(*) FROM cache_entries').fetchone()[0]
+        if count <= self._max_entries:
+            return
+        if self._cull_frequency == 0:
+            # A frequency of 0 empties the cache, as in Django's backends
+            conn.execute('DELETE FROM cache_entries')
+        else:
+            conn.execute(
+                'DELETE FROM cache_entries WHERE key IN '
+                '(SELECT key FROM cache_entries ORDER BY expires IS NULL, expires LIMIT ?)',
+                (count // self._cull_frequency,)
+            )
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        now = time.time()
+        with self._write() as conn:
+            cursor = conn.execute(
+                'UPDATE cache_entries SET expires = ? WHERE key = ? AND (expires IS NULL OR expires > ?)',
+                (self.get_backend_timeout(timeout), key, now)
+            )
+            return cursor.rowcount > 0
+
+    def delete(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        with self._write() as conn:
+            return conn.execute('DELETE FROM cache_entries WHERE key = ?', (key,)).rowcount > 0
+
+    def has_key(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        row = self._connection().execute(
+            'SELECT expires FROM cache_entries WHERE key = ?', (key,)
+        ).fetchone()
+        return row is not None and self._is_live(row[0], time.time())
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        now = time.time()
+        with self._write() as conn:
+            rows = conn.execute(
+                'UPDATE cache_entries SET value = value + ? '
+                "WHERE key = ? AND typeof(value) = 'integer' AND (expires IS NULL OR expires > ?) "
+                'RETURNING value',
+                (delta, key, now)
+            ).fetchall()
+            if rows:
+                return rows[0][0]
+            # Fall back to a read-modify-write for pickled numeric values.
+            row = conn.execute('SELECT value, expires FROM cache_entries WHERE key = ?', (key,)).fetchone()
+            if row is None or not self._is_live(row[1], now):
+                raise ValueError("Key '%s' not found" % key)
+            new_value = self._decode(row[0]) + delta
+            conn.execute('UPDATE cache_entries SET value = ? WHERE key = ?', (self._encode(new_value), key))
+            return new_value
+
+    def get_many(self, keys, version=None):
+        key_map = {self.make_and_validate_key(key, version=version): key for key in keys}
+        if not key_map:
+            return {}
+        now = time.time()
+        placeholders = ','.join('?' * len(key_map))
+        rows = self._connection().execute(
+            f'SELECT key, value, expires FROM cache_entries WHERE key IN ({placeholders})',
+            list(key_map)
+        ).fetchall()
+        return {
+            key_map[key]: self._decode(value)
+            for key, value, expires in rows if self._is_live(expires, now)
+        }
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        items = [(self.make_and_validate_key(key, version=version), value, 0) for key, value in data.items()]
+        if items:
+            self._set_many(items, timeout)
+        return []
+
+    def delete_many(self, keys, version=None):
+        keys = [self.make_and_validate_key(key, version=version) for key in keys]
+        if not keys:
+            return
+        with self._write() as conn:
+            conn.executemany('DELETE FROM cache_entries WHERE key = ?', [(key,) for key in keys])
+
+    def update_many(self, keys, func, timeout=DEFAULT_TIMEOUT, version=None):
+        """
+        Atomically read-modify-write several keys.
+
+        func receives {key: value} for the keys that currently exist and
+        returns (new_values, result); new_values is stored and result is
+        returned. Other processes cannot interleave between the read and the
+        write, which is what the token-bucket throttle relies on.
+        """
+        made_keys = {key: self.make_and_validate_key(key, version=version) for key in keys}
+        original_keys = {made: key for key, made in made_keys.items()}
+        expires = self.get_backend_timeout(timeout)
+        now = time.time()
+        placeholders = ','.join('?' * len(made_keys))
+        with self._write() as conn:
+            rows = conn.execute(
+                f'SELECT key, value, expires FROM cache_entries WHERE key IN ({placeholders})',
+                list(original_keys)
+            ).fetchall()
+            current = {
+                original_keys[key]: self._decode(value)
+                for key, value, row_expires in rows if self._is_live(row_expires, now)
+            }
+            new_values, result = func(current)
+            conn.executemany(
+                'INSERT OR REPLACE INTO cache_entries (key, value, expires, delta) VALUES (?, ?, ?, 0)',
+                [(made_keys[key], self._encode(value), expires) for key, value in new_values.items()]
+            )
+        return result
+
+    def clear(self):
+        with self._write() as conn:
+            conn.execute('DELETE FROM cache_entries')
+
+    # Stampede protection
+
+    @contextmanager
+    def lock(self, key, timeout=None, version=None):
+        """Best-effort cross-process lock built on add(); yields whether it was acquired."""
+        lock_key = f'lock:{key}'
+        acquired = self.add(lock_key, os.getpid(), timeout or self._lock_timeout, version=version)
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                self.delete(lock_key, version=version)
+
+    def get_or_set(self, key, default, timeout=DEFAULT_TIMEOUT, version=None):
+        """
+        Return the cached value for key, computing it with default() if needed.
+
+        A live entry is still treated as a miss with probability
+        exp(-(expires - now) / (delta * beta)), where delta is how long the
+        value took to compute; the first caller to hit that recomputes early
+        while everyone else keeps reading the current value. On a real miss
+        only the lock holder calls default(), the others poll for its result.
+        """
+        made_key = self.make_and_validate_key(key, version=version)
+        row = self._connection().execute(
+            'SELECT value, expires, delta FROM cache_entries WHERE key = ?', (made_key,)
+        ).fetchone()
+        now = time.time()
+        if row is not None and self._is_live(row[1], now):
+            value, expires, delta = self._decode(row[0]), row[1], row[2]
+            fresh = (
+                expires is None or delta <= 0
+                or now - delta * self._beta * math.log(1 - random.random()) < expires
+            )
+            if fresh:
+                return value
+            with self.lock(key, version=version) as acquired:
+                if not acquired:
+                    return value
+                return self._compute_and_set(made_key, default, timeout)
+
+        deadline = time.time() + self._lock_timeout
+        while True:
+            with self.lock(key, version=version) as acquired:
+                if acquired:
+                    return self._compute_and_set(made_key, default, timeout)
+            time.sleep(0.05)
+            value = self.get(key, self._missing, version=version)
+            if value is not self._missing:
+                return value
+            if time.time() >= deadline:
+                return self._compute_and_set(made_key, default, timeout)
+
+    def _compute_and_set(self, made_key, default, timeout):
+        start = time.perf_counter()
+        value = default() if callable(default) else default
+        if value is not None:
+            self._set_many([(made_key, value, time.perf_counter() - start)], timeout)
+        return value
+
+
+def update_many(cache, keys, func, timeout=DEFAULT_TIMEOUT):
+    """Call cache.update_many when the backend supports it.
+
+    Other backends get a plain get_many/set_many round trip, which is not
+    atomic across processes but keeps callers working with LocMem in tests
+    or local development.
+    """
+    if hasattr(cache, 'update_many'):
+        return cache.update_many(keys, func, timeout)
+    current = cache.get_many(keys)
+    new_values, result = func(current)
+    cache.set_many(new_values, timeout)
+    return result
@@ -0,0 +1,61 @@
+"""
+File helpers shared by the export_products and import_products commands.
+"""
+import contextlib
+import gzip
+import sys
+import time
+
+EXPORT_FIELDS = ['company_name', 'product_name', 'price', 'rating', 'reviews']
+
+
+def detect_format(path, fmt=None):
+    """Return 'ndjson' or 'csv' from an explicit format or the file name."""
+    if fmt:
+        return fmt
+    name = path[:-3] if path.endswith('.gz') else path
+    if name.endswith('.csv'):
+        return 'csv'
+    if name.endswith(('.ndjson', '.jsonl', '.json')):
+        return 'ndjson'
+    raise ValueError(f"Cannot tell the format of '{path}', pass --format")
+
+
+def is_gzip(path, compress=None):
+    return compress if compress is not None else path.endswith('.gz')
+
+
+def open_binary(path, mode, compress=False):
+    """Open path (or '-' for stdin/stdout) for binary reading or writing."""
+    if path == '-':
+        stream = sys.stdin.buffer if 'r' in mode else sys.stdout.buffer
+        # GzipFile leaves the wrapped stream open; never close stdin/stdout
+        return gzip.GzipFile(fileobj=stream, mode=mode) if compress else contextlib.nullcontext(stream)
+    if compress:
+        return gzip.open(path, mode)
+    return open(path, mode)
+
+
+class Progress:
+    """Prints rows, position and throughput at a fixed row interval."""
+
+    def __init__(self, write, every, label):
+        self.write = write
+        self.every = every
+        self.label = label
+        self.started = time.perf_counter()
+        self.rows = 0
+        self._next = every
+
+    def update(self, rows, position=None):
+        self.rows = rows
+        if rows >= self._next:
+            self._next = rows + self.every
+            self.report(position)
+
+    def report(self, position=None):
+        elapsed = max(time.perf_counter() - self.started, 1e-9)
+        message = f"{self.label} {self.rows} rows in {elapsed:.1f}s ({self.rows / elapsed:.0f} rows/s)"
+        if position is not None:
+            message += f" - resume with --offset {position}"
+        self.write(message)
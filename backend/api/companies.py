@@ -0,0 +1,138 @@
+"""
+Company name resolution.
+
+Every incoming company name is reduced to an alias key (case, whitespace,
+dots and hyphens ignored) and looked up in a process-local alias map built
+from the Company table. The map is rebuilt only when the shared
+``companies:alias_version`` counter changes, which happens whenever a
+company or alias is added, so resolving a name is normally a dict lookup.
+"""
+import re
+import threading
+
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+
+VERSION_KEY = 'companies:alias_version'
+
+_lock = threading.Lock()
+_state = {'version': None, 'aliases': {}, 'companies': {}}
+
+
+def alias_key(name):
+    return re.sub(r'[\s\-\.]+', ' ', str(name)).strip().lower()
+
+
+def canonical_name(name):
+    """Display form for a company seen for the first time."""
+    return ' '.join(str(name).split()).title()
+
+
+def validate_company_name(name):
+    """Canonical form of a requested company name, or ValidationError."""
+    if not name or not isinstance(name, str):
+        raise ValidationError('Company name must be a non-empty string')
+    if not re.match(r'^[a-zA-Z0-9\s\-\.]+$', name):
+        raise ValidationError('Company name contains invalid characters')
+    return canonical_name(name)
+
+
+def _load():
+    from .models import Company
+
+    version = cache.get(VERSION_KEY, 0)
+    if _state['version'] == version:
+        return _state
+    with _lock:
+        if _state['version'] == version:
+            return _state
+        aliases = {}
+        companies = {}
+        for company_id, name, extra in Company.objects.values_list('id', 'name', 'aliases'):
+            aliases[alias_key(name)] = (company_id, name)
+            companies[company_id] = (name, list(extra or []))
+        for company_id, (name, extra) in companies.items():
+            for alias in extra:
+                aliases.setdefault(alias_key(alias), (company_id, name))
+        _state.update(version=version, aliases=aliases, companies=companies)
+    return _state
+
+
+def invalidate():
+    """Tell every worker to rebuild its alias map on next use."""
+    if not cache.add(VERSION_KEY, 1, None):
+        cache.incr(VERSION_KEY)
+
+
+def resolve(name):
+    """Return (company_id, canonical name) for a known company, else None."""
+    return _load()['aliases'].get(alias_key(name))
+
+
+def resolve_many(names):
+    aliases = _load()['aliases']
+    return {name: aliases.get(alias_key(name)) for name in names}
+
+
+def canonical_names(names):
+    """Canonical names for the input, in order and without duplicates.
+
+    Unknown companies keep their title-cased form so callers can still
+    report or scrape them.
+    """
+    result = []
+    for name, match in resolve_many(names).items():
+        canonical = match[1] if match else canonical_name(name)
+        if canonical not in result:
+            result.append(canonical)
+    return result
+
+
+def company_ids(names):
+    """Integer ids of the known companies among names."""
+    return sorted({match[0] for match in resolve_many(names).values() if match})
+
+
+def query_names(names):
+    """Canonical names plus stored aliases, for stores keyed by free-text names."""
+    state = _load()
+    result = set(canonical_names(names))
+    for match in resolve_many(names).values():
+        if match:
+            result.update(state['companies'][match[0]][1])
+    return sorted(result)
+
+
+def get_or_create_companies(names):
+    """
+    Resolve names, creating Company rows for new ones.
+
+    Returns {name: (company_id, canonical name)}. Spellings that differ
+    from the canonical name beyond case and punctuation are recorded as
+    aliases.
+    """
+    from .models import Company
+
+    resolved = resolve_many(names)
+    changed = False
+    # Variants of a new company within names resolve to the first one's row
+    new = {}
+    for name, match in resolved.items():
+        if match is None:
+            match = new.get(alias_key(name))
+        if match is None:
+            company, created = Company.objects.get_or_create(name=canonical_name(name))
+            match = new[alias_key(name)] = (company.id, company.name)
+            changed = changed or created
+        raw = ' '.join(str(name).split())
+        known = _state['companies'].get(match[0], (None, []))[1]
+        if alias_key(raw) != alias_key(match[1]) and raw not in known:
+            company = Company.objects.get(id=match[0])
+            if raw not in company.aliases:
+                company.aliases = company.aliases + [raw]
+                company.save(update_fields=['aliases'])
+                changed = True
+        resolved[name] = match
+    if changed:
+        invalidate()
+    return resolved
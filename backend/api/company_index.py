@@ -0,0 +1,225 @@
+"""
+In-memory company name index for autocomplete and near-miss resolution.
+
+Two structures are kept over every company name and alias:
+
+- a prefix trie over each word start ("google inc" is reachable from both
+  "goo" and "inc"), whose nodes carry the shortest entries below them, so
+  a prefix lookup is one walk down the trie
+- a trigram index mapping each 3-character shingle to the entries that
+  contain it; the entries sharing the most trigrams with a misspelled query
+  are re-scored by edit similarity, which copes with swapped letters
+  ("samsnug") that break most trigrams of a short name
+
+The index follows the companies alias map (api.companies): when its shared
+version changes, new companies and aliases are added in place, so ingesting
+new companies never triggers a full rebuild. Deleting, renaming or merging a
+company does rebuild it, so the old names stop resolving.
+"""
+import bisect
+import heapq
+import threading
+from collections import Counter
+from difflib import SequenceMatcher
+
+from . import companies
+
+# Trigram overlap needed to be a fuzzy candidate, and how many candidates
+# are re-scored by edit similarity
+CANDIDATE_SCORE = 0.15
+MAX_CANDIDATES = 50
+MIN_FUZZY_SCORE = 0.6
+RESOLVE_SCORE = 0.8
+
+# Each trie node keeps only its best-ranked entries, so a one-letter prefix
+# costs the same as a long one
+MAX_NODE_ENTRIES = 50
+
+
+def _trigrams(text):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class _Generation:
+    """One build of the index; entries are only ever appended to it."""
+
+    def __init__(self):
+        self.seen = {}           # company id -> (name, tuple of aliases)
+        self.entries = []        # entry id -> (company id, canonical name, alias key)
+        self.entry_ids = {}      # (company id, alias key) -> entry id
+        self.trie = {}           # char -> node; node['$'] holds ranked entries
+        self.trigrams = {}       # trigram -> set of entry ids
+        self.entry_trigrams = []
+
+    def add_entry(self, company_id, name, text):
+        key = companies.alias_key(text)
+        if not key or (company_id, key) in self.entry_ids:
+            return
+        entry_id = len(self.entries)
+        self.entries.append((company_id, name, key))
+        self.entry_ids[(company_id, key)] = entry_id
+
+        rank = (len(key), key, entry_id)
+        words = key.split(' ')
+        for start in range(len(words)):
+            node = self.trie
+            for char in ' '.join(words[start:]):
+                node = node.setdefault(char, {})
+                ranked = node.setdefault('$', [])
+                bisect.insort(ranked, rank)
+                if len(ranked) > MAX_NODE_ENTRIES:
+                    ranked.pop()
+
+        grams = _trigrams(key)
+        self.entry_trigrams.append(len(grams))
+        for gram in grams:
+            self.trigrams.setdefault(gram, set()).add(entry_id)
+
+    def add(self, company_id, name, aliases=()):
+        self.add_entry(company_id, name, name)
+        for alias in aliases:
+            self.add_entry(company_id, name, alias)
+        self.seen[company_id] = (name, tuple(aliases))
+
+    def prefix(self, key):
+        node = self.trie
+        for char in key:
+            node = node.get(char)
+            if node is None:
+                return []
+        return [entry_id for _, _, entry_id in node.get('$', [])]
+
+    def fuzzy(self, key):
+        grams = _trigrams(key)
+        shared = Counter()
+        for gram in grams:
+            for entry_id in self.trigrams.get(gram, ()):
+                shared[entry_id] += 1
+        candidates = heapq.nlargest(MAX_CANDIDATES, (
+            (count / (len(grams) + self.entry_trigrams[entry_id] - count), entry_id)
+            for entry_id, count in shared.items()
+        ))
+        scored = []
+        for overlap, entry_id in candidates:
+            if overlap < CANDIDATE_SCORE:
+                break
+            score = SequenceMatcher(None, key, self.entries[entry_id][2]).ratio()
+            if score >= MIN_FUZZY_SCORE:
+                scored.append((score, entry_id))
+        return scored
+
+
+def _outdated(seen, current):
+    """True when a company was deleted, renamed or lost an alias since it was indexed."""
+    if current is None:
+        return True
+    name, aliases = current
+    return name != seen[0] or not set(seen[1]) <= set(aliases)
+
+
+class CompanyIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._data = _Generation()
+
+    def __len__(self):
+        return len(self._data.entries)
+
+    def add(self, company_id, name, aliases=()):
+        with self._lock:
+            self._data.add(company_id, name, aliases)
+
+    def sync(self):
+        """
+        Catch up with the alias map. New companies and aliases are added
+        in place; a deleted, renamed or merged company rebuilds the index,
+        since its entries can't be taken back out of the ranked trie nodes.
+        The rebuild is swapped in whole, so lookups never see half of it.
+        """
+        state = companies._load()
+        if state['version'] == self._version:
+            return
+        with self._lock:
+            if state['version'] == self._version:
+                return
+            data = self._data
+            if any(_outdated(seen, state['companies'].get(company_id)) for company_id, seen in data.seen.items()):
+                data = _Generation()
+            for company_id, (name, aliases) in state['companies'].items():
+                if data.seen.get(company_id) != (name, tuple(aliases)):
+                    data.add(company_id, name, aliases)
+            self._data = data
+            self._version = state['version']
+
+    def suggest(self, query, limit=10):
+        """
+        Return up to limit companies for a partial or misspelled query.
+
+        Prefix matches rank first (shorter names before longer ones), then
+        fuzzy matches by similarity. Each company appears once.
+        """
+        self.sync()
+        data = self._data
+        key = companies.alias_key(query)
+        if not key:
+            return []
+
+        results = []
+        seen = set()
+        for entry_id in data.prefix(key):
+            company_id, name, matched = data.entries[entry_id]
+            if company_id not in seen:
+                seen.add(company_id)
+                results.append({'company_name': name, 'matched': matched, 'match': 'prefix', 'score': 1.0})
+                if len(results) >= limit:
+                    return results
+
+        if len(key) >= 3:
+            for score, entry_id in sorted(data.fuzzy(key), reverse=True):
+                company_id, name, matched = data.entries[entry_id]
+                if company_id not in seen:
+                    seen.add(company_id)
+                    results.append({'company_name': name, 'matched': matched, 'match': 'fuzzy', 'score': round(score, 3)})
+                    if len(results) >= limit:
+                        break
+        return results
+
+    def resolve(self, name):
+        """
+        Map a possibly misspelled name to (company id, canonical name).
+
+        Exact alias-map hits win; otherwise the best fuzzy match is used
+        when it clears RESOLVE_SCORE and is not tied with another company.
+        """
+        match = companies.resolve(name)
+        if match is not None:
+            return match
+        self.sync()
+        data = self._data
+        key = companies.alias_key(name)
+        best = {}
+        for score, entry_id in data.fuzzy(key):
+            company_id, canonical, _ = data.entries[entry_id]
+            if score > best.get(company_id, (0, None))[0]:
+                best[company_id] = (score, canonical)
+        ranked = sorted(best.items(), key=lambda item: -item[1][0])
+        if not ranked or ranked[0][1][0] < RESOLVE_SCORE:
+            return None
+        if len(ranked) > 1 and ranked[1][1][0] == ranked[0][1][0]:
+            return None
+        company_id, (_, canonical) = ranked[0]
+        return company_id, canonical
+
+
+index = CompanyIndex()
+
+
+def resolve_names(names):
+    """Return {name: canonical name} using exact, then fuzzy resolution."""
+    resolved = {}
+    for name in names:
+        match = index.resolve(name)
+        resolved[name] = match[1] if match else companies.canonical_name(name)
+    return resolved
@@ -0,0 +1,25 @@
+"""
+SQLite connection tuning.
+
+configure_connection() runs on Django's connection_created signal and
+applies settings.SQLITE_PRAGMAS to every new SQLite connection. Aliases
+marked READ_ONLY in DATABASES (the 'replica' alias used by
+api.routers.ReadReplicaRouter) also get query_only, so a routing mistake
+fails loudly instead of writing outside the primary connection.
+"""
+from django.conf import settings
+
+
+def pragma_statements(read_only=False):
+    statements = [f'PRAGMA {name}={value}' for name, value in settings.SQLITE_PRAGMAS.items()]
+    if read_only:
+        statements.append('PRAGMA query_only=ON')
+    return statements
+
+
+def configure_connection(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for statement in pragma_statements(connection.settings_dict.get('READ_ONLY', False)):
+            cursor.execute(statement)
@@ -0,0 +1,222 @@
+"""
+Server-Sent Events for scrape completion.
+
+Every ingest bumps a per-company event record (sequence number plus
+counts) in the shared cache, so any worker can publish. scrape_events is a
+raw ASGI app mounted by pullup.asgi at /api/scrape/events/: each connection
+is a coroutine parked on a queue, and one hub task per process polls the
+event records of all watched companies with a single get_many, so idle
+watchers cost no worker thread and no per-connection polling.
+
+    GET /api/scrape/events/?company_ids=12,40[&since=<unix time>]
+    GET /api/scrape/events/?companies=Apple,Samsung[&since=<unix time>]
+
+Clients should watch the company ids (or canonical names) returned by
+POST /api/scrape/, since the names they sent may have been canonicalized;
+free-text names are resolved through the alias map, and ones that are not
+known yet are retried on every keepalive.
+
+Streams a "watching" event, then one "scrape" event per company as its
+data is ingested, and "done" once every company has reported (or
+"timeout" after SSE_MAX_SECONDS). Events published at or after since are
+replayed immediately, covering a scrape that finishes before the client
+connects.
+"""
+import asyncio
+import json
+import time
+from urllib.parse import parse_qs
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .cache import update_many
+
+EVENT_KEY = 'events:scrape:{}'
+EVENT_TTL = 24 * 3600
+
+
+def publish(updates):
+    """Record a scrape event for each {company_id: payload}."""
+    if not updates:
+        return
+    payloads = {EVENT_KEY.format(company_id): payload for company_id, payload in updates.items()}
+
+    def bump(current):
+        now = time.time()
+        events = {}
+        for key, payload in payloads.items():
+            seq = (current.get(key) or {}).get('seq', 0) + 1
+            events[key] = {**payload, 'seq': seq, 'at': now}
+        return events, None
+
+    update_many(cache, list(payloads), bump, EVENT_TTL)
+
+
+class EventHub:
+    """Polls the event records of watched companies and fans them out."""
+
+    def __init__(self):
+        self._watchers = {}   # event key -> {queue: last seen seq}
+        self._task = None
+
+    def subscribe(self, queue, baselines):
+        for key, seq in baselines.items():
+            self._watchers.setdefault(key, {})[queue] = seq
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def unsubscribe(self, queue):
+        for key in list(self._watchers):
+            self._watchers[key].pop(queue, None)
+            if not self._watchers[key]:
+                del self._watchers[key]
+
+    async def _run(self):
+        while self._watchers:
+            events = await asyncio.to_thread(cache.get_many, list(self._watchers))
+            for key, event in events.items():
+                for queue, seen in list(self._watchers.get(key, {}).items()):
+                    if event['seq'] > seen:
+                        self._watchers[key][queue] = event['seq']
+                        queue.put_nowait(event)
+            await asyncio.sleep(settings.SSE_POLL_INTERVAL)
+
+
+hub = EventHub()
+
+
+def _resolve(names):
+    from .companies import resolve_many
+    return resolve_many(names)
+
+
+def _format(event, data, event_id=None):
+    message = f"event: {event}\n"
+    if event_id is not None:
+        message += f"id: {event_id}\n"
+    return (message + f"data: {json.dumps(data)}\n\n").encode()
+
+
+def _cors_headers(scope):
+    origin = dict(scope['headers']).get(b'origin', b'').decode('latin-1')
+    if origin and (settings.CORS_ALLOW_ALL_ORIGINS or origin in settings.CORS_ALLOWED_ORIGINS):
+        headers = [(b'access-control-allow-origin', origin.encode('latin-1')), (b'vary', b'Origin')]
+        if settings.CORS_ALLOW_CREDENTIALS:
+            headers.append((b'access-control-allow-credentials', b'true'))
+        return headers
+    return []
+
+
+async def _reply(send, status, body, headers=()):
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', b'application/json'), *headers]})
+    await send({'type': 'http.response.body', 'body': json.dumps(body).encode()})
+
+
+async def scrape_events(scope, receive, send):
+    query = parse_qs(scope.get('query_string', b'').decode())
+    names = [c.strip() for c in ','.join(query.get('companies', [])).split(',') if c.strip()]
+    cors = _cors_headers(scope)
+    if scope['method'] != 'GET':
+        await _reply(send, 405, {'error': 'Method not allowed'}, cors)
+        return
+    try:
+        company_ids = sorted({int(c) for c in ','.join(query.get('company_ids', [])).split(',') if c.strip()})
+    except ValueError:
+        await _reply(send, 400, {'error': 'company_ids must be integers'}, cors)
+        return
+    if not names and not company_ids:
+        await _reply(send, 400, {'error': 'Use ?company_ids=1,2 or ?companies=company1,company2'}, cors)
+        return
+    try:
+        since = float(query['since'][0]) if 'since' in query else None
+    except ValueError:
+        await _reply(send, 400, {'error': 'since must be a unix timestamp'}, cors)
+        return
+
+    await send({'type': 'http.response.start', 'status': 200, 'headers': [
+        (b'content-type', b'text/event-stream'),
+        (b'cache-control', b'no-cache'),
+        (b'x-accel-buffering', b'no'),
+        *cors,
+    ]})
+
+    async def emit(data):
+        await send({'type': 'http.response.body', 'body': data, 'more_body': True})
+
+    disconnected = asyncio.Event()
+
+    async def watch_disconnect():
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+        disconnected.set()
+
+    watcher = asyncio.get_running_loop().create_task(watch_disconnect())
+    queue = asyncio.Queue()
+    # Input names and ids still waiting for an event
+    pending = set(names) | {str(company_id) for company_id in company_ids}
+    watched = {}                  # event key -> input names and ids
+    deadline = time.monotonic() + settings.SSE_MAX_SECONDS
+    # Companies resolved after connecting may already have reported
+    replay_after = since if since is not None else time.time()
+
+    async def watch(unresolved, ids=()):
+        keys = {}
+        for company_id in ids:
+            keys.setdefault(EVENT_KEY.format(company_id), []).append(str(company_id))
+        if unresolved:
+            matches = await asyncio.to_thread(_resolve, unresolved)
+            for name, match in matches.items():
+                if match:
+                    keys.setdefault(EVENT_KEY.format(match[0]), []).append(name)
+        if not keys:
+            return
+        current = await asyncio.to_thread(cache.get_many, list(keys))
+        baselines = {}
+        for key, key_names in keys.items():
+            watched.setdefault(key, []).extend(key_names)
+            event = current.get(key)
+            if event and event['at'] >= replay_after:
+                queue.put_nowait(event)
+            baselines[key] = event['seq'] if event else 0
+        hub.subscribe(queue, baselines)
+
+    try:
+        await watch(names, company_ids)
+        unknown = [name for name in names if not any(name in v for v in watched.values())]
+        await emit(_format('watching', {'companies': names, 'company_ids': company_ids, 'unknown': unknown}))
+
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                await emit(_format('timeout', {'pending': sorted(pending)}))
+                break
+            getter = asyncio.ensure_future(queue.get())
+            stopper = asyncio.ensure_future(disconnected.wait())
+            done, _ = await asyncio.wait(
+                {getter, stopper},
+                timeout=min(settings.SSE_KEEPALIVE_SECONDS, remaining),
+                return_when=asyncio.FIRST_COMPLETED
+            )
+            getter.cancel()
+            stopper.cancel()
+            if disconnected.is_set():
+                return
+            if getter in done:
+                event = getter.result()
+                key = EVENT_KEY.format(event['company_id'])
+                pending.difference_update(watched.get(key, []))
+                await emit(_format('scrape', event, f"{event['company_id']}:{event['seq']}"))
+            else:
+                await emit(b": keepalive\n\n")
+                # Companies created after we connected can now be watched
+                unresolved = [name for name in pending if not any(name in v for v in watched.values())]
+                if unresolved:
+                    await watch(unresolved)
+        else:
+            await emit(_format('done', {'companies': names, 'company_ids': company_ids}))
+        await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        hub.unsubscribe(queue)
+        watcher.cancel()
@@ -0,0 +1,150 @@
+"""
+Data age and popularity tracking for stale-while-revalidate refreshes.
+
+compare_products counts a hit per requested company in an hourly counter of
+that company in the shared cache, so concurrent requests for different
+companies never rewrite a shared record. A company's first hit in an hour
+also claims a numbered slot in that hour's index (an incr'd slot counter
+plus one key per slot), so summing the window only reads the counters of
+companies that were requested. A company's data age is the later of Company.last_scraped_at
+(set by every ingest, even when nothing changed) and its newest
+Product.updated_at. refresh_stale combines both to rescrape the most
+requested stale companies while readers keep getting the existing rows.
+"""
+import time
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Max
+from django.utils import timezone
+
+from .models import Company, Product
+
+HOUR_SECONDS = 3600
+PENDING_KEY = 'refresh:pending:{}'
+HITS_KEY = 'popularity:{}:{}'
+SLOTS_KEY = 'popularity:{}:slots'
+SLOT_KEY = 'popularity:{}:slot:{}'
+# Counter keys per get_many when summing them, under SQLite's variable limit
+HITS_KEYS_PER_QUERY = 10000
+
+
+def _hour():
+    return int(time.time() // HOUR_SECONDS)
+
+
+def record_hits(company_ids):
+    """Count one request for each company in its current hour's counter."""
+    hour = _hour()
+    timeout = (settings.REFRESH_POPULARITY_WINDOW_HOURS + 1) * HOUR_SECONDS
+    for company_id in set(company_ids):
+        key = HITS_KEY.format(hour, company_id)
+        if cache.add(key, 1, timeout):
+            slots_key = SLOTS_KEY.format(hour)
+            slot = 1 if cache.add(slots_key, 1, timeout) else cache.incr(slots_key)
+            cache.set(SLOT_KEY.format(hour, slot), company_id, timeout)
+        else:
+            cache.incr(key)
+
+
+def requested_companies(window_hours=None):
+    """Ids of the companies with hits in the last window_hours hours."""
+    window_hours = window_hours or settings.REFRESH_POPULARITY_WINDOW_HOURS
+    hours = [_hour() - i for i in range(window_hours)]
+    slots = cache.get_many([SLOTS_KEY.format(hour) for hour in hours])
+    keys = [
+        SLOT_KEY.format(hour, slot)
+        for hour in hours
+        for slot in range(1, slots.get(SLOTS_KEY.format(hour), 0) + 1)
+    ]
+    company_ids = set()
+    for start in range(0, len(keys), HITS_KEYS_PER_QUERY):
+        company_ids.update(cache.get_many(keys[start:start + HITS_KEYS_PER_QUERY]).values())
+    return company_ids
+
+
+def popularity(window_hours=None, company_ids=None):
+    """
+    Counter of company id -> hits over the last window_hours hours, for
+    company_ids or else every company requested in that window.
+    """
+    window_hours = window_hours or settings.REFRESH_POPULARITY_WINDOW_HOURS
+    hour = _hour()
+    if company_ids is None:
+        company_ids = requested_companies(window_hours)
+    company_ids = list(company_ids)
+    chunk_size = max(HITS_KEYS_PER_QUERY // window_hours, 1)
+    totals = Counter()
+    for start in range(0, len(company_ids), chunk_size):
+        keys = {
+            HITS_KEY.format(hour - i, company_id): company_id
+            for company_id in company_ids[start:start + chunk_size]
+            for i in range(window_hours)
+        }
+        for key, hits in cache.get_many(list(keys)).items():
+            totals[keys[key]] += hits
+    return totals
+
+
+def last_scraped(company_ids=None):
+    """Return {company id: datetime of the newest data, or None}."""
+    companies = Company.objects.all()
+    products = Product.objects.exclude(company_id=None)
+    if company_ids is not None:
+        companies = companies.filter(id__in=company_ids)
+        products = products.filter(company_id__in=company_ids)
+
+    ages = dict(companies.values_list('id', 'last_scraped_at'))
+    for company_id, updated_at in products.values('company_id').annotate(
+            latest=Max('updated_at')).values_list('company_id', 'latest'):
+        current = ages.get(company_id)
+        ages[company_id] = updated_at if current is None else max(current, updated_at)
+    return ages
+
+
+def stale_before():
+    return timezone.now() - timedelta(hours=settings.REFRESH_STALE_AFTER_HOURS)
+
+
+def is_stale(scraped_at, cutoff=None):
+    return scraped_at is None or scraped_at < (cutoff or stale_before())
+
+
+def mark_pending(company_id):
+    """Claim a company for refresh; False if a refresh is already in flight."""
+    return cache.add(PENDING_KEY.format(company_id), True, settings.REFRESH_PENDING_SECONDS)
+
+
+def clear_pending(company_ids):
+    cache.delete_many([PENDING_KEY.format(company_id) for company_id in company_ids])
+
+
+def refresh_candidates(min_hits=1):
+    """
+    Stale companies with at least min_hits recent requests, most requested
+    first (oldest data breaks ties), skipping refreshes already in flight.
+
+    Returns a list of (company id, name, hits, last scraped).
+    """
+    hits = popularity()
+    ids = [company_id for company_id, count in hits.items() if count >= min_hits]
+    if not ids:
+        return []
+
+    ages = last_scraped(ids)
+    cutoff = stale_before()
+    pending = cache.get_many([PENDING_KEY.format(company_id) for company_id in ids])
+    names = dict(Company.objects.filter(id__in=ids).values_list('id', 'name'))
+
+    candidates = [
+        (company_id, names[company_id], hits[company_id], ages.get(company_id))
+        for company_id in ids
+        if company_id in names
+        and is_stale(ages.get(company_id), cutoff)
+        and PENDING_KEY.format(company_id) not in pending
+    ]
+    oldest = timezone.now() - timedelta(days=36500)
+    candidates.sort(key=lambda c: (-c[2], c[3] or oldest))
+    return candidates
@@ -0,0 +1,356 @@
+"""
+Product ingest shared by the scrape callback and catalog imports.
+
+Make.com re-sends mostly identical data on every scrape, so each incoming
+product is reduced to a content hash over its normalized price, rating and
+reviews. One batched lookup loads the stored hashes for the whole batch, and
+only new or changed rows are written locally. Each row also keeps the hash
+last written to Supabase (synced_hash), so rows whose remote write failed are
+sent again by the next ingest even when their content is unchanged.
+Callers that wrote a product to Supabase themselves (or read it from there)
+set 'remote_synced' on it so its row starts out synced.
+"""
+import logging
+import time
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from . import best_products, events, metrics, snapshot
+from .companies import get_or_create_companies, resolve
+from .freshness import clear_pending
+from .models import Company, Product, product_content_hash
+
+logger = logging.getLogger('webhook')
+
+REQUIRED_FIELDS = ['company_name', 'product_name', 'price', 'rating', 'reviews']
+
+# Keeps the IN (...) lists of the hash lookup under SQLite's variable limit
+LOOKUP_CHUNK_SIZE = 400
+
+
+class InvalidProduct(ValueError):
+    pass
+
+
+def normalize_product(product_data):
+    """Validate one incoming product and convert its numeric fields."""
+    if not isinstance(product_data, dict):
+        raise InvalidProduct(f"Expected an object, got {type(product_data).__name__}")
+    missing_fields = [field for field in REQUIRED_FIELDS if field not in product_data]
+    if missing_fields:
+        raise InvalidProduct(f"Missing required fields for product: {missing_fields}")
+
+    try:
+        # Make.com may send numbers or formatted strings like "$1,299.00"
+        if isinstance(product_data['price'], (int, float)):
+            price = float(product_data['price'])
+        else:
+            price = float(str(product_data['price']).replace('$', '').replace(',', '').strip())
+
+        if isinstance(product_data['rating'], (int, float)):
+            rating = float(product_data['rating'])
+        else:
+            rating = float(str(product_data['rating']).strip())
+
+        if isinstance(product_data['reviews'], int):
+            reviews = product_data['reviews']
+        else:
+            reviews = int(str(product_data['reviews']).replace(',', '').strip())
+    except (ValueError, TypeError) as e:
+        raise InvalidProduct(f"Error converting numeric fields: {str(e)}")
+
+    return {
+        'company_name': str(product_data['company_name']).strip(),
+        'product_name': str(product_data['product_name']).strip(),
+        'price': price,
+        'rating': rating,
+        'reviews': reviews,
+    }
+
+
+def result_set_company(result_set):
+    return result_set.get('companyName') or result_set.get('company_name')
+
+
+def result_set_failure(company, error, product_count):
+    """The failed_companies entry for a result set, or None if its products are usable."""
+    if not company:
+        return {'company': None, 'error': 'Result set without companyName'}
+    if error or not product_count:
+        return {'company': company, 'error': error or 'No products returned'}
+    return None
+
+
+def with_company_name(product, company):
+    """Products in a result set may omit company_name and take it from the set."""
+    if isinstance(product, dict) and 'company_name' not in product:
+        return {**product, 'company_name': company}
+    return product
+
+
+def flatten_result_sets(payload):
+    """
+    Split a callback payload into raw products and per-company failures.
+
+    Accepts a product list, {"products": [...]}, or the batched form
+    {"results": [{"companyName": ..., "products": [...], "error": ...}]}
+    sent back for a multi-company dispatch, where products may omit
+    company_name and take it from their result set. Returns
+    (products, failed) with failed entries shaped like dispatch failures.
+    api.streaming reads the same formats incrementally.
+    """
+    if isinstance(payload, list):
+        return payload, []
+    if 'results' not in payload:
+        return payload.get('products', []), []
+
+    products = []
+    failed = []
+    for result_set in payload['results']:
+        company = result_set_company(result_set)
+        company_products = result_set.get('products') or []
+        failure = result_set_failure(company, result_set.get('error'), len(company_products))
+        if failure:
+            failed.append(failure)
+            continue
+        products.extend(with_company_name(product, company) for product in company_products)
+    return products, failed
+
+
+class IngestResult:
+    def __init__(self):
+        self.new = []
+        self.changed = []
+        self.unchanged = []
+        self.errors = []
+        self.timings = {'local_write_ms': 0.0, 'supabase_write_ms': 0.0}
+
+    @property
+    def products(self):
+        return self.new + self.changed + self.unchanged
+
+    def counts(self):
+        return {
+            'new_count': len(self.new),
+            'changed_count': len(self.changed),
+            'unchanged_count': len(self.unchanged),
+        }
+
+    def by_company(self):
+        """Counts per canonical company name."""
+        companies = {}
+        for key, products in (('new_count', self.new), ('changed_count', self.changed),
+                              ('unchanged_count', self.unchanged)):
+            for product in products:
+                counts = companies.setdefault(
+                    product['company_name'], {'new_count': 0, 'changed_count': 0, 'unchanged_count': 0}
+                )
+                counts[key] += 1
+        return companies
+
+
+def ingest_products(products, sync_remote=True):
+    """
+    Write normalized products, skipping rows whose content hash is unchanged.
+
+    Returns an IngestResult whose new/changed/unchanged lists hold the
+    normalized product dicts and whose timings hold the milliseconds spent
+    writing locally and to Supabase.
+    """
+    result = IngestResult()
+
+    if not products:
+        return result
+    started = time.perf_counter()
+
+    # Every name goes through the alias map, so "apple" and "Apple" land on
+    # the same Company and rows are matched by integer company id.
+    companies = get_or_create_companies({product['company_name'] for product in products})
+
+    # Later duplicates of the same product win, as with sequential updates
+    incoming = {}
+    remote_synced = {}
+    for product in products:
+        product['company_id'], product['company_name'] = companies[product['company_name']]
+        product['content_hash'] = product_content_hash(product['price'], product['rating'], product['reviews'])
+        key = (product['company_id'], product['product_name'])
+        incoming[key] = product
+        remote_synced[key] = product.get('remote_synced', False)
+
+    existing = {}
+    keys = list(incoming)
+    for start in range(0, len(keys), LOOKUP_CHUNK_SIZE):
+        chunk = keys[start:start + LOOKUP_CHUNK_SIZE]
+        company_ids = {company_id for company_id, _ in chunk}
+        names = {name for _, name in chunk}
+        for row in Product.objects.filter(company_id__in=company_ids, product_name__in=names).only(
+            'id', 'company_id', 'product_name', 'content_hash', 'synced_hash'
+        ):
+            existing.setdefault((row.company_id, row.product_name), row)
+
+    to_create = []
+    to_update = []
+    unsynced = []
+    now = timezone.now()
+    for key, product in incoming.items():
+        row = existing.get(key)
+        if row is None:
+            to_create.append(Product(**{field: value for field, value in product.items() if field != 'remote_synced'}))
+            result.new.append(product)
+        elif row.content_hash != product['content_hash']:
+            row.company_name = product['company_name']
+            row.price = product['price']
+            row.rating = product['rating']
+            row.reviews = product['reviews']
+            row.content_hash = product['content_hash']
+            row.updated_at = now
+            to_update.append(row)
+            result.changed.append(product)
+        else:
+            result.unchanged.append(product)
+            if row.synced_hash != product['content_hash'] and not remote_synced[key]:
+                unsynced.append(product)
+
+    with transaction.atomic():
+        if to_create:
+            Product.objects.bulk_create(to_create, batch_size=500)
+        if to_update:
+            _update_rows(to_update)
+        _mark_synced([product for key, product in incoming.items() if remote_synced[key]])
+        best_products.products_written(to_create + to_update)
+        Company.objects.filter(id__in={company_id for company_id, _ in incoming}).update(last_scraped_at=now)
+    result.timings['local_write_ms'] = (time.perf_counter() - started) * 1000
+    snapshot.changed()
+    # Fresh data arrived, so scheduled refreshes for these companies are done
+    # and anyone watching them over /api/scrape/events/ is notified
+    clear_pending({company_id for company_id, _ in incoming})
+    by_company = result.by_company()
+    events.publish({
+        company_id: {'company_id': company_id, 'company_name': name, **by_company.get(name, {})}
+        for company_id, name in set(companies.values())
+    })
+    logger.info(
+        f"Local ingest: {len(result.new)} new, {len(result.changed)} changed, "
+        f"{len(result.unchanged)} unchanged"
+    )
+
+    metrics.incr('ingest.new', len(result.new))
+    metrics.incr('ingest.changed', len(result.changed))
+    metrics.incr('ingest.unchanged', len(result.unchanged))
+
+    to_sync = [
+        product for product in result.new + result.changed
+        if not remote_synced[(product['company_id'], product['product_name'])]
+    ] + unsynced
+    if sync_remote and to_sync:
+        started = time.perf_counter()
+        _mark_synced(sync_to_supabase(to_sync, result))
+        result.timings['supabase_write_ms'] = (time.perf_counter() - started) * 1000
+    return result
+
+
+def _update_rows(rows):
+    """
+    Write changed rows with one executemany UPDATE.
+
+    QuerySet.bulk_update builds a CASE WHEN per column per row, which is
+    several times slower than a prepared statement for large imports.
+    """
+    ops = connection.ops
+    price_field = Product._meta.get_field('price')
+    rating_field = Product._meta.get_field('rating')
+    sql = (
+        f"UPDATE {ops.quote_name(Product._meta.db_table)} SET "
+        "company_name = %s, price = %s, rating = %s, reviews = %s, content_hash = %s, updated_at = %s WHERE id = %s"
+    )
+    params = [
+        (
+            row.company_name,
+            ops.adapt_decimalfield_value(price_field.to_python(row.price), price_field.max_digits, price_field.decimal_places),
+            ops.adapt_decimalfield_value(rating_field.to_python(row.rating), rating_field.max_digits, rating_field.decimal_places),
+            row.reviews,
+            row.content_hash,
+            ops.adapt_datetimefield_value(row.updated_at),
+            row.id
+        )
+        for row in rows
+    ]
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, params)
+
+
+def _mark_synced(products):
+    """Record the content hash Supabase now holds for each product."""
+    if not products:
+        return
+    sql = (
+        f"UPDATE {connection.ops.quote_name(Product._meta.db_table)} SET synced_hash = %s "
+        "WHERE company_id = %s AND product_name = %s"
+    )
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.executemany(sql, [
+            (product['content_hash'], product['company_id'], product['product_name']) for product in products
+        ])
+
+
+def sync_to_supabase(products, result):
+    """
+    Upsert products into Supabase with one lookup for the batch.
+
+    Remote rows keep whatever company spelling wrote them, so the lookup is
+    by product name and rows are matched to companies through the alias map.
+    Returns the products whose remote write succeeded.
+    """
+    from .supabase_client import supabase
+
+    names = sorted({p['product_name'] for p in products})
+    try:
+        lookup = supabase.execute(
+            supabase.table('products').select('id,company_name,product_name').in_('product_name', names),
+            read=True
+        )
+    except Exception as e:
+        logger.error(f"Error looking up products in Supabase: {str(e)}")
+        result.errors.append({'stage': 'supabase_lookup', 'error': str(e)})
+        return []
+
+    remote_ids = {}
+    for row in lookup.data or []:
+        match = resolve(row['company_name'])
+        if match:
+            remote_ids.setdefault((match[0], row['product_name']), row['id'])
+
+    synced = []
+    inserts = []
+    inserted = []
+    for product in products:
+        supabase_data = {
+            'company_name': product['company_name'],
+            'product_name': product['product_name'],
+            'price': float(product['price']),
+            'rating': float(product['rating']),
+            'reviews': str(product['reviews'])
+        }
+        supabase_id = remote_ids.get((product['company_id'], product['product_name']))
+        if supabase_id is None:
+            inserts.append(supabase_data)
+            inserted.append(product)
+            continue
+        try:
+            supabase.execute(supabase.table('products').update(supabase_data).eq('id', supabase_id))
+            synced.append(product)
+            logger.info(f"Updated existing product in Supabase: {product['product_name']}")
+        except Exception as e:
+            logger.error(f"Error updating product in Supabase: {str(e)}")
+            result.errors.append({'stage': 'supabase_update', 'product': product['product_name'], 'error': str(e)})
+
+    if inserts:
+        try:
+            supabase.execute(supabase.table('products').insert(inserts))
+            synced.extend(inserted)
+            logger.info(f"Created {len(inserts)} new products in Supabase")
+        except Exception as e:
+            logger.error(f"Error inserting products into Supabase: {str(e)}")
+            result.errors.append({'stage': 'supabase_insert', 'error': str(e)})
+    return synced
@@ -0,0 +1,455 @@
+"""
+Durable ingest queue drained by a single writer.
+
+Request handlers used to write products inside the request, so several
+Make.com callbacks arriving together, ProductViewSet.create and
+sync_from_supabase all fought over the SQLite write lock. They now validate
+their products and enqueue() them as a batch in a separate SQLite file
+(INGEST_QUEUE_PATH), which is a short append, and return the batch id.
+
+One writer drains the queue: it claims queued batches in arrival order,
+merges up to INGEST_WRITER_MAX_PRODUCTS products into one ingest_products()
+call (a single transaction) and stores each batch's own counts. Only the
+holder of the writer lease may drain; the ingest_worker command keeps it
+while running, and a heartbeat thread renews it during long writes and
+Supabase syncs. With INGEST_INLINE_DRAIN on and no worker holding the lease,
+drain_own() lets a request write the batches it just enqueued itself, one
+writer at a time.
+
+Claimed batches record their writer, and only that writer can complete or
+fail them. Batches left 'processing' by another owner belong to a writer
+that died or lost its lease, and are re-queued by the next lease holder.
+Failed batches are retried with a growing delay up to INGEST_MAX_ATTEMPTS
+times. status() reports a batch as queued, processing,
+done or failed. Batches carry the scrape trace ids of their callback, and
+the writer records its queue wait and write times on them (api.tracing).
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.conf import settings
+
+from . import metrics, tracing
+from .ingest import ingest_products
+
+logger = logging.getLogger('webhook')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS batches (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    batch_id TEXT NOT NULL UNIQUE,
+    source TEXT NOT NULL,
+    status TEXT NOT NULL,
+    products TEXT,
+    product_count INTEGER NOT NULL,
+    invalid_count INTEGER NOT NULL DEFAULT 0,
+    failed_companies TEXT,
+    sync_remote INTEGER NOT NULL DEFAULT 1,
+    trace_ids TEXT,
+    owner TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    result TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    available_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS batches_status ON batches (status, seq);
+CREATE TABLE IF NOT EXISTS writer_lease (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    owner TEXT NOT NULL,
+    expires REAL NOT NULL
+);
+"""
+
+STATUSES = ['queued', 'processing', 'done', 'failed']
+
+# How long a request waits for another inline writer to finish before it
+# leaves its batches queued
+INLINE_WAIT_SECONDS = 5
+
+
+def new_owner(prefix='writer'):
+    return f"{prefix}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+class IngestQueue:
+    def __init__(self, path, busy_timeout=5000):
+        self._path = path
+        self._busy_timeout = busy_timeout
+        self._local = threading.local()
+
+    def _connection(self):
+        # Per thread and per process, as in api.cache
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        directory = os.path.dirname(self._path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self._path, timeout=self._busy_timeout / 1000, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        # Batches are acknowledged to Make.com once enqueued, so commits
+        # must survive a power loss
+        conn.execute('PRAGMA synchronous=FULL')
+        conn.execute(f'PRAGMA busy_timeout={self._busy_timeout}')
+        conn.executescript(SCHEMA)
+        # Queue files created by earlier versions lack the newer columns
+        columns = {row['name'] for row in conn.execute('PRAGMA table_info(batches)')}
+        for column in ('trace_ids', 'owner'):
+            if column not in columns:
+                conn.execute(f'ALTER TABLE batches ADD COLUMN {column} TEXT')
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    @contextmanager
+    def _write(self):
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        else:
+            conn.execute('COMMIT')
+
+    # Producers
+
+    def enqueue(self, products, source, invalid_count=0, failed_companies=None, sync_remote=True, trace_ids=None):
+        """Store normalized products as one batch and return its id."""
+        batch_id = uuid.uuid4().hex
+        now = time.time()
+        with self._write() as conn:
+            conn.execute(
+                'INSERT INTO batches (batch_id, source, status, products, product_count, invalid_count, '
+                'failed_companies, sync_remote, trace_ids, created_at, available_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (batch_id, source, 'queued', json.dumps(products), len(products), invalid_count,
+                 json.dumps(failed_companies or []), int(sync_remote), json.dumps(trace_ids or []), now, now)
+            )
+        metrics.incr('ingest_queue.enqueued')
+        metrics.incr('ingest_queue.enqueued_products', len(products))
+        return batch_id
+
+    def status(self, batch_id):
+        conn = self._connection()
+        row = conn.execute(
+            'SELECT seq, batch_id, source, status, product_count, invalid_count, failed_companies, attempts, '
+            'result, error, created_at, started_at, finished_at FROM batches WHERE batch_id = ?',
+            (batch_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        status = {
+            'batch_id': row['batch_id'],
+            'source': row['source'],
+            'status': row['status'],
+            'product_count': row['product_count'],
+            'invalid_count': row['invalid_count'],
+            'attempts': row['attempts'],
+            'created_at': row['created_at'],
+            'started_at': row['started_at'],
+            'finished_at': row['finished_at'],
+        }
+        failed_companies = json.loads(row['failed_companies'] or '[]')
+        if failed_companies:
+            status['failed_companies'] = failed_companies
+        if row['status'] == 'queued':
+            status['queue_position'] = conn.execute(
+                "SELECT COUNT(*) FROM batches WHERE status = 'queued' AND seq < ?", (row['seq'],)
+            ).fetchone()[0]
+        if row['result']:
+            status['result'] = json.loads(row['result'])
+        if row['error']:
+            status['error'] = row['error']
+        return status
+
+    def stats(self):
+        conn = self._connection()
+        counts = dict.fromkeys(STATUSES, 0)
+        for row in conn.execute('SELECT status, COUNT(*) FROM batches GROUP BY status'):
+            counts[row[0]] = row[1]
+        queued = conn.execute(
+            "SELECT COALESCE(SUM(product_count), 0), MIN(created_at) FROM batches WHERE status = 'queued'"
+        ).fetchone()
+        return {
+            'batches': counts,
+            'queued_products': queued[0],
+            'oldest_queued_seconds': round(time.time() - queued[1], 1) if queued[1] else None,
+            'writer': self.lease_holder(),
+        }
+
+    def has_queued(self, batch_ids=None):
+        """Whether a queued batch (of batch_ids, if given) is ready to be written now."""
+        sql = "SELECT 1 FROM batches WHERE status = 'queued' AND available_at <= ?"
+        params = [time.time()]
+        if batch_ids is not None:
+            sql += f" AND batch_id IN ({', '.join('?' * len(batch_ids))})"
+            params.extend(batch_ids)
+        return self._connection().execute(sql + ' LIMIT 1', params).fetchone() is not None
+
+    # Writer lease
+
+    def acquire_lease(self, owner, seconds=None):
+        """Take or renew the writer lease; False while another owner holds it."""
+        seconds = settings.INGEST_LEASE_SECONDS if seconds is None else seconds
+        now = time.time()
+        with self._write() as conn:
+            row = conn.execute('SELECT owner, expires FROM writer_lease WHERE id = 1').fetchone()
+            if row is not None and row['owner'] != owner and row['expires'] > now:
+                return False
+            conn.execute(
+                'INSERT OR REPLACE INTO writer_lease (id, owner, expires) VALUES (1, ?, ?)', (owner, now + seconds)
+            )
+        return True
+
+    def release_lease(self, owner):
+        with self._write() as conn:
+            conn.execute('DELETE FROM writer_lease WHERE id = 1 AND owner = ?', (owner,))
+
+    def lease_holder(self):
+        row = self._connection().execute('SELECT owner, expires FROM writer_lease WHERE id = 1').fetchone()
+        if row is None or row['expires'] <= time.time():
+            return None
+        return row['owner']
+
+    @contextmanager
+    def heartbeat(self, owner, seconds=None):
+        """
+        Renew the lease from a background thread while the block runs, so a
+        long ingest_products() or Supabase sync cannot outlive it. Yields an
+        Event that is set if another owner took the lease anyway.
+        """
+        seconds = settings.INGEST_LEASE_SECONDS if seconds is None else seconds
+        stop = threading.Event()
+        lost = threading.Event()
+
+        def renew():
+            while not stop.wait(seconds / 3):
+                try:
+                    if not self.acquire_lease(owner, seconds):
+                        logger.error(f"Ingest writer {owner} lost the writer lease to {self.lease_holder()}")
+                        lost.set()
+                        return
+                except sqlite3.Error as e:
+                    logger.warning(f"Could not renew the writer lease for {owner}: {str(e)}")
+
+        thread = threading.Thread(target=renew, name=f'lease-heartbeat-{owner}', daemon=True)
+        thread.start()
+        try:
+            yield lost
+        finally:
+            stop.set()
+            thread.join()
+
+    # Writer
+
+    def claim(self, owner, max_products, batch_ids=None):
+        """
+        Mark the oldest queued batches (of batch_ids, if given) as processing
+        by owner, up to max_products products (always at least one batch).
+        Only the lease holder calls this, so a batch still 'processing' under
+        another owner belongs to a writer that died or lost the lease.
+        """
+        now = time.time()
+        sql = (
+            "SELECT batch_id, products, product_count, invalid_count, failed_companies, sync_remote, "
+            "trace_ids, created_at FROM batches WHERE status = 'queued' AND available_at <= ?"
+        )
+        params = [now]
+        if batch_ids is not None:
+            sql += f" AND batch_id IN ({', '.join('?' * len(batch_ids))})"
+            params.extend(batch_ids)
+        with self._write() as conn:
+            conn.execute(
+                "UPDATE batches SET status = 'queued', owner = NULL "
+                "WHERE status = 'processing' AND (owner IS NULL OR owner != ?)", (owner,)
+            )
+            rows = conn.execute(sql + ' ORDER BY seq LIMIT 1000', params).fetchall()
+            claimed = []
+            total = 0
+            for row in rows:
+                if claimed and total + row['product_count'] > max_products:
+                    break
+                claimed.append(row)
+                total += row['product_count']
+            if claimed:
+                conn.execute(
+                    f"UPDATE batches SET status = 'processing', owner = ?, started_at = ?, attempts = attempts + 1 "
+                    f"WHERE batch_id IN ({', '.join('?' * len(claimed))})",
+                    [owner, now] + [row['batch_id'] for row in claimed]
+                )
+        return [
+            {
+                'batch_id': row['batch_id'],
+                'products': json.loads(row['products']),
+                'invalid_count': row['invalid_count'],
+                'failed_companies': json.loads(row['failed_companies'] or '[]'),
+                'sync_remote': bool(row['sync_remote']),
+                'trace_ids': json.loads(row['trace_ids'] or '[]'),
+                'queue_ms': (now - row['created_at']) * 1000,
+            }
+            for row in claimed
+        ]
+
+    def complete(self, owner, results):
+        """Mark owner's batches done; returns how many were still owner's."""
+        now = time.time()
+        with self._write() as conn:
+            return conn.executemany(
+                "UPDATE batches SET status = 'done', result = ?, error = NULL, products = NULL, finished_at = ? "
+                "WHERE batch_id = ? AND status = 'processing' AND owner = ?",
+                [(json.dumps(result), now, batch_id, owner) for batch_id, result in results.items()]
+            ).rowcount
+
+    def fail(self, owner, batch_ids, error):
+        """
+        Re-queue owner's batches after INGEST_RETRY_SECONDS times the
+        attempts so far, or give up after INGEST_MAX_ATTEMPTS.
+        """
+        now = time.time()
+        with self._write() as conn:
+            conn.executemany(
+                "UPDATE batches SET error = ?, finished_at = ?, available_at = ? + attempts * ?, owner = NULL, "
+                "status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'queued' END "
+                "WHERE batch_id = ? AND status = 'processing' AND owner = ?",
+                [(error, now, now, settings.INGEST_RETRY_SECONDS, settings.INGEST_MAX_ATTEMPTS, batch_id, owner)
+                 for batch_id in batch_ids]
+            )
+
+    def purge(self, older_than_seconds):
+        """Delete finished batches older than the retention window."""
+        with self._write() as conn:
+            return conn.execute(
+                "DELETE FROM batches WHERE status IN ('done', 'failed') AND finished_at < ?",
+                (time.time() - older_than_seconds,)
+            ).rowcount
+
+
+queue = IngestQueue(settings.INGEST_QUEUE_PATH)
+
+
+def _batch_result(batch, result, outcome):
+    counts = {'new_count': 0, 'changed_count': 0, 'unchanged_count': 0}
+    companies = {}
+    for product in batch['products']:
+        # Earlier duplicates within the group were superseded by a later
+        # copy of the same product; they count as unchanged
+        key = outcome.get(id(product), 'unchanged_count')
+        counts[key] += 1
+        company = companies.setdefault(
+            product['company_name'], {'new_count': 0, 'changed_count': 0, 'unchanged_count': 0}
+        )
+        company[key] += 1
+    batch_result = {
+        'processed_count': len(batch['products']),
+        **counts,
+        'invalid_count': batch['invalid_count'],
+        'companies': companies,
+    }
+    if batch['failed_companies']:
+        batch_result['failed_companies'] = batch['failed_companies']
+    if result.errors:
+        batch_result['supabase_errors'] = result.errors[:10]
+    return batch_result
+
+
+def write_batches(owner, batches):
+    """
+    Ingest batches claimed by owner with one ingest_products() call per
+    sync_remote setting and return {batch_id: result}. If a merged group
+    fails, its batches are retried one by one so a bad batch cannot block
+    the rest.
+    """
+    results = {}
+    for sync_remote in (True, False):
+        group = [batch for batch in batches if batch['sync_remote'] == sync_remote]
+        if not group:
+            continue
+        try:
+            results.update(_write_group(owner, group, sync_remote))
+        except Exception as e:
+            if len(group) == 1:
+                logger.exception(f"Ingest of batch {group[0]['batch_id']} failed")
+                queue.fail(owner, [group[0]['batch_id']], str(e))
+                metrics.incr('ingest_queue.failed')
+                continue
+            logger.warning(f"Ingest of {len(group)} merged batches failed ({str(e)}), retrying one by one")
+            for batch in group:
+                try:
+                    results.update(_write_group(owner, [batch], sync_remote))
+                except Exception as batch_error:
+                    logger.exception(f"Ingest of batch {batch['batch_id']} failed")
+                    queue.fail(owner, [batch['batch_id']], str(batch_error))
+                    metrics.incr('ingest_queue.failed')
+    return results
+
+
+def _write_group(owner, group, sync_remote):
+    products = [product for batch in group for product in batch['products']]
+    result = ingest_products(products, sync_remote=sync_remote)
+    # ingest_products keeps the product dicts it was given in its result
+    # lists, so each batch's counts come from object identity
+    outcome = {}
+    for key, written in (('new_count', result.new), ('changed_count', result.changed),
+                         ('unchanged_count', result.unchanged)):
+        for product in written:
+            outcome[id(product)] = key
+    results = {batch['batch_id']: _batch_result(batch, result, outcome) for batch in group}
+    if queue.complete(owner, results) < len(results):
+        # Re-queued after a lost lease; the next writer finds them unchanged
+        logger.warning(f"Ingest writer {owner} no longer owned some of {len(results)} written batches")
+    tracing.written(group, result.timings)
+    metrics.incr('ingest_queue.written_batches', len(group))
+    logger.info(f"Ingest writer: {len(group)} batches, {len(products)} products in one transaction")
+    return results
+
+
+def drain(owner, max_products=None, batch_ids=None):
+    """
+    Write queued batches (only batch_ids, if given) while holding the lease;
+    returns batches written.
+    """
+    max_products = max_products or settings.INGEST_WRITER_MAX_PRODUCTS
+    written = 0
+    with queue.heartbeat(owner) as lost:
+        while not lost.is_set() and queue.acquire_lease(owner):
+            batches = queue.claim(owner, max_products, batch_ids)
+            if not batches:
+                break
+            written += len(write_batches(owner, batches))
+    return written
+
+
+def drain_own(batch_ids):
+    """
+    Write the caller's own batches when no ingest worker holds the lease.
+    Batches of other callers are left to them or to the worker. While
+    another inline writer holds the lease, wait up to INLINE_WAIT_SECONDS
+    for it before leaving the batches queued.
+    """
+    owner = new_owner('inline')
+    deadline = time.monotonic() + INLINE_WAIT_SECONDS
+    written = 0
+    while queue.has_queued(batch_ids):
+        if queue.acquire_lease(owner):
+            try:
+                written += drain(owner, batch_ids=batch_ids)
+            finally:
+                queue.release_lease(owner)
+            break
+        holder = queue.lease_holder()
+        if (holder and not holder.startswith('inline:')) or time.monotonic() > deadline:
+            break
+        time.sleep(0.05)
+    return written
@@ -0,0 +1,79 @@
+import multiprocessing
+import os
+import tempfile
+import time
+
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand
+
+from api.cache import SQLiteCache
+
+
+def _incr_worker(path, key, count):
+    cache = SQLiteCache(path, {})
+    for _ in range(count):
+        cache.incr(key)
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the shared SQLite cache backend against LocMem'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ops', type=int, default=20000, help='Operations per benchmark')
+        parser.add_argument('--workers', type=int, default=4, help='Processes for the cross-process incr check')
+
+    def _time(self, ops, func):
+        start = time.perf_counter()
+        for i in range(ops):
+            func(i)
+        elapsed = time.perf_counter() - start
+        return ops / elapsed
+
+    def handle(self, *args, **options):
+        ops = options['ops']
+        workers = options['workers']
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'bench_cache.sqlite3')
+            backends = {
+                'locmem': LocMemCache('bench', {'OPTIONS': {'MAX_ENTRIES': ops * 2}}),
+                'sqlite': SQLiteCache(path, {'OPTIONS': {'MAX_ENTRIES': ops * 2}}),
+            }
+            payload = {'company_name': 'Apple', 'products': list(range(20))}
+
+            self.stdout.write(f"{'backend':<10}{'set/s':>12}{'get/s':>12}{'incr/s':>12}{'get_or_set/s':>14}")
+            for name, cache in backends.items():
+                cache.clear()
+                cache.set('counter', 0, None)
+                set_rate = self._time(ops, lambda i: cache.set(f'key:{i}', payload))
+                get_rate = self._time(ops, lambda i: cache.get(f'key:{i}'))
+                incr_rate = self._time(ops, lambda i: cache.incr('counter'))
+                gos_rate = self._time(ops, lambda i: cache.get_or_set(f'key:{i % 100}', payload, 300))
+                self.stdout.write(f"{name:<10}{set_rate:>12.0f}{get_rate:>12.0f}{incr_rate:>12.0f}{gos_rate:>14.0f}")
+
+            # LocMem counts separately in every process; the SQLite cache must
+            # end up with exactly workers * per_worker increments.
+            per_worker = max(ops // workers // 10, 1)
+            shared = backends['sqlite']
+            shared.set('shared_counter', 0, None)
+            start = time.perf_counter()
+            processes = [
+                multiprocessing.Process(target=_incr_worker, args=(path, 'shared_counter', per_worker))
+                for _ in range(workers)
+            ]
+            for process in processes:
+                process.start()
+            for process in processes:
+                process.join()
+            elapsed = time.perf_counter() - start
+
+            expected = workers * per_worker
+            actual = shared.get('shared_counter')
+            self.stdout.write(
+                f"Cross-process incr: {workers} workers x {per_worker} -> {actual} "
+                f"(expected {expected}) in {elapsed:.2f}s"
+            )
+            if actual == expected:
+                self.stdout.write(self.style.SUCCESS('Shared counter is consistent across processes'))
+            else:
+                self.stderr.write('Shared counter lost increments across processes')
@@ -0,0 +1,87 @@
+import bisect
+import math
+import statistics
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from api.analytics import compute_insights
+
+
+def python_insights(company, price, rating, reviews, n_companies):
+    """Per-row reference implementation used as the benchmark baseline."""
+    n = len(price)
+    sorted_prices = sorted(price)
+    by_company = {}
+    for code, value in zip(company, rating):
+        by_company.setdefault(code, []).append(value)
+    competitor_stats = {}
+    for code in range(n_companies):
+        others = [value for other, values in by_company.items() if other != code for value in values]
+        if others:
+            competitor_stats[code] = (statistics.fmean(others), statistics.pstdev(others))
+    prior_mean = statistics.fmean(rating)
+    prior_weight = statistics.median(reviews)
+
+    result = []
+    for i in range(n):
+        mean, std = competitor_stats.get(company[i], (math.nan, math.nan))
+        result.append((
+            bisect.bisect_right(sorted_prices, price[i]) * 100.0 / n,
+            (rating[i] - mean) / std if std else math.nan,
+            (reviews[i] * rating[i] + prior_weight * prior_mean) / (reviews[i] + prior_weight),
+            price[i] / rating[i] if rating[i] > 0 else math.nan,
+        ))
+    return result
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the vectorized competitive-positioning metrics'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=100000)
+        parser.add_argument('--companies', type=int, default=20)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--skip-python', action='store_true', help='Skip the per-row Python baseline')
+
+    def handle(self, *args, **options):
+        n = options['products']
+        n_companies = options['companies']
+        rng = np.random.default_rng(42)
+
+        company = rng.integers(0, n_companies, size=n).astype(np.int32)
+        price = np.round(rng.lognormal(mean=4.5, sigma=1.0, size=n), 2)
+        rating = np.round(np.clip(rng.normal(4.1, 0.5, size=n), 1, 5), 1)
+        reviews = np.floor(rng.pareto(1.2, size=n) * 50).astype(np.float64)
+
+        timings = []
+        for _ in range(options['repeat']):
+            start = time.perf_counter()
+            metrics = compute_insights(company, price, rating, reviews, n_companies)
+            timings.append(time.perf_counter() - start)
+        best = min(timings)
+        self.stdout.write(
+            f"NumPy: {n} products, {n_companies} companies -> best {best * 1000:.1f} ms "
+            f"({n / best:,.0f} products/s)"
+        )
+
+        if options['skip_python']:
+            return
+
+        lists = (company.tolist(), price.tolist(), rating.tolist(), reviews.tolist())
+        start = time.perf_counter()
+        reference = python_insights(*lists, n_companies)
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            f"Python loop: {elapsed * 1000:.1f} ms ({n / elapsed:,.0f} products/s), "
+            f"speedup {elapsed / best:.1f}x"
+        )
+
+        columns = ('price_percentile', 'rating_z', 'weighted_rating', 'price_per_rating_point')
+        for index, name in enumerate(columns):
+            expected = np.array([row[index] for row in reference])
+            if not np.allclose(metrics[name], expected, equal_nan=True, rtol=1e-6, atol=1e-6):
+                self.stderr.write(f"Mismatch in {name}")
+                return
+        self.stdout.write(self.style.SUCCESS('Vectorized results match the Python baseline'))
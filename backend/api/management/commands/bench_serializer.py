@@ -0,0 +1,69 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.models import Company, Product
+from api.serializers import ProductRowSerializer, ProductSerializer
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Benchmark product listing: ProductSerializer over model instances vs the values_list read path'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=50000, help='Products created for the run (rolled back)')
+        parser.add_argument('--companies', type=int, default=50)
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **options):
+        # Everything runs in one transaction that is rolled back, so the
+        # benchmark leaves the database untouched; the read replica router
+        # keeps reads on 'default' inside it
+        try:
+            with transaction.atomic():
+                self._run(options)
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def _run(self, options):
+        rng = random.Random(42)
+        companies = Company.objects.bulk_create(
+            [Company(name=f"Bench Company {i}") for i in range(options['companies'])]
+        )
+        Product.objects.bulk_create([
+            Product(
+                company=company, company_name=company.name, product_name=f"Product {i}",
+                price=round(rng.uniform(10, 2000), 2), rating=round(rng.uniform(2.5, 5), 1),
+                reviews=rng.randint(0, 20000), content_hash='bench'
+            )
+            for i, company in ((i, rng.choice(companies)) for i in range(options['rows']))
+        ], batch_size=1000)
+
+        reader = ProductRowSerializer()
+        paths = {
+            'ModelSerializer': lambda: ProductSerializer(Product.objects.order_by('-id'), many=True).data,
+            'values_list': lambda: reader.to_representation(Product.objects.order_by('-id').values_list(*reader.columns)),
+        }
+
+        outputs = {}
+        self.stdout.write(f"{'path':<18}{'best s':>10}{'rows/s':>12}")
+        for name, func in paths.items():
+            best = None
+            for _ in range(options['repeat']):
+                start = time.perf_counter()
+                outputs[name] = func()
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            self.stdout.write(f"{name:<18}{best:>10.3f}{len(outputs[name]) / best:>12.0f}")
+
+        expected = [dict(item) for item in outputs['ModelSerializer']]
+        if expected == outputs['values_list']:
+            self.stdout.write(self.style.SUCCESS(f"Outputs identical for {len(expected)} rows"))
+        else:
+            self.stderr.write('Outputs differ between the two paths')
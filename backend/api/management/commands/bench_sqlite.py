@@ -0,0 +1,155 @@
+import multiprocessing
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.db import pragma_statements
+
+SCHEMA = [
+    'CREATE TABLE products (id INTEGER PRIMARY KEY AUTOINCREMENT, company_id INTEGER, '
+    'company_name TEXT, product_name TEXT, price REAL, rating REAL, reviews INTEGER)',
+    'CREATE INDEX product_company_rank_idx ON products (company_id, rating DESC, reviews DESC, id)',
+]
+READ_SQL = (
+    'SELECT product_name, price, rating, reviews FROM products '
+    'WHERE company_id = ? ORDER BY rating DESC, reviews DESC, id LIMIT 1'
+)
+INSERT_SQL = (
+    'INSERT INTO products (company_id, company_name, product_name, price, rating, reviews) '
+    'VALUES (?, ?, ?, ?, ?, ?)'
+)
+
+# Before: Django's bare SQLite config (rollback journal, 5s timeout).
+# After: settings.SQLITE_PRAGMAS plus a query_only reader connection.
+PROFILES = {
+    'plain': (['PRAGMA journal_mode=DELETE'], []),
+    'production': (pragma_statements(), pragma_statements(read_only=True)),
+}
+
+
+def _connect(path, statements):
+    conn = sqlite3.connect(path, timeout=5, isolation_level=None, check_same_thread=False)
+    for statement in statements:
+        conn.execute(statement)
+    return conn
+
+
+def _rows(rng, companies, count):
+    for _ in range(count):
+        company = rng.randrange(companies)
+        yield (
+            company, f"Company {company}", f"Product {rng.random():.8f}",
+            round(rng.uniform(10, 2000), 2), round(rng.uniform(2.5, 5), 1), rng.randint(0, 20000)
+        )
+
+
+def _writer(path, statements, companies, batch, stop, written):
+    # Mimics scrape_callback: one transaction inserting a batch of products
+    # and touching existing rows of the same companies
+    rng = random.Random(1)
+    conn = _connect(path, statements)
+    while not stop.is_set():
+        conn.execute('BEGIN IMMEDIATE')
+        conn.executemany(INSERT_SQL, _rows(rng, companies, batch))
+        conn.execute(
+            'UPDATE products SET reviews = reviews + 1 WHERE company_id IN (?, ?, ?)',
+            [rng.randrange(companies) for _ in range(3)]
+        )
+        conn.execute('COMMIT')
+        with written.get_lock():
+            written.value += batch
+    conn.close()
+
+
+class Command(BaseCommand):
+    help = 'Benchmark SQLite read latency during bulk ingest, plain config vs the production profile'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--duration', type=float, default=10, help='Seconds per profile')
+        parser.add_argument('--readers', type=int, default=4, help='Reader threads')
+        parser.add_argument('--companies', type=int, default=500)
+        parser.add_argument('--rows', type=int, default=100000, help='Products loaded before the run')
+        parser.add_argument('--batch', type=int, default=5000, help='Products per write transaction')
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f"{options['readers']} readers against 1 ingest process writing {options['batch']} rows "
+            f"per transaction, {options['duration']:g}s per profile"
+        )
+        self.stdout.write(
+            f"{'profile':<12}{'reads/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'p99.9 ms':>10}{'max ms':>10}"
+            f"{'errors':>8}{'rows/s':>10}"
+        )
+        for name, (write_pragmas, read_pragmas) in PROFILES.items():
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, 'bench.sqlite3')
+                stats = self._run(path, write_pragmas, read_pragmas, options)
+            self.stdout.write(
+                f"{name:<12}{stats['reads_per_second']:>10.0f}{stats['p50']:>10.2f}{stats['p99']:>10.2f}"
+                f"{stats['p999']:>10.2f}{stats['max']:>10.2f}{stats['errors']:>8}{stats['rows_per_second']:>10.0f}"
+            )
+
+    def _run(self, path, write_pragmas, read_pragmas, options):
+        companies = options['companies']
+        conn = _connect(path, write_pragmas)
+        for statement in SCHEMA:
+            conn.execute(statement)
+        conn.execute('BEGIN')
+        conn.executemany(INSERT_SQL, _rows(random.Random(0), companies, options['rows']))
+        conn.execute('COMMIT')
+        conn.close()
+
+        stop = multiprocessing.Event()
+        written = multiprocessing.Value('q', 0)
+        writer = multiprocessing.Process(
+            target=_writer, args=(path, write_pragmas, companies, options['batch'], stop, written)
+        )
+        latencies = []
+        errors = [0]
+        lock = threading.Lock()
+        deadline = time.monotonic() + options['duration']
+
+        def reader(seed):
+            rng = random.Random(seed)
+            conn = _connect(path, read_pragmas)
+            local = []
+            failed = 0
+            while time.monotonic() < deadline:
+                start = time.perf_counter()
+                try:
+                    conn.execute(READ_SQL, (rng.randrange(companies),)).fetchall()
+                except sqlite3.OperationalError:
+                    failed += 1
+                    continue
+                local.append((time.perf_counter() - start) * 1000)
+            conn.close()
+            with lock:
+                latencies.extend(local)
+                errors[0] += failed
+
+        writer.start()
+        started = time.monotonic()
+        threads = [threading.Thread(target=reader, args=(i,)) for i in range(options['readers'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - started
+        stop.set()
+        writer.join()
+
+        latencies.sort()
+        return {
+            'reads_per_second': len(latencies) / elapsed,
+            'p50': latencies[len(latencies) // 2] if latencies else 0,
+            'p99': latencies[int(len(latencies) * 0.99)] if latencies else 0,
+            'p999': latencies[int(len(latencies) * 0.999)] if latencies else 0,
+            'max': latencies[-1] if latencies else 0,
+            'errors': errors[0],
+            'rows_per_second': written.value / elapsed,
+        }
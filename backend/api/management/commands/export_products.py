@@ -0,0 +1,66 @@
+import csv
+import io
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.catalog_io import EXPORT_FIELDS, Progress, detect_format, is_gzip, open_binary
+from api.companies import resolve_many
+from api.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Stream Product rows to an NDJSON or CSV file (optionally gzip-compressed)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Output file, or '-' for stdout")
+        parser.add_argument('--format', choices=['ndjson', 'csv'], help='Defaults to the file extension')
+        parser.add_argument('--gzip', action='store_true', default=None, help='Compress output (default for .gz paths)')
+        parser.add_argument('--company', action='append', dest='companies', help='Only export this company (repeatable)')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Rows fetched per database round trip')
+        parser.add_argument('--progress-every', type=int, default=100000, help='Rows between progress reports')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        try:
+            fmt = detect_format(path, options['format'] or ('ndjson' if path == '-' else None))
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        queryset = Product.objects.order_by('id')
+        if options['companies']:
+            # Match aliases and other spellings through the company they resolve to
+            resolved = resolve_many(options['companies'])
+            for name, match in resolved.items():
+                if match is None:
+                    self.stderr.write(f"Unknown company '{name}', skipping")
+            queryset = queryset.filter(company_id__in={match[0] for match in resolved.values() if match})
+        rows = queryset.values_list(*EXPORT_FIELDS).iterator(chunk_size=options['chunk_size'])
+
+        progress = Progress(self.stderr.write, options['progress_every'], 'Exported')
+        count = 0
+        with open_binary(path, 'wb', is_gzip(path, options['gzip'])) as binary:
+            out = io.TextIOWrapper(binary, encoding='utf-8', newline='')
+            if fmt == 'csv':
+                writer = csv.writer(out)
+                writer.writerow(EXPORT_FIELDS)
+                for row in rows:
+                    writer.writerow(row)
+                    count += 1
+                    progress.update(count)
+            else:
+                for company_name, product_name, price, rating, reviews in rows:
+                    out.write(json.dumps({
+                        'company_name': company_name,
+                        'product_name': product_name,
+                        'price': str(price),
+                        'rating': str(rating),
+                        'reviews': reviews
+                    }) + '\n')
+                    count += 1
+                    progress.update(count)
+            out.flush()
+            out.detach()
+
+        progress.report()
+        self.stderr.write(self.style.SUCCESS(f"Exported {count} products to {path}"))
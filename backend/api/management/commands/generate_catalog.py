@@ -0,0 +1,207 @@
+import json
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from api import best_products, snapshot
+from api.catalog_io import Progress, open_binary
+from api.companies import invalidate, resolve_many
+from api.ingest_queue import new_owner, queue
+from api.models import Company, Product, product_content_hash
+from api.synthetic import SyntheticCatalog, make_product
+
+
+class Command(BaseCommand):
+    help = 'Generate a large synthetic catalog into the local DB, Supabase and/or Make.com callback payload files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--companies', type=int, default=1000)
+        parser.add_argument('--products', type=int, default=100000, help='Total products across all companies')
+        parser.add_argument('--skew', type=float, default=1.1, help='Zipf exponent of products per company')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--local', action='store_true', help='Insert into the local Product table')
+        parser.add_argument('--replace', action='store_true',
+                            help='Delete the local products of the generated companies first')
+        parser.add_argument('--supabase', action='store_true',
+                            help='Insert into Supabase at SUPABASE_URL (e.g. the standins command)')
+        parser.add_argument('--payloads', metavar='DIR', help='Write Make.com-style callback payload files here')
+        parser.add_argument('--payload-companies', type=int, default=1,
+                            help='Companies per payload file; above 1 uses the batched {"results": [...]} form')
+        parser.add_argument('--payload-format', choices=['json', 'ndjson'], default='json',
+                            help='ndjson payloads replay through the streaming callback')
+        parser.add_argument('--gzip', action='store_true', help='Compress payload files')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows per local transaction or Supabase insert')
+        parser.add_argument('--progress-every', type=int, default=100000, help='Rows between progress reports')
+
+    def handle(self, *args, **options):
+        if not (options['local'] or options['supabase'] or options['payloads']):
+            raise CommandError('Choose at least one of --local, --supabase and --payloads')
+        try:
+            catalog = SyntheticCatalog(options['companies'], options['products'], options['skew'], options['seed'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        self.batch_size = options['batch_size']
+        self.now = timezone.now()
+        progress = Progress(self.stderr.write, options['progress_every'], 'Generated')
+
+        if options['payloads']:
+            os.makedirs(options['payloads'], exist_ok=True)
+        if options['local']:
+            # Bulk inserts bypass the ingest queue, so hold the writer lease
+            # to keep the ingest worker and inline drains out meanwhile
+            owner = new_owner('generate_catalog')
+            if not queue.acquire_lease(owner):
+                raise CommandError(f"The ingest writer lease is held by {queue.lease_holder()}; stop it first")
+            try:
+                with queue.heartbeat(owner) as self.lost:
+                    self.companies = self._create_companies(catalog.names)
+                    self._clear_existing(options['replace'])
+                    rows, files = self._generate(catalog, options, progress)
+                    self.stderr.write('Recomputing best products')
+                    company_ids = sorted({company_id for company_id, _ in self.companies.values()})
+                    for start in range(0, len(company_ids), 500):
+                        best_products.recompute(company_ids[start:start + 500])
+                    snapshot.changed()
+            finally:
+                queue.release_lease(owner)
+        else:
+            rows, files = self._generate(catalog, options, progress)
+
+        progress.rows = rows
+        progress.report()
+        counts = sorted(catalog.counts.tolist(), reverse=True)
+        self.stderr.write(self.style.SUCCESS(
+            f"Generated {rows} products for {len(catalog)} companies "
+            f"(largest {counts[0]}, median {counts[len(counts) // 2]}, smallest {counts[-1]})"
+            + (f", {files} payload files in {options['payloads']}" if options['payloads'] else '')
+        ))
+
+    def _generate(self, catalog, options, progress):
+        """Write every company's products to the chosen targets; returns (rows, payload files)."""
+        local_rows = []
+        remote_rows = []
+        group = []
+        files = 0
+        rows = 0
+        for index in range(len(catalog)):
+            products = catalog.products(index)
+            rows += len(products)
+            if options['local']:
+                local_rows.extend(products)
+                if len(local_rows) >= self.batch_size:
+                    self._insert_local(local_rows)
+            if options['supabase']:
+                remote_rows.extend(products)
+                if len(remote_rows) >= self.batch_size:
+                    self._insert_supabase(remote_rows)
+            if options['payloads']:
+                group.append(products)
+                if len(group) >= options['payload_companies']:
+                    files += 1
+                    self._write_payload(options, files, group)
+            progress.update(rows)
+        if local_rows:
+            self._insert_local(local_rows)
+        if remote_rows:
+            self._insert_supabase(remote_rows)
+        if group:
+            files += 1
+            self._write_payload(options, files, group)
+        return rows, files
+
+    def _clear_existing(self, replace):
+        """
+        Product rows have no unique key, so a second --local run would
+        duplicate the catalog: refuse, or delete the old rows with --replace.
+        """
+        company_ids = sorted({company_id for company_id, _ in self.companies.values()})
+        existing = 0
+        for start in range(0, len(company_ids), 500):
+            existing += Product.objects.filter(company_id__in=company_ids[start:start + 500]).count()
+        if not existing:
+            return
+        if not replace:
+            raise CommandError(
+                f"The generated companies already have {existing} local products; "
+                "pass --replace to delete them first"
+            )
+        self.stderr.write(f"Deleting {existing} existing products of the generated companies")
+        with transaction.atomic():
+            for start in range(0, len(company_ids), 500):
+                Product.objects.filter(company_id__in=company_ids[start:start + 500]).delete()
+
+    def _create_companies(self, names):
+        """
+        (company id, canonical name) per generated name, creating the
+        missing companies in bulk.
+        """
+        companies = {name: match for name, match in resolve_many(names).items() if match}
+        missing = [name for name in names if name not in companies]
+        with transaction.atomic():
+            Company.objects.bulk_create(
+                [Company(name=name, last_scraped_at=self.now) for name in missing], batch_size=500,
+                ignore_conflicts=True
+            )
+            for start in range(0, len(missing), 500):
+                for company_id, name in Company.objects.filter(name__in=missing[start:start + 500]).values_list(
+                    'id', 'name'
+                ):
+                    companies[name] = (company_id, name)
+        if missing:
+            invalidate()
+        return companies
+
+    def _insert_local(self, rows):
+        """Insert rows with one executemany per transaction, as in ingest._update_rows."""
+        if self.lost.is_set():
+            raise CommandError(f"Lost the ingest writer lease to {queue.lease_holder()}; stopping")
+        ops = connection.ops
+        price_field = Product._meta.get_field('price')
+        rating_field = Product._meta.get_field('rating')
+        now = ops.adapt_datetimefield_value(self.now)
+        sql = (
+            f"INSERT INTO {ops.quote_name(Product._meta.db_table)} (company_id, company_name, product_name, "
+            "price, rating, reviews, content_hash, synced_hash, created_at, updated_at) "
+            "VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)"
+        )
+        params = [
+            (
+                *self.companies[company], name,
+                ops.adapt_decimalfield_value(price_field.to_python(price), price_field.max_digits, price_field.decimal_places),
+                ops.adapt_decimalfield_value(rating_field.to_python(rating), rating_field.max_digits, rating_field.decimal_places),
+                reviews, product_content_hash(price, rating, reviews), '', now, now
+            )
+            for company, name, price, rating, reviews in rows
+        ]
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.executemany(sql, params)
+        rows.clear()
+
+    def _insert_supabase(self, rows):
+        from api.supabase_client import supabase
+
+        data = [
+            {'company_name': company, 'product_name': name, 'price': price, 'rating': rating, 'reviews': str(reviews)}
+            for company, name, price, rating, reviews in rows
+        ]
+        supabase.execute(supabase.table('products').insert(data, returning='minimal'))
+        rows.clear()
+
+    def _write_payload(self, options, number, group):
+        """One callback body, shaped like MakeStandIn.deliver() posts it."""
+        extension = options['payload_format'] + ('.gz' if options['gzip'] else '')
+        path = os.path.join(options['payloads'], f"payload-{number:06d}.{extension}")
+        with open_binary(path, 'wb', options['gzip']) as output:
+            if options['payload_format'] == 'ndjson':
+                for products in group:
+                    output.write(''.join(json.dumps(make_product(row)) + '\n' for row in products).encode())
+            elif options['payload_companies'] > 1:
+                output.write(json.dumps({'results': [
+                    {'companyName': products[0][0], 'products': [make_product(row) for row in products]}
+                    for products in group
+                ]}).encode())
+            else:
+                output.write(json.dumps([make_product(row) for row in group[0]]).encode())
+        group.clear()
@@ -0,0 +1,124 @@
+import csv
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.catalog_io import EXPORT_FIELDS, Progress, detect_format, is_gzip, open_binary
+from api.ingest import InvalidProduct, ingest_products, normalize_product
+from api.ingest_queue import new_owner, queue
+
+
+class Command(BaseCommand):
+    help = 'Upsert Product rows from an NDJSON or CSV file (optionally gzip-compressed) in chunks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Input file, or '-' for stdin")
+        parser.add_argument('--format', choices=['ndjson', 'csv'], help='Defaults to the file extension')
+        parser.add_argument('--gzip', action='store_true', default=None, help='Input is compressed (default for .gz paths)')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Rows written per transaction')
+        parser.add_argument('--offset', type=int, default=0,
+                            help='Resume from this uncompressed byte offset (as printed in progress reports)')
+        parser.add_argument('--skip-rows', type=int, default=0, help='Skip this many data rows before importing')
+        parser.add_argument('--sync-supabase', action='store_true', help='Also upsert changed rows into Supabase')
+        parser.add_argument('--progress-every', type=int, default=100000, help='Rows between progress reports')
+
+    def _lines(self, binary, offset):
+        """Yield decoded lines, keeping self.position at the end of the last one."""
+        self.position = 0
+        if offset:
+            # Skip in bounded reads so gzip input also resumes in constant memory
+            remaining = offset
+            while remaining:
+                data = binary.read(min(remaining, 1024 * 1024))
+                if not data:
+                    raise CommandError(f"Offset {offset} is past the end of the file")
+                remaining -= len(data)
+            self.position = offset
+        for line in binary:
+            self.position += len(line)
+            yield line.decode('utf-8')
+
+    def _records(self, binary, fmt, offset):
+        if fmt == 'csv':
+            header_line = binary.readline()
+            fields = next(csv.reader([header_line.decode('utf-8')]), None)
+            if not fields or not set(EXPORT_FIELDS) <= set(fields):
+                raise CommandError(f"CSV header must include {', '.join(EXPORT_FIELDS)}")
+            # Offsets printed during a CSV import already include the header
+            lines = self._lines(binary, max(offset - len(header_line), 0))
+            self.base = len(header_line)
+            for values in csv.reader(lines):
+                yield dict(zip(fields, values))
+        else:
+            self.base = 0
+            for line in self._lines(binary, offset):
+                if line.strip():
+                    try:
+                        yield json.loads(line)
+                    except ValueError as e:
+                        self.stderr.write(f"Skipping invalid JSON at offset {self.base + self.position}: {str(e)}")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        try:
+            fmt = detect_format(path, options['format'] or ('ndjson' if path == '-' else None))
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        chunk_size = options['chunk_size']
+        skip_rows = options['skip_rows']
+        sync_remote = options['sync_supabase']
+        progress = Progress(self.stderr.write, options['progress_every'], 'Imported')
+        totals = {'new_count': 0, 'changed_count': 0, 'unchanged_count': 0}
+        invalid = 0
+        rows = 0
+        chunk = []
+
+        def flush():
+            if not chunk:
+                return
+            if lost.is_set():
+                raise CommandError(
+                    f"Lost the ingest writer lease to {queue.lease_holder()}; resume with "
+                    f"--offset {self.committed} once it is free"
+                )
+            result = ingest_products(chunk, sync_remote=sync_remote)
+            for key, value in result.counts().items():
+                totals[key] += value
+            chunk.clear()
+
+        # Rows are written here rather than through the ingest queue, so hold
+        # the writer lease to keep the ingest worker and inline drains out
+        owner = new_owner('import_products')
+        if not queue.acquire_lease(owner):
+            raise CommandError(f"The ingest writer lease is held by {queue.lease_holder()}; stop it first")
+        self.committed = options['offset']
+        try:
+            with queue.heartbeat(owner) as lost, \
+                    open_binary(path, 'rb', is_gzip(path, options['gzip'])) as binary:
+                for record in self._records(binary, fmt, options['offset']):
+                    if skip_rows:
+                        skip_rows -= 1
+                        continue
+                    rows += 1
+                    try:
+                        chunk.append(normalize_product(record))
+                    except InvalidProduct as e:
+                        invalid += 1
+                        self.stderr.write(f"Skipping row {rows}: {str(e)}")
+                    if len(chunk) >= chunk_size:
+                        flush()
+                        # Only report resumable offsets at chunk boundaries, where
+                        # everything before them has been committed.
+                        self.committed = self.base + self.position
+                        progress.update(rows, self.committed)
+                flush()
+        finally:
+            queue.release_lease(owner)
+
+        progress.rows = rows
+        progress.report(self.base + self.position)
+        self.stderr.write(self.style.SUCCESS(
+            f"Imported {rows} rows from {path}: {totals['new_count']} new, "
+            f"{totals['changed_count']} changed, {totals['unchanged_count']} unchanged, {invalid} invalid"
+        ))
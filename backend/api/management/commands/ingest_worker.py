@@ -0,0 +1,54 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api import tracing
+from api.ingest_queue import drain, new_owner, queue
+
+
+class Command(BaseCommand):
+    help = 'Run the single ingest writer: drain queued product batches, many per transaction'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Drain what is queued now and exit')
+        parser.add_argument('--poll', type=float, default=0.5, help='Seconds between polls of an empty queue')
+        parser.add_argument('--max-products', type=int, default=None,
+                            help='Products merged per transaction (default INGEST_WRITER_MAX_PRODUCTS)')
+
+    def handle(self, *args, **options):
+        owner = new_owner()
+        retention = settings.INGEST_RETENTION_HOURS * 3600
+        last_purge = 0
+        waiting = False
+        self.stdout.write(f"Ingest writer {owner} watching {settings.INGEST_QUEUE_PATH}")
+        try:
+            while True:
+                # Renew the lease even when idle, so requests keep enqueueing
+                # instead of draining inline
+                if not queue.acquire_lease(owner):
+                    if not waiting:
+                        self.stdout.write(f"Waiting for the writer lease held by {queue.lease_holder()}")
+                        waiting = True
+                    time.sleep(options['poll'])
+                    continue
+                waiting = False
+
+                written = drain(owner, options['max_products'])
+                if written:
+                    self.stdout.write(f"Wrote {written} batches")
+                if time.time() - last_purge > 3600:
+                    purged = queue.purge(retention)
+                    if purged:
+                        self.stdout.write(f"Purged {purged} finished batches")
+                    purged = tracing.purge(settings.SCRAPE_TRACE_RETENTION_DAYS)
+                    if purged:
+                        self.stdout.write(f"Purged {purged} scrape traces")
+                    last_purge = time.time()
+                if options['once']:
+                    break
+                time.sleep(options['poll'])
+        except KeyboardInterrupt:
+            pass
+        finally:
+            queue.release_lease(owner)
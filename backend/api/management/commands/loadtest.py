@@ -0,0 +1,260 @@
+import json
+import os
+import random
+import threading
+import time
+from datetime import datetime
+
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api.standins import generate_products
+
+DEFAULT_MIX = 'compare=60,fetch=25,scrape=5,callback=10'
+
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in REQUESTS:
+            raise CommandError(f"Unknown endpoint '{name}' in --mix (choose from {', '.join(REQUESTS)})")
+        try:
+            mix[name] = float(weight or 1)
+        except ValueError:
+            raise CommandError(f"Invalid weight for '{name}' in --mix")
+    if not any(mix.values()):
+        raise CommandError('--mix needs at least one positive weight')
+    return mix
+
+
+def _compare(companies, rng, options):
+    picked = rng.sample(companies, min(len(companies), rng.randint(2, 3)))
+    return 'GET', '/api/compare/', {'params': {'companies': ','.join(picked)}}
+
+
+def _fetch(companies, rng, options):
+    return 'GET', '/api/products/', {}
+
+
+def _scrape(companies, rng, options):
+    return 'POST', '/api/scrape/', {'json': {'companies': [rng.choice(companies)]}}
+
+
+def _callback(companies, rng, options):
+    products = generate_products(rng.choice(companies), options['products_per_callback'], rng)
+    return 'POST', '/api/webhook/scrape-callback/', {'json': products}
+
+
+REQUESTS = {
+    'compare': _compare,
+    'fetch': _fetch,
+    'scrape': _scrape,
+    'callback': _callback,
+}
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = min(int(round(pct / 100 * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+def summarize(samples, seconds):
+    """Per-endpoint throughput, error rates and latency percentiles (ms)."""
+    by_endpoint = {}
+    for sample in samples:
+        by_endpoint.setdefault(sample['endpoint'], []).append(sample)
+
+    summary = {}
+    for endpoint, items in sorted(by_endpoint.items()):
+        latencies = sorted(item['latency_ms'] for item in items)
+        errors = sum(1 for item in items if item['status'] is None or item['status'] >= 500)
+        throttled = sum(1 for item in items if item['status'] == 429)
+        client_errors = sum(
+            1 for item in items if item['status'] is not None and 400 <= item['status'] < 500 and item['status'] != 429
+        )
+        summary[endpoint] = {
+            'requests': len(items),
+            'rps': round(len(items) / seconds, 2) if seconds else None,
+            'error_rate': round(errors / len(items), 4),
+            'throttled_rate': round(throttled / len(items), 4),
+            'client_error_rate': round(client_errors / len(items), 4),
+            'p50_ms': round(percentile(latencies, 50), 1),
+            'p90_ms': round(percentile(latencies, 90), 1),
+            'p99_ms': round(percentile(latencies, 99), 1),
+            'max_ms': round(latencies[-1], 1),
+        }
+    return summary
+
+
+class Command(BaseCommand):
+    help = 'Drive a mix of API traffic at a target rate and report latency per endpoint'
+
+    def add_arguments(self, parser):
+        parser.add_argument('base_url', nargs='?', default='http://127.0.0.1:8000')
+        parser.add_argument('--rate', type=float, default=20, help='Target requests per second across all workers')
+        parser.add_argument('--duration', type=float, default=60, help='Seconds to generate load')
+        parser.add_argument('--concurrency', type=int, default=16, help='Worker threads')
+        parser.add_argument('--mix', default=DEFAULT_MIX, help=f"Endpoint weights (default {DEFAULT_MIX})")
+        parser.add_argument('--companies', type=int, default=50, help="Size of the 'Company N' name pool")
+        parser.add_argument('--products-per-callback', type=int, default=20)
+        parser.add_argument('--interval', type=float, default=5, help='Seconds per reporting window')
+        parser.add_argument('--timeout', type=float, default=30, help='Per-request timeout in seconds')
+        parser.add_argument('--seed', type=int, default=None, help='Random seed for a repeatable request sequence')
+        parser.add_argument('--output', help='Results file (default LOG_DIR/loadtests/loadtest-<time>.json)')
+        parser.add_argument('--baseline', help='Earlier results file to compare the summary against')
+
+    def handle(self, *args, **options):
+        mix = parse_mix(options['mix'])
+        if options['rate'] <= 0 or options['duration'] <= 0:
+            raise CommandError('--rate and --duration must be positive')
+        base_url = options['base_url'].rstrip('/')
+        rate = options['rate']
+        concurrency = max(options['concurrency'], 1)
+        duration = options['duration']
+        companies = [f"Company {i}" for i in range(max(options['companies'], 3))]
+        endpoints = list(mix)
+        weights = [mix[name] for name in endpoints]
+        total = int(rate * duration)
+
+        samples = []
+        lock = threading.Lock()
+        started = time.monotonic() + 0.5
+
+        def worker(index):
+            rng = random.Random(None if options['seed'] is None else options['seed'] + index)
+            session = requests.Session()
+            # Request i is due at started + i / rate; latency is measured from
+            # that time, so a saturated server shows up as queueing delay
+            # instead of silently lowering the offered rate.
+            for i in range(index, total, concurrency):
+                due = started + i / rate
+                delay = due - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                endpoint = rng.choices(endpoints, weights)[0]
+                method, path, kwargs = REQUESTS[endpoint](companies, rng, options)
+                status = None
+                error = None
+                try:
+                    response = session.request(method, base_url + path, timeout=options['timeout'], **kwargs)
+                    status = response.status_code
+                except requests.exceptions.RequestException as e:
+                    error = type(e).__name__
+                finished = time.monotonic()
+                with lock:
+                    samples.append({
+                        'endpoint': endpoint,
+                        'offset': due - started,
+                        'latency_ms': (finished - due) * 1000,
+                        'status': status,
+                        'error': error,
+                    })
+
+        self.stdout.write(
+            f"Load testing {base_url}: {rate:g} req/s for {duration:g}s, "
+            f"{concurrency} workers, mix {mix}"
+        )
+        threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(concurrency)]
+        for thread in threads:
+            thread.start()
+
+        # Live report: requests completed during each interval
+        interval = options['interval']
+        printed = 0
+        window_start = 0.0
+        while any(thread.is_alive() for thread in threads):
+            time.sleep(interval)
+            with lock:
+                window = samples[printed:]
+                printed = len(samples)
+            if window:
+                self._print_window(window_start, summarize(window, interval))
+            window_start += interval
+        for thread in threads:
+            thread.join()
+
+        # Stored windows group requests by when they were due, so runs line
+        # up on the same time axis
+        windows = []
+        for index in range(int(duration // interval) + 1):
+            window = [s for s in samples if index * interval <= s['offset'] < (index + 1) * interval]
+            if window:
+                windows.append({'start': index * interval, 'endpoints': summarize(window, interval)})
+
+        summary = summarize(samples, duration)
+        self.stdout.write('\nSummary')
+        self._print_table(summary)
+
+        results = {
+            'base_url': base_url,
+            'started_at': datetime.now().isoformat(),
+            'config': {
+                'rate': rate,
+                'duration': duration,
+                'concurrency': concurrency,
+                'mix': mix,
+                'companies': len(companies),
+                'products_per_callback': options['products_per_callback'],
+                'interval': interval,
+                'seed': options['seed'],
+            },
+            'windows': windows,
+            'summary': summary,
+        }
+        output = options['output'] or os.path.join(
+            settings.LOG_DIR, 'loadtests', f"loadtest-{datetime.now():%Y%m%d-%H%M%S}.json"
+        )
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        with open(output, 'w') as f:
+            json.dump(results, f, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Results written to {output}"))
+
+        if options['baseline']:
+            self._compare(options['baseline'], summary)
+
+    def _print_window(self, start, endpoints):
+        self.stdout.write(f"\n[{start:>6.0f}s]")
+        self._print_table(endpoints)
+
+    def _print_table(self, endpoints):
+        self.stdout.write(
+            f"  {'endpoint':<10}{'reqs':>7}{'rps':>8}{'err%':>7}{'429%':>7}"
+            f"{'p50':>9}{'p90':>9}{'p99':>9}{'max':>9}"
+        )
+        for name, stats in endpoints.items():
+            self.stdout.write(
+                f"  {name:<10}{stats['requests']:>7}{stats['rps']:>8.1f}"
+                f"{stats['error_rate'] * 100:>7.1f}{stats['throttled_rate'] * 100:>7.1f}"
+                f"{stats['p50_ms']:>9.1f}{stats['p90_ms']:>9.1f}{stats['p99_ms']:>9.1f}{stats['max_ms']:>9.1f}"
+            )
+
+    def _compare(self, path, summary):
+        try:
+            with open(path) as f:
+                baseline = json.load(f)['summary']
+        except (OSError, ValueError, KeyError) as e:
+            raise CommandError(f"Cannot read baseline {path}: {str(e)}")
+
+        self.stdout.write(f"\nChange against {path}")
+        self.stdout.write(f"  {'endpoint':<10}{'rps':>10}{'err%':>10}{'p50':>10}{'p99':>10}")
+        for name, stats in summary.items():
+            before = baseline.get(name)
+            if not before:
+                self.stdout.write(f"  {name:<10}{'(new)':>10}")
+                continue
+
+            def change(key):
+                if not before[key]:
+                    return 'n/a'
+                return f"{(stats[key] - before[key]) / before[key] * 100:+.0f}%"
+
+            self.stdout.write(
+                f"  {name:<10}{change('rps'):>10}"
+                f"{(stats['error_rate'] - before['error_rate']) * 100:>+9.1f}p"
+                f"{change('p50_ms'):>10}{change('p99_ms'):>10}"
+            )
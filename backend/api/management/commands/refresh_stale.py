@@ -0,0 +1,62 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.freshness import clear_pending, mark_pending, refresh_candidates
+from api.scraping import dispatch_scrape, remaining_budget
+
+
+class Command(BaseCommand):
+    help = 'Rescrape the most requested stale companies within the hourly Make.com budget'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-hits', type=int, default=1, help='Requests in the popularity window needed to refresh')
+        parser.add_argument('--limit', type=int, help='Refresh at most this many companies per pass')
+        parser.add_argument('--dry-run', action='store_true', help='Only list the companies that would be refreshed')
+        parser.add_argument('--loop', action='store_true', help='Keep running, one pass every --interval seconds')
+        parser.add_argument('--interval', type=int, default=300, help='Seconds between passes with --loop')
+
+    def handle(self, *args, **options):
+        while True:
+            self.refresh(options)
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+    def refresh(self, options):
+        candidates = refresh_candidates(options['min_hits'])
+        calls = remaining_budget()
+        # Each Make.com call scrapes up to MAKE_BATCH_SIZE companies
+        budget = calls * max(settings.MAKE_BATCH_SIZE, 1)
+        if options['limit'] is not None:
+            budget = min(budget, options['limit'])
+
+        self.stdout.write(
+            f"{len(candidates)} stale companies requested recently, "
+            f"budget for {calls} Make.com calls ({budget} companies) this hour"
+        )
+        if options['dry_run']:
+            for company_id, name, hits, scraped_at in candidates[:budget]:
+                self.stdout.write(f"  would refresh {name}: {hits} hits, last scraped {scraped_at or 'never'}")
+            return
+
+        selected = []
+        for company_id, name, hits, scraped_at in candidates:
+            if len(selected) >= budget:
+                break
+            # Another pass or worker may have claimed it since we listed it
+            if mark_pending(company_id):
+                selected.append((company_id, name))
+                self.stdout.write(f"  refreshing {name}: {hits} hits, last scraped {scraped_at or 'never'}")
+
+        if not selected:
+            return
+        ids = {name: company_id for company_id, name in selected}
+        successful, failed, _ = dispatch_scrape(list(ids), settings.SCRAPE_CALLBACK_URL)
+        # Let failed companies be retried on the next pass
+        clear_pending([ids[entry['company']] for entry in failed])
+
+        self.stdout.write(self.style.SUCCESS(f"Queued {len(successful)} refreshes"))
+        for entry in failed:
+            self.stdout.write(self.style.ERROR(f"  failed {entry['company']}: {entry['error']}"))
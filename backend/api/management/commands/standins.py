@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.standins import MakeStandIn, SupabaseStandIn, generate_products
+
+
+class Command(BaseCommand):
+    help = 'Serve local Make.com and Supabase stand-ins for load tests'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--make-port', type=int, default=8701)
+        parser.add_argument('--supabase-port', type=int, default=8702)
+        parser.add_argument('--callback-url', default='http://127.0.0.1:8000/api/webhook/scrape-callback/',
+                            help="Where the Make stand-in posts scraped products ('' to disable)")
+        parser.add_argument('--callback-delay', type=float, default=2.0, help='Seconds before posting results back')
+        parser.add_argument('--products-per-company', type=int, default=20)
+        parser.add_argument('--supabase-latency', type=float, default=0.0, help='Seconds added to every Supabase call')
+        parser.add_argument('--seed-companies', type=int, default=0, help='Preload products for this many companies')
+
+    def handle(self, *args, **options):
+        make = MakeStandIn(
+            options['host'], options['make_port'],
+            callback_url=options['callback_url'] or None,
+            callback_delay=options['callback_delay'],
+            products_per_company=options['products_per_company']
+        ).start()
+        supabase = SupabaseStandIn(options['host'], options['supabase_port'], options['supabase_latency']).start()
+        for i in range(options['seed_companies']):
+            supabase.seed(generate_products(f"Company {i}", options['products_per_company']))
+
+        self.stdout.write("Stand-ins running; start the backend with:")
+        self.stdout.write(f"  MAKE_WEBHOOK_URL={make.webhook_url}")
+        self.stdout.write(f"  SUPABASE_URL={supabase.url}")
+        try:
+            while True:
+                time.sleep(10)
+                self.stdout.write(f"Make.com calls: {make.calls} ({make.companies} companies)")
+        except KeyboardInterrupt:
+            make.stop()
+            supabase.stop()
@@ -1,52 +1,56 @@
-from django.core.management.base import BaseCommand
-from api.models import Product
 from django.conf import settings
-from supabase import create_client, Client
+from django.core.management.base import BaseCommand
+
+from api.ingest import InvalidProduct, normalize_product
+from api.ingest_queue import drain_own, queue
+from api.supabase_client import supabase
 
 class Command(BaseCommand):
     help = 'Sync products from Supabase to local database'
 
-    def handle(self, *args, **options):
-        # Initialize Supabase client
-        supabase: Client = create_client(
-            supabase_url=settings.SUPABASE_URL,
-            supabase_key=settings.SUPABASE_KEY
-        )
+    def add_arguments(self, parser):
+        parser.add_argument('--no-wait', action='store_true',
+                            help='Only enqueue the batches and leave them to the ingest worker')
 
+    def handle(self, *args, **options):
         # Get all products from Supabase
-        result = supabase.table('products').select('*').execute()
+        result = supabase.execute(supabase.table('products').select('*'), read=True)
         products = result.data
 
         self.stdout.write(f"Found {len(products)} products in Supabase")
 
-        # Import each product
+        # Validate each product, then hand them to the single ingest writer in
+        # INGEST_WRITER_MAX_PRODUCTS batches; they came from Supabase, so they
+        # are not written back to it and their rows start out synced
+        valid = []
         for product in products:
             try:
-                # Check if product exists
-                existing = Product.objects.filter(
-                    company_name=product['company_name'],
-                    product_name=product['product_name']
-                ).first()
-
-                if existing:
-                    # Update existing product
-                    existing.price = float(product['price'])
-                    existing.rating = float(product['rating'])
-                    existing.reviews = int(str(product['reviews']).replace(',', ''))
-                    existing.save()
-                    self.stdout.write(f"Updated: {product['company_name']} - {product['product_name']}")
-                else:
-                    # Create new product
-                    Product.objects.create(
-                        company_name=product['company_name'],
-                        product_name=product['product_name'],
-                        price=float(product['price']),
-                        rating=float(product['rating']),
-                        reviews=int(str(product['reviews']).replace(',', ''))
-                    )
-                    self.stdout.write(f"Created: {product['company_name']} - {product['product_name']}")
-
-            except Exception as e:
+                valid.append({**normalize_product(product), 'remote_synced': True})
+            except InvalidProduct as e:
                 self.stderr.write(f"Error with product {product}: {str(e)}")
 
-        self.stdout.write(self.style.SUCCESS(f"Successfully synced {len(products)} products from Supabase"))
+        size = settings.INGEST_WRITER_MAX_PRODUCTS
+        batch_ids = [
+            queue.enqueue(valid[start:start + size], 'supabase_sync', sync_remote=False)
+            for start in range(0, len(valid), size)
+        ]
+        self.stdout.write(f"Queued {len(valid)} products in {len(batch_ids)} ingest batches")
+        if options['no_wait']:
+            return
+
+        drain_own(batch_ids)
+        statuses = [queue.status(batch_id) for batch_id in batch_ids]
+        pending = [status for status in statuses if status['status'] != 'done']
+        if pending:
+            # An ingest worker holds the lease and will write them
+            self.stdout.write(f"{len(pending)} batches left to the running ingest worker: "
+                              f"{', '.join(status['batch_id'] for status in pending)}")
+            return
+        counts = {'new_count': 0, 'changed_count': 0, 'unchanged_count': 0}
+        for status in statuses:
+            for key in counts:
+                counts[key] += status['result'][key]
+        self.stdout.write(self.style.SUCCESS(
+            f"Successfully synced {len(valid)} products from Supabase "
+            f"({counts['new_count']} new, {counts['changed_count']} changed, {counts['unchanged_count']} unchanged)"
+        ))
@@ -0,0 +1,61 @@
+"""
+Process-wide counters and gauges for the /api/metrics/ endpoint.
+
+Counters live in the shared cache so every worker adds to the same totals.
+Gauges are callables registered in-process and evaluated when metrics are
+read, for values such as circuit breaker state that are cheap to compute on
+demand.
+"""
+import logging
+
+from django.core.cache import cache
+
+from .cache import update_many
+
+NAMES_KEY = 'metrics:names'
+
+_gauges = {}
+
+
+def incr(name, value=1):
+    key = f'metrics:{name}'
+    try:
+        cache.incr(key, value)
+    except ValueError:
+        if not cache.add(key, value, None):
+            cache.incr(key, value)
+        _register(name)
+    except Exception as e:
+        logging.error(f"Failed to record metric {name}: {str(e)}")
+
+
+def _register(name):
+    def add_name(current):
+        names = current.get(NAMES_KEY, set())
+        return {NAMES_KEY: names | {name}}, None
+
+    update_many(cache, [NAMES_KEY], add_name, None)
+
+
+def register_gauge(name, func):
+    _gauges[name] = func
+
+
+def counters():
+    names = sorted(cache.get(NAMES_KEY, set()))
+    values = cache.get_many([f'metrics:{name}' for name in names])
+    return {name: values.get(f'metrics:{name}', 0) for name in names}
+
+
+def gauges():
+    result = {}
+    for name, func in _gauges.items():
+        try:
+            result[name] = func()
+        except Exception as e:
+            result[name] = {'error': str(e)}
+    return result
+
+
+def snapshot():
+    return {'counters': counters(), 'gauges': gauges()}
@@ -0,0 +1,35 @@
+# Generated by Django 5.0.1 on 2026-10-19 02:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_alter_product_reviews'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RequestProfile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('profile_id', models.CharField(max_length=32, unique=True)),
+                ('method', models.CharField(max_length=10)),
+                ('path', models.CharField(max_length=500)),
+                ('status_code', models.IntegerField()),
+                ('trigger', models.CharField(max_length=20)),
+                ('duration_ms', models.FloatField()),
+                ('sql_count', models.IntegerField(default=0)),
+                ('sql_ms', models.FloatField(default=0)),
+                ('http_count', models.IntegerField(default=0)),
+                ('http_ms', models.FloatField(default=0)),
+                ('stats_file', models.CharField(blank=True, max_length=500)),
+                ('timeline_file', models.CharField(blank=True, max_length=500)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
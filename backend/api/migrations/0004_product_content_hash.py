@@ -0,0 +1,38 @@
+# Generated by Django 5.0.1 on 2026-10-19 03:00
+
+from django.db import migrations, models
+
+
+def backfill_content_hash(apps, schema_editor):
+    from api.models import product_content_hash
+
+    Product = apps.get_model('api', 'Product')
+    batch = []
+    for product in Product.objects.only('id', 'price', 'rating', 'reviews').iterator(chunk_size=2000):
+        product.content_hash = product_content_hash(product.price, product.rating, product.reviews)
+        batch.append(product)
+        if len(batch) >= 2000:
+            Product.objects.bulk_update(batch, ['content_hash'])
+            batch = []
+    if batch:
+        Product.objects.bulk_update(batch, ['content_hash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_requestprofile'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='content_hash',
+            field=models.CharField(blank=True, default='', max_length=32),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['company_name', 'product_name'], name='product_company_name_idx'),
+        ),
+        migrations.RunPython(backfill_content_hash, migrations.RunPython.noop),
+    ]
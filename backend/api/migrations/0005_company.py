@@ -0,0 +1,65 @@
+# Generated by Django 5.0.1 on 2026-10-19 03:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+
+def backfill_companies(apps, schema_editor):
+    from api.companies import alias_key, canonical_name
+
+    Company = apps.get_model('api', 'Company')
+    Product = apps.get_model('api', 'Product')
+
+    # Group spellings that only differ in case/punctuation; the most
+    # common spelling decides the canonical name.
+    groups = {}
+    for row in Product.objects.values('company_name').annotate(n=Count('id'), last=Max('updated_at')):
+        groups.setdefault(alias_key(row['company_name']), []).append(row)
+
+    for variants in groups.values():
+        variants.sort(key=lambda row: -row['n'])
+        company, _ = Company.objects.get_or_create(name=canonical_name(variants[0]['company_name']))
+        company.last_scraped_at = max(row['last'] for row in variants)
+        company.save(update_fields=['last_scraped_at'])
+        Product.objects.filter(
+            company_name__in=[row['company_name'] for row in variants]
+        ).update(company=company, company_name=company.name)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_product_content_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Company',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200, unique=True)),
+                ('aliases', models.JSONField(blank=True, default=list)),
+                ('last_scraped_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name_plural': 'companies',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.RemoveIndex(
+            model_name='product',
+            name='product_company_name_idx',
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='company',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='products', to='api.company'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['company', 'product_name'], name='product_company_product_idx'),
+        ),
+        migrations.RunPython(backfill_companies, migrations.RunPython.noop),
+    ]
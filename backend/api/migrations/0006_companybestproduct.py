@@ -0,0 +1,57 @@
+# Generated by Django 5.0.1 on 2026-10-19 03:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_best_products(apps, schema_editor):
+    Company = apps.get_model('api', 'Company')
+    Product = apps.get_model('api', 'Product')
+    CompanyBestProduct = apps.get_model('api', 'CompanyBestProduct')
+
+    rows = []
+    for company_id in Company.objects.values_list('id', flat=True):
+        product = Product.objects.filter(company_id=company_id).order_by('-rating', '-reviews', 'id').first()
+        if product is not None:
+            rows.append(CompanyBestProduct(
+                company_id=company_id,
+                product_id=product.id,
+                company_name=product.company_name,
+                product_name=product.product_name,
+                price=product.price,
+                rating=product.rating,
+                reviews=product.reviews,
+            ))
+    CompanyBestProduct.objects.bulk_create(rows, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_company'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CompanyBestProduct',
+            fields=[
+                ('company', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='best_product', serialize=False, to='api.company')),
+                ('company_name', models.CharField(max_length=200)),
+                ('product_name', models.CharField(max_length=200)),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('rating', models.DecimalField(decimal_places=2, max_digits=3)),
+                ('reviews', models.IntegerField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['company', '-rating', '-reviews', 'id'], name='product_company_rank_idx'),
+        ),
+        migrations.AddField(
+            model_name='companybestproduct',
+            name='product',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.product'),
+        ),
+        migrations.RunPython(backfill_best_products, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.0.1 on 2026-10-19 03:34
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_companybestproduct'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScrapeTrace',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('trace_id', models.CharField(max_length=32, unique=True)),
+                ('company_name', models.CharField(max_length=200)),
+                ('status', models.CharField(choices=[('dispatched', 'Dispatched'), ('dispatch_failed', 'Dispatch failed'), ('received', 'Received'), ('written', 'Written')], default='dispatched', max_length=20)),
+                ('error', models.TextField(blank=True)),
+                ('dispatched_at', models.DateTimeField()),
+                ('received_at', models.DateTimeField(blank=True, null=True)),
+                ('written_at', models.DateTimeField(blank=True, null=True)),
+                ('dispatch_ms', models.FloatField(blank=True, null=True)),
+                ('make_ms', models.FloatField(blank=True, null=True)),
+                ('parse_ms', models.FloatField(blank=True, null=True)),
+                ('validate_ms', models.FloatField(blank=True, null=True)),
+                ('queue_ms', models.FloatField(blank=True, null=True)),
+                ('local_write_ms', models.FloatField(blank=True, null=True)),
+                ('supabase_write_ms', models.FloatField(blank=True, null=True)),
+                ('total_ms', models.FloatField(blank=True, null=True)),
+                ('company', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='scrape_traces', to='api.company')),
+            ],
+            options={
+                'ordering': ['-dispatched_at'],
+                'indexes': [models.Index(fields=['company_name', '-dispatched_at'], name='scrapetrace_company_idx'), models.Index(fields=['status', '-dispatched_at'], name='scrapetrace_status_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.1 on 2026-10-19 03:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_scrapetrace'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='synced_hash',
+            field=models.CharField(blank=True, default='', max_length=32),
+        ),
+    ]
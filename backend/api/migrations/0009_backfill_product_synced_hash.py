@@ -0,0 +1,22 @@
+# Generated by Django 5.0.1 on 2026-10-19 09:12
+
+from django.db import migrations, models
+
+
+def backfill_synced_hash(apps, schema_editor):
+    # Before synced_hash existed every ingest wrote Supabase straight away, so
+    # existing rows are taken to match it. A row whose remote write failed
+    # back then is only sent again once its content changes.
+    Product = apps.get_model('api', 'Product')
+    Product.objects.filter(synced_hash='').update(synced_hash=models.F('content_hash'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_product_synced_hash'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_synced_hash, migrations.RunPython.noop),
+    ]
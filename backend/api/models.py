@@ -1,18 +1,150 @@
+import hashlib
+import os
 from django.db import models
 
 # Create your models here.
 
+def product_content_hash(price, rating, reviews):
+    """Hash of the scraped fields, used to skip writes when nothing changed."""
+    normalized = f"{float(price):.2f}|{float(rating):.2f}|{int(reviews)}"
+    return hashlib.blake2b(normalized.encode(), digest_size=16).hexdigest()
+
+class Company(models.Model):
+    name = models.CharField(max_length=200, unique=True)
+    aliases = models.JSONField(default=list, blank=True)
+    last_scraped_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['name']
+        verbose_name_plural = 'companies'
+
+    def __str__(self):
+        return self.name
+
 class Product(models.Model):
+    company = models.ForeignKey(Company, null=True, blank=True, on_delete=models.CASCADE, related_name='products')
     company_name = models.CharField(max_length=200)
     product_name = models.CharField(max_length=200)
     price = models.DecimalField(max_digits=10, decimal_places=2)
     rating = models.DecimalField(max_digits=3, decimal_places=2)
     reviews = models.IntegerField()
+    content_hash = models.CharField(max_length=32, blank=True, default='')
+    # content_hash of the values last written to Supabase
+    synced_hash = models.CharField(max_length=32, blank=True, default='')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['company', 'product_name'], name='product_company_product_idx'),
+            # Best product of a company is the first row of this index
+            models.Index(fields=['company', '-rating', '-reviews', 'id'], name='product_company_rank_idx'),
+        ]
 
     def __str__(self):
         return f"{self.company_name} - {self.product_name}"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Kept so save() notices edits to company_name
+        instance._loaded_company_name = instance.__dict__.get('company_name')
+        return instance
+
+    def save(self, *args, **kwargs):
+        loaded_name = getattr(self, '_loaded_company_name', None)
+        renamed = loaded_name is not None and self.company_name != loaded_name
+        if self.company_name and (self.company_id is None or renamed):
+            from .companies import get_or_create_companies
+            self.company_id, self.company_name = get_or_create_companies([self.company_name])[self.company_name]
+        self.content_hash = product_content_hash(self.price, self.rating, self.reviews)
+        super().save(*args, **kwargs)
+        self._loaded_company_name = self.company_name
+
+
+class CompanyBestProduct(models.Model):
+    """
+    Highest-rated product per company (most reviews, then lowest id, break
+    ties), kept up to date by api.best_products on every product write.
+    """
+    company = models.OneToOneField(Company, primary_key=True, on_delete=models.CASCADE, related_name='best_product')
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, related_name='+')
+    company_name = models.CharField(max_length=200)
+    product_name = models.CharField(max_length=200)
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+    rating = models.DecimalField(max_digits=3, decimal_places=2)
+    reviews = models.IntegerField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.company_name} - {self.product_name}"
+
+
+class ScrapeTrace(models.Model):
+    """
+    One company's scrape, from the Make.com dispatch to its products being
+    written locally and to Supabase. Span durations are in milliseconds and
+    are recorded by api.tracing.
+    """
+    STATUS_CHOICES = [
+        ('dispatched', 'Dispatched'),
+        ('dispatch_failed', 'Dispatch failed'),
+        ('received', 'Received'),
+        ('written', 'Written'),
+    ]
+
+    trace_id = models.CharField(max_length=32, unique=True)
+    company = models.ForeignKey(Company, null=True, blank=True, on_delete=models.SET_NULL, related_name='scrape_traces')
+    company_name = models.CharField(max_length=200)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='dispatched')
+    error = models.TextField(blank=True)
+    dispatched_at = models.DateTimeField()
+    received_at = models.DateTimeField(null=True, blank=True)
+    written_at = models.DateTimeField(null=True, blank=True)
+    dispatch_ms = models.FloatField(null=True, blank=True)
+    make_ms = models.FloatField(null=True, blank=True)
+    parse_ms = models.FloatField(null=True, blank=True)
+    validate_ms = models.FloatField(null=True, blank=True)
+    queue_ms = models.FloatField(null=True, blank=True)
+    local_write_ms = models.FloatField(null=True, blank=True)
+    supabase_write_ms = models.FloatField(null=True, blank=True)
+    total_ms = models.FloatField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-dispatched_at']
+        indexes = [
+            models.Index(fields=['company_name', '-dispatched_at'], name='scrapetrace_company_idx'),
+            models.Index(fields=['status', '-dispatched_at'], name='scrapetrace_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.company_name} ({self.trace_id})"
+
+
+class RequestProfile(models.Model):
+    profile_id = models.CharField(max_length=32, unique=True)
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=500)
+    status_code = models.IntegerField()
+    trigger = models.CharField(max_length=20)
+    duration_ms = models.FloatField()
+    sql_count = models.IntegerField(default=0)
+    sql_ms = models.FloatField(default=0)
+    http_count = models.IntegerField(default=0)
+    http_ms = models.FloatField(default=0)
+    stats_file = models.CharField(max_length=500, blank=True)
+    timeline_file = models.CharField(max_length=500, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.method} {self.path} ({self.duration_ms:.0f} ms)"
+
+    def delete_files(self):
+        for path in (self.stats_file, self.timeline_file):
+            if path and os.path.exists(path):
+                os.remove(path)
@@ -0,0 +1,19 @@
+from django.conf import settings
+from rest_framework.pagination import CursorPagination
+
+
+class ProductCursorPagination(CursorPagination):
+    """
+    Newest-first cursor pagination over the primary key, so each page is an
+    index range scan however deep the client pages. Accepts model
+    instances, dicts, or values_list() rows whose first column is the id.
+    """
+    ordering = '-id'
+    page_size = settings.PRODUCTS_PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = settings.PRODUCTS_MAX_PAGE_SIZE
+
+    def _get_position_from_instance(self, instance, ordering):
+        if isinstance(instance, tuple):
+            return str(instance[0])
+        return super()._get_position_from_instance(instance, ordering)
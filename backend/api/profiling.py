@@ -0,0 +1,247 @@
+"""
+On-demand per-request profiling.
+
+A request is profiled when a staff user (or a caller presenting
+PROFILING_TOKEN) sends the ``X-Profile`` header or the ``?_profile=1`` flag,
+or when it is picked by PROFILING_SAMPLE_RATE. Each profiled request writes a
+cProfile dump plus a JSON timeline of SQL and outgoing HTTP calls to
+PROFILING_DIR, and a RequestProfile row so the traces can be browsed from
+the admin.
+"""
+import cProfile
+import hmac
+import io
+import json
+import logging
+import os
+import pstats
+import random
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.db import connections
+
+_local = threading.local()
+_hooks_lock = threading.Lock()
+_hooks_installed = False
+
+
+class Timeline:
+    """Collects SQL and HTTP events for the request being profiled."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.events = []
+
+    def record(self, kind, label, start, **extra):
+        end = time.perf_counter()
+        self.events.append({
+            'kind': kind,
+            'label': label,
+            'start_ms': round((start - self.started) * 1000, 3),
+            'duration_ms': round((end - start) * 1000, 3),
+            **extra
+        })
+
+    def summary(self, kind):
+        events = [e for e in self.events if e['kind'] == kind]
+        return len(events), round(sum(e['duration_ms'] for e in events), 3)
+
+
+def current_timeline():
+    return getattr(_local, 'timeline', None)
+
+
+def _sql_wrapper(execute, sql, params, many, context):
+    timeline = current_timeline()
+    if timeline is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timeline.record('sql', sql, start, alias=context['connection'].alias, many=many)
+
+
+def install_http_hooks():
+    """Wrap requests and httpx so outgoing calls show up in the timeline.
+
+    The wrappers are installed once per process and are a no-op unless the
+    current thread is profiling a request.
+    """
+    global _hooks_installed
+    with _hooks_lock:
+        if _hooks_installed:
+            return
+        try:
+            import requests
+            original_send = requests.Session.send
+
+            def send(self, request, **kwargs):
+                timeline = current_timeline()
+                if timeline is None:
+                    return original_send(self, request, **kwargs)
+                start = time.perf_counter()
+                status_code = None
+                try:
+                    response = original_send(self, request, **kwargs)
+                    status_code = response.status_code
+                    return response
+                finally:
+                    timeline.record('http', f"{request.method} {request.url}", start, status=status_code)
+
+            requests.Session.send = send
+        except ImportError:
+            pass
+
+        try:
+            import httpx
+            original_httpx_send = httpx.Client.send
+
+            def httpx_send(self, request, **kwargs):
+                timeline = current_timeline()
+                if timeline is None:
+                    return original_httpx_send(self, request, **kwargs)
+                start = time.perf_counter()
+                status_code = None
+                try:
+                    response = original_httpx_send(self, request, **kwargs)
+                    status_code = response.status_code
+                    return response
+                finally:
+                    timeline.record('http', f"{request.method} {request.url}", start, status=status_code)
+
+            httpx.Client.send = httpx_send
+        except ImportError:
+            pass
+
+        _hooks_installed = True
+
+
+def _requested_trigger(request):
+    """Return why this request should be profiled, or None."""
+    flagged = 'HTTP_X_PROFILE' in request.META or request.GET.get('_profile') in ('1', 'true')
+    if flagged:
+        token = getattr(settings, 'PROFILING_TOKEN', '')
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_active and user.is_staff:
+            return 'staff'
+        # Compared as bytes: compare_digest rejects non-ASCII str
+        supplied = request.META.get('HTTP_X_PROFILE_TOKEN', '')
+        if token and hmac.compare_digest(supplied.encode(), token.encode()):
+            return 'token'
+        return None
+    rate = getattr(settings, 'PROFILING_SAMPLE_RATE', 0.0)
+    if rate > 0 and random.random() < rate:
+        return 'sample'
+    return None
+
+
+def _top_functions(profiler, limit=40):
+    stream = io.StringIO()
+    stats = pstats.Stats(profiler, stream=stream)
+    stats.sort_stats('cumulative').print_stats(limit)
+    return stream.getvalue()
+
+
+def enforce_retention():
+    """Delete the oldest stored profiles beyond PROFILING_MAX_TRACES."""
+    from .models import RequestProfile
+
+    keep = getattr(settings, 'PROFILING_MAX_TRACES', 50)
+    stale = RequestProfile.objects.order_by('-created_at')[keep:]
+    for profile in stale:
+        profile.delete_files()
+        profile.delete()
+
+
+class ProfilingMiddleware:
+    """Profile selected requests and store the traces under PROFILING_DIR."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        install_http_hooks()
+
+    def __call__(self, request):
+        trigger = _requested_trigger(request) if getattr(settings, 'PROFILING_ENABLED', True) else None
+        if trigger is None:
+            return self.get_response(request)
+
+        profiler = cProfile.Profile()
+        timeline = Timeline()
+        _local.timeline = timeline
+        wrapped = [connections[alias] for alias in connections]
+        for connection in wrapped:
+            connection.execute_wrappers.append(_sql_wrapper)
+
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another profiler is already active in this thread
+            profiler = None
+
+        try:
+            response = self.get_response(request)
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            for connection in wrapped:
+                connection.execute_wrappers.remove(_sql_wrapper)
+            _local.timeline = None
+
+        duration_ms = (time.perf_counter() - timeline.started) * 1000
+        try:
+            profile_id = self._store(request, response, trigger, profiler, timeline, duration_ms)
+            response['X-Profile-Id'] = profile_id
+        except Exception as e:
+            logging.error(f"Failed to store request profile: {str(e)}")
+        return response
+
+    def _store(self, request, response, trigger, profiler, timeline, duration_ms):
+        from .models import RequestProfile
+
+        profile_id = uuid.uuid4().hex
+        directory = settings.PROFILING_DIR
+        os.makedirs(directory, exist_ok=True)
+
+        stats_path = os.path.join(directory, f"{profile_id}.prof")
+        timeline_path = os.path.join(directory, f"{profile_id}.json")
+        if profiler is not None:
+            profiler.dump_stats(stats_path)
+        else:
+            stats_path = ''
+
+        sql_count, sql_ms = timeline.summary('sql')
+        http_count, http_ms = timeline.summary('http')
+        with open(timeline_path, 'w') as f:
+            json.dump({
+                'id': profile_id,
+                'method': request.method,
+                'path': request.get_full_path(),
+                'status_code': response.status_code,
+                'trigger': trigger,
+                'duration_ms': round(duration_ms, 3),
+                'sql': {'count': sql_count, 'duration_ms': sql_ms},
+                'http': {'count': http_count, 'duration_ms': http_ms},
+                'events': timeline.events,
+                'top_functions': _top_functions(profiler) if profiler is not None else ''
+            }, f, indent=2)
+
+        RequestProfile.objects.create(
+            profile_id=profile_id,
+            method=request.method,
+            path=request.get_full_path()[:500],
+            status_code=response.status_code,
+            trigger=trigger,
+            duration_ms=duration_ms,
+            sql_count=sql_count,
+            sql_ms=sql_ms,
+            http_count=http_count,
+            http_ms=http_ms,
+            stats_file=stats_path,
+            timeline_file=timeline_path
+        )
+        enforce_retention()
+        return profile_id
@@ -0,0 +1,29 @@
+"""
+Read/write routing between the 'default' and 'replica' aliases.
+
+Both aliases open the same SQLite file. In WAL mode a reader sees the last
+committed snapshot without waiting for the writer, so ORM reads go to the
+read-only 'replica' connection while long ingest transactions hold the
+'default' one. Reads issued inside an atomic block on 'default' stay there
+so a transaction always sees its own uncommitted writes.
+"""
+from django.db import DEFAULT_DB_ALIAS, connections
+
+READ_ALIAS = 'replica'
+
+
+class ReadReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return READ_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases are the same database
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
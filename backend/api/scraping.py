@@ -0,0 +1,122 @@
+"""
+Make.com scrape dispatch.
+
+Every call to the Make.com scenario goes through dispatch_scrape(), which
+sends companies singly or in MAKE_BATCH_SIZE groups and counts calls per
+clock hour in the shared cache so background refreshes can stay within
+MAKE_CALLS_PER_HOUR alongside user-triggered scrapes. Each company gets a
+trace id (api.tracing) that Make.com echoes back to the callback.
+"""
+import json
+import logging
+import time
+
+import requests
+from django.conf import settings
+from django.core.cache import cache
+
+from . import metrics, tracing
+
+HOUR_SECONDS = 3600
+
+
+def _calls_key(hour=None):
+    hour = int(time.time() // HOUR_SECONDS) if hour is None else hour
+    return f'make:calls:{hour}'
+
+
+def calls_this_hour():
+    return cache.get(_calls_key(), 0)
+
+
+def remaining_budget():
+    return max(settings.MAKE_CALLS_PER_HOUR - calls_this_hour(), 0)
+
+
+def _count_call():
+    key = _calls_key()
+    if not cache.add(key, 1, 2 * HOUR_SECONDS):
+        cache.incr(key)
+    metrics.incr('make.calls')
+
+
+def _payload(group, batch_size, traces):
+    if batch_size > 1:
+        return {'companyNames': group, 'traceIds': {company: traces.get(company) for company in group}}
+    return {'companyName': group[0], 'traceId': traces.get(group[0])}  # Match exact structure expected by Make.com
+
+
+def dispatch_scrape(companies, callback_url, batch_size=None):
+    """
+    Ask Make.com to scrape each company.
+
+    With MAKE_BATCH_SIZE (or batch_size) above 1, companies are sent in
+    groups as {"companyNames": [...]}, one scenario run per group; the
+    scenario posts per-company result sets back to the callback. Returns
+    (successful companies, failed entries, {company: trace id}) per company
+    either way; every company in a failed group is reported as failed.
+    Existing products are left in place and updated by the callback when
+    results arrive.
+    """
+    batch_size = max(batch_size or settings.MAKE_BATCH_SIZE, 1)
+    successful_requests = []
+    failed_requests = []
+    trace_ids = {}
+
+    for start in range(0, len(companies), batch_size):
+        group = list(companies[start:start + batch_size])
+        label = ', '.join(group)
+        traces = tracing.start(group)
+        trace_ids.update(traces)
+        started = time.perf_counter()
+        error = None
+        try:
+            webhook_data = _payload(group, batch_size, traces)
+
+            logging.info(f"Sending request to Make.com webhook for companies: {label}")
+            logging.info(f"Webhook URL: {settings.MAKE_WEBHOOK_URL}")
+            logging.info(f"Callback URL: {callback_url}")
+            logging.info(f"Request data: {json.dumps(webhook_data, indent=2)}")
+
+            _count_call()
+            response = requests.post(
+                settings.MAKE_WEBHOOK_URL,
+                json=webhook_data,
+                headers={
+                    'Content-Type': 'application/json',
+                    'User-Agent': 'Pullup/1.0'
+                },
+                timeout=180  # Increased timeout to 3 minutes
+            )
+
+            logging.info(f"Make.com response status for {label}: {response.status_code}")
+            try:
+                response_json = response.json()
+                logging.info(f"Make.com response body for {label}: {json.dumps(response_json, indent=2)}")
+            except json.JSONDecodeError:
+                logging.info(f"Make.com response body for {label} (raw): {response.text}")
+
+            if response.status_code in (200, 201, 202):
+                successful_requests.extend(group)
+            else:
+                error = f"HTTP {response.status_code}: {response.text}"
+                for company in group:
+                    failed_requests.append({
+                        'company': company,
+                        'status': response.status_code,
+                        'error': response.text
+                    })
+                logging.error(f"Make.com webhook failed for {label}: {response.status_code}")
+
+        except requests.exceptions.RequestException as e:
+            error = str(e)
+            for company in group:
+                failed_requests.append({
+                    'company': company,
+                    'error': str(e)
+                })
+            logging.error(f"Error calling Make.com webhook for {label}: {str(e)}")
+
+        tracing.dispatched(list(traces.values()), (time.perf_counter() - started) * 1000, error)
+
+    return successful_requests, failed_requests, trace_ids
@@ -1,7 +1,92 @@
+import decimal
+
+from django.core.exceptions import ImproperlyConfigured
 from rest_framework import serializers
+from rest_framework.settings import ISO_8601, api_settings
+
 from .models import Product
 
 class ProductSerializer(serializers.ModelSerializer):
     class Meta:
         model = Product
         fields = '__all__'
+
+
+# DRF fields whose to_representation returns values_list() values unchanged
+PASSTHROUGH_FIELDS = (serializers.CharField, serializers.IntegerField, serializers.BooleanField)
+
+
+def _decimal_converter(field):
+    exponent = decimal.Decimal(1).scaleb(-field.decimal_places)
+    coerce_to_string = getattr(field, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING)
+
+    def convert(value):
+        value = value.quantize(exponent, rounding=field.rounding)
+        return '{:f}'.format(value) if coerce_to_string else value
+    return convert
+
+
+def _datetime_converter(field):
+    output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+    field_timezone = field.timezone if hasattr(field, 'timezone') else field.default_timezone()
+    if output_format is None or output_format.lower() != ISO_8601 or field_timezone is None:
+        return field.to_representation
+    utc = str(field_timezone) == 'UTC'
+
+    def convert(value):
+        # Stored values are aware UTC datetimes
+        if not utc:
+            value = value.astimezone(field_timezone)
+        value = value.isoformat()
+        return value[:-6] + 'Z' if value.endswith('+00:00') else value
+    return convert
+
+
+def _converter(field):
+    """Converter for one field's values, or None when they pass through."""
+    if isinstance(field, serializers.PrimaryKeyRelatedField) and field.pk_field is None:
+        return None
+    if isinstance(field, PASSTHROUGH_FIELDS):
+        return None
+    if isinstance(field, serializers.DecimalField) and field.decimal_places is not None and not field.localize:
+        return _decimal_converter(field)
+    if isinstance(field, serializers.DateTimeField):
+        return _datetime_converter(field)
+    return field.to_representation
+
+
+class ProductRowSerializer:
+    """
+    Read-only fast path with the same output as ProductSerializer.
+
+    Rows come from ``.values_list(*columns)`` and are mapped to dicts with
+    converters chosen once from the ProductSerializer fields, so listing
+    builds no model instances and runs no per-row DRF field code. Writes
+    keep using ProductSerializer for validation.
+    """
+
+    def __init__(self, serializer_class=ProductSerializer):
+        fields = {name: field for name, field in serializer_class().fields.items() if not field.write_only}
+        if next(iter(fields), None) != 'id':
+            # ProductCursorPagination reads the row position from column 0
+            raise ImproperlyConfigured(f"{serializer_class.__name__} must list 'id' first")
+        self.names = list(fields)
+        self.columns = [field.source for field in fields.values()]
+        self.converters = []
+        for name, field in fields.items():
+            convert = _converter(field)
+            if convert is not None:
+                self.converters.append((name, convert))
+
+    def to_representation(self, rows):
+        names = self.names
+        converters = self.converters
+        data = []
+        for row in rows:
+            item = dict(zip(names, row))
+            for name, convert in converters:
+                value = item[name]
+                if value is not None:
+                    item[name] = convert(value)
+            data.append(item)
+        return data
@@ -0,0 +1,309 @@
+"""
+In-process columnar snapshot of the Product table.
+
+The catalog fits in memory, so each worker keeps it as NumPy columns (id,
+company code, product code, price, rating, reviews) sorted by company, with
+a company -> [start, end) row-range index and interned company and product
+name strings. Compare, filter and top-N queries are answered from these
+arrays with vectorized operations instead of a database or Supabase round
+trip.
+
+Writers call changed(), which bumps the shared ``products:version`` counter
+once their transaction commits. Readers compare it with the snapshot's
+version at most every PRODUCT_SNAPSHOT_CHECK_SECONDS; on a change only rows
+updated since the last refresh (minus PRODUCT_SNAPSHOT_OVERLAP_SECONDS, for
+transactions that committed out of timestamp order) are read and merged
+into a new column set. A row count that no longer matches means rows were
+deleted, and the snapshot is reloaded in full. Column sets are immutable
+once built, so readers never take a lock.
+"""
+import logging
+import sys
+import threading
+import time
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from . import metrics
+from .models import Product
+
+VERSION_KEY = 'products:version'
+FIELDS = ('id', 'company_id', 'company_name', 'product_name', 'price', 'rating', 'reviews', 'updated_at')
+SORT_KEYS = ('rating', 'price', 'reviews')
+
+
+def changed():
+    """Tell every worker's snapshot to pick up product writes once committed."""
+    transaction.on_commit(_bump)
+
+
+def _bump():
+    if not cache.add(VERSION_KEY, 1, None):
+        cache.incr(VERSION_KEY)
+
+
+class Columns:
+    """One immutable column set; refreshes build a new one and swap it in."""
+
+    ARRAYS = ('ids', 'company', 'product', 'price', 'rating', 'reviews', 'starts', 'ends', 'id_order', 'sorted_ids')
+
+    def __init__(self, ids, company, product, price, rating, reviews, company_ids, company_names, product_names):
+        # Stable sort by company code so each company is one contiguous range
+        order = np.argsort(company, kind='stable')
+        self.ids = ids[order]
+        self.company = company[order]
+        self.product = product[order]
+        self.price = price[order]
+        self.rating = rating[order]
+        self.reviews = reviews[order]
+        self.company_ids = company_ids
+        self.company_names = company_names
+        self.company_codes = {company_id: code for code, company_id in enumerate(company_ids)}
+        self.product_names = product_names
+        codes = np.arange(len(company_ids), dtype=np.int32)
+        self.starts = np.searchsorted(self.company, codes, side='left')
+        self.ends = np.searchsorted(self.company, codes, side='right')
+        self.id_order = np.argsort(self.ids, kind='stable')
+        self.sorted_ids = self.ids[self.id_order]
+
+    def __len__(self):
+        return len(self.ids)
+
+    def positions(self, ids):
+        """Row positions of the given ids, -1 where absent."""
+        index = np.searchsorted(self.sorted_ids, ids)
+        found = index < len(self.sorted_ids)
+        found[found] = self.sorted_ids[index[found]] == ids[found]
+        result = np.full(len(ids), -1, dtype=np.int64)
+        result[found] = self.id_order[index[found]]
+        return result
+
+    def rows_of(self, company_ids):
+        """Row positions of the given companies, from the range index."""
+        ranges = [
+            (self.starts[code], self.ends[code])
+            for code in (self.company_codes.get(company_id) for company_id in company_ids)
+            if code is not None
+        ]
+        if not ranges:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate([np.arange(start, end) for start, end in ranges])
+
+    def row(self, i):
+        return {
+            'id': int(self.ids[i]),
+            'company_id': self.company_ids[self.company[i]],
+            'company_name': self.company_names[self.company[i]],
+            'product_name': self.product_names[self.product[i]],
+            'price': float(self.price[i]),
+            'rating': float(self.rating[i]),
+            'reviews': int(self.reviews[i]),
+        }
+
+    def nbytes(self):
+        return sum(getattr(self, name).nbytes for name in self.ARRAYS)
+
+
+class ProductSnapshot:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._checked = 0.0
+        self.columns = None
+        self.version = None
+        self.watermark = None
+        # Interned names, append-only so older column sets stay valid
+        self._product_codes = {}
+        self._product_names = []
+        self._string_bytes = 0
+        self.stats_counters = {'full_loads': 0, 'incremental_refreshes': 0, 'last_refresh_ms': None,
+                               'refreshed_at': None}
+
+    # Loading
+
+    def get(self):
+        """Current column set, refreshed first if the product version moved."""
+        now = time.monotonic()
+        if self.columns is not None and now - self._checked < settings.PRODUCT_SNAPSHOT_CHECK_SECONDS:
+            return self.columns
+        version = cache.get(VERSION_KEY, 0)
+        self._checked = now
+        if self.columns is None or version != self.version:
+            with self._lock:
+                if self.columns is None or version != self.version:
+                    self._refresh(version)
+        return self.columns
+
+    def warm(self):
+        """Load in a background thread when a worker starts, if enabled."""
+        if not settings.PRODUCT_SNAPSHOT_ENABLED:
+            return
+
+        def load():
+            try:
+                self.get()
+            except Exception as e:
+                logging.error(f"Product snapshot warm-up failed: {str(e)}")
+
+        threading.Thread(target=load, name='product-snapshot-warm', daemon=True).start()
+
+    def _refresh(self, version):
+        start = time.perf_counter()
+        full = self.columns is None or self.watermark is None
+        if not full:
+            since = self.watermark - timedelta(seconds=settings.PRODUCT_SNAPSHOT_OVERLAP_SECONDS)
+            columns = self._merge(self.columns, self._rows(Product.objects.filter(updated_at__gte=since)))
+            # A count mismatch means rows were deleted since the last refresh
+            full = len(columns) != Product.objects.count()
+        if full:
+            self._product_codes = {}
+            self._product_names = []
+            self._string_bytes = 0
+            self.watermark = None
+            columns = self._merge(None, self._rows(Product.objects.all()))
+        self.columns = columns
+        self.version = version
+
+        elapsed = (time.perf_counter() - start) * 1000
+        self.stats_counters['full_loads' if full else 'incremental_refreshes'] += 1
+        self.stats_counters['last_refresh_ms'] = round(elapsed, 2)
+        self.stats_counters['refreshed_at'] = time.time()
+        metrics.incr('snapshot.full_loads' if full else 'snapshot.refreshes')
+        logging.info(f"Product snapshot {'loaded' if full else 'refreshed'}: {len(columns)} rows in {elapsed:.1f}ms")
+
+    def _rows(self, queryset):
+        rows = list(queryset.order_by().values_list(*FIELDS))
+        if rows:
+            latest = max(row[7] for row in rows)
+            if self.watermark is None or latest > self.watermark:
+                self.watermark = latest
+        return rows
+
+    def _intern(self, name):
+        code = self._product_codes.get(name)
+        if code is None:
+            name = sys.intern(name)
+            code = len(self._product_names)
+            self._product_names.append(name)
+            self._product_codes[name] = code
+            self._string_bytes += sys.getsizeof(name)
+        return code
+
+    def _merge(self, base, rows):
+        """New column set: base with rows updated in place or added."""
+        company_ids = list(base.company_ids) if base is not None else []
+        company_names = list(base.company_names) if base is not None else []
+        company_codes = dict(base.company_codes) if base is not None else {}
+        for row in rows:
+            code = company_codes.get(row[1])
+            if code is None:
+                company_codes[row[1]] = len(company_ids)
+                company_ids.append(row[1])
+                company_names.append(sys.intern(row[2]))
+            elif company_names[code] != row[2]:
+                # The company was renamed
+                company_names[code] = sys.intern(row[2])
+
+        n = len(rows)
+        ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=n)
+        company = np.fromiter((company_codes[row[1]] for row in rows), dtype=np.int32, count=n)
+        product = np.fromiter((self._intern(row[3]) for row in rows), dtype=np.int32, count=n)
+        price = np.fromiter((row[4] for row in rows), dtype=np.float64, count=n)
+        rating = np.fromiter((row[5] for row in rows), dtype=np.float64, count=n)
+        reviews = np.fromiter((row[6] for row in rows), dtype=np.int64, count=n)
+
+        if base is not None and len(base):
+            # Changed rows replace their old copies; everything else is kept
+            keep = np.ones(len(base), dtype=bool)
+            positions = base.positions(ids)
+            keep[positions[positions >= 0]] = False
+            ids = np.concatenate([base.ids[keep], ids])
+            company = np.concatenate([base.company[keep], company])
+            product = np.concatenate([base.product[keep], product])
+            price = np.concatenate([base.price[keep], price])
+            rating = np.concatenate([base.rating[keep], rating])
+            reviews = np.concatenate([base.reviews[keep], reviews])
+        return Columns(ids, company, product, price, rating, reviews, company_ids, company_names, self._product_names)
+
+    # Queries
+
+    def best(self, company_ids):
+        """
+        Best product per company id: highest rating, then most reviews, then
+        lowest id (the CompanyBestProduct order), found with three vector
+        passes over the company's row range.
+        """
+        columns = self.get()
+        result = {}
+        for company_id in company_ids:
+            code = columns.company_codes.get(company_id)
+            if code is None or columns.starts[code] == columns.ends[code]:
+                continue
+            start, end = columns.starts[code], columns.ends[code]
+            rating = columns.rating[start:end]
+            candidates = rating == rating.max()
+            reviews = np.where(candidates, columns.reviews[start:end], -1)
+            candidates &= reviews == reviews.max()
+            rows = np.flatnonzero(candidates)
+            result[company_id] = columns.row(start + rows[np.argmin(columns.ids[start:end][rows])])
+        return result
+
+    def query(self, company_ids=None, min_price=None, max_price=None, min_rating=None, min_reviews=None,
+              sort=None, descending=True, limit=None):
+        """
+        Rows matching the filters, optionally ordered by sort (rating, price
+        or reviews; ties go to the most reviewed, then lowest id) and cut to
+        the top limit. Only the rows that can make the top N are fully
+        sorted.
+        """
+        columns = self.get()
+        rows = columns.rows_of(company_ids) if company_ids is not None else np.arange(len(columns))
+        mask = np.ones(len(rows), dtype=bool)
+        if min_price is not None:
+            mask &= columns.price[rows] >= min_price
+        if max_price is not None:
+            mask &= columns.price[rows] <= max_price
+        if min_rating is not None:
+            mask &= columns.rating[rows] >= min_rating
+        if min_reviews is not None:
+            mask &= columns.reviews[rows] >= min_reviews
+        rows = rows[mask]
+
+        if sort is not None:
+            key = getattr(columns, sort)[rows].astype(np.float64)
+            if descending:
+                key = -key
+            if limit is not None and limit < len(rows):
+                # Rows tied with the limit-th key all stay, so the full sort
+                # below still breaks ties exactly
+                cutoff = np.partition(key, limit - 1)[limit - 1]
+                within = key <= cutoff
+                rows, key = rows[within], key[within]
+            rows = rows[np.lexsort((columns.ids[rows], -columns.reviews[rows], key))]
+        if limit is not None:
+            rows = rows[:limit]
+        return [columns.row(i) for i in rows]
+
+    def stats(self):
+        columns = self.columns
+        if columns is None:
+            return {'loaded': False}
+        array_bytes = columns.nbytes()
+        string_bytes = self._string_bytes + sum(sys.getsizeof(name) for name in columns.company_names)
+        return {
+            'loaded': True,
+            'version': self.version,
+            'rows': len(columns),
+            'companies': len(columns.company_ids),
+            'array_bytes': array_bytes,
+            'string_bytes': string_bytes,
+            'total_bytes': array_bytes + string_bytes,
+            **self.stats_counters,
+        }
+
+
+snapshot = ProductSnapshot()
+metrics.register_gauge('product_snapshot', snapshot.stats)
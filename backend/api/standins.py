@@ -0,0 +1,288 @@
+"""
+Local stand-ins for Make.com and Supabase, for load tests and offline runs.
+
+- MakeStandIn accepts the scrape webhook ({"companyName"} or batched
+  {"companyNames"}) and, when given a callback URL, posts generated products
+  back after a delay, the way the real scenario does.
+- SupabaseStandIn answers the subset of the PostgREST API the backend uses
+  (select/insert/update/delete on /rest/v1/<table> with eq/in filters,
+  limit, offset and Prefer: return=minimal) from an in-memory SQLite
+  database. Bulk inserts go through one executemany.
+
+Both are plain ThreadingHTTPServers; start() serves them from a daemon
+thread. Point the backend at them with MAKE_WEBHOOK_URL and SUPABASE_URL
+(see the standins management command).
+"""
+import csv
+import json
+import logging
+import random
+import sqlite3
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+import requests
+
+PRODUCT_COLUMNS = ['id', 'company_name', 'product_name', 'price', 'rating', 'reviews', 'created_at']
+FILTER_OPERATORS = {'eq': '=', 'neq': '!=', 'gt': '>', 'gte': '>=', 'lt': '<', 'lte': '<='}
+
+
+def generate_products(company, count, rng=random):
+    return [
+        {
+            'company_name': company,
+            'product_name': f"{company} Product {i}",
+            'price': round(rng.uniform(10, 2000), 2),
+            'rating': round(rng.uniform(2.5, 5), 1),
+            'reviews': rng.randint(0, 20000),
+        }
+        for i in range(count)
+    ]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        logging.debug(f"{self.server.name} stand-in: {format % args}")
+
+    def _body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if not length:
+            return None
+        return json.loads(self.rfile.read(length))
+
+    def _send(self, status, body=None, content_type='application/json'):
+        data = b'' if body is None else (body if isinstance(body, bytes) else json.dumps(body).encode())
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class _StandIn:
+    name = 'stand-in'
+    handler = _Handler
+
+    def __init__(self, host='127.0.0.1', port=0):
+        self.server = ThreadingHTTPServer((host, port), self.handler)
+        self.server.daemon_threads = True
+        self.server.name = self.name
+        self.server.standin = self
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class _MakeHandler(_Handler):
+    def do_POST(self):
+        standin = self.server.standin
+        try:
+            payload = self._body() or {}
+        except ValueError:
+            self._send(400, {'error': 'Invalid JSON'})
+            return
+        companies = payload.get('companyNames') or ([payload['companyName']] if 'companyName' in payload else [])
+        standin.record(companies)
+        if companies and standin.callback_url:
+            threading.Thread(
+                target=standin.deliver, args=(companies, 'companyNames' in payload), daemon=True
+            ).start()
+        self._send(200, b'Accepted', 'text/plain')
+
+
+class MakeStandIn(_StandIn):
+    """Make.com webhook stand-in that optionally calls back with products."""
+
+    name = 'make'
+    handler = _MakeHandler
+
+    def __init__(self, host='127.0.0.1', port=0, callback_url=None, callback_delay=1.0,
+                 products_per_company=20):
+        super().__init__(host, port)
+        self.callback_url = callback_url
+        self.callback_delay = callback_delay
+        self.products_per_company = products_per_company
+        self.calls = 0
+        self.companies = 0
+        self._lock = threading.Lock()
+
+    @property
+    def webhook_url(self):
+        return f"{self.url}/hook"
+
+    def record(self, companies):
+        with self._lock:
+            self.calls += 1
+            self.companies += len(companies)
+
+    def deliver(self, companies, batched):
+        time.sleep(self.callback_delay)
+        if batched:
+            body = {'results': [
+                {'companyName': company, 'products': generate_products(company, self.products_per_company)}
+                for company in companies
+            ]}
+        else:
+            body = generate_products(companies[0], self.products_per_company)
+        try:
+            requests.post(self.callback_url, json=body, timeout=60)
+        except requests.exceptions.RequestException as e:
+            logging.error(f"Make stand-in callback failed: {str(e)}")
+
+
+class _SupabaseHandler(_Handler):
+    def _parse(self):
+        parts = urlsplit(self.path)
+        if not parts.path.startswith('/rest/v1/'):
+            return None, None
+        return parts.path[len('/rest/v1/'):].strip('/'), parse_qsl(parts.query, keep_blank_values=True)
+
+    def _dispatch(self, method):
+        table, params = self._parse()
+        standin = self.server.standin
+        if table not in standin.tables:
+            self._send(404, {'message': f'relation "{table}" does not exist'})
+            return
+        try:
+            # Always drain the body: postgrest-py sends "{}" with GETs and the
+            # connection is kept alive
+            body = self._body()
+            returning = 'return=minimal' not in (self.headers.get('Prefer') or '')
+            rows = standin.query(method, table, params, body, returning)
+        except (ValueError, sqlite3.Error) as e:
+            self._send(400, {'message': str(e), 'code': 'PGRST100'})
+            return
+        self._send(201 if method == 'POST' else 200, rows if returning else b'')
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def do_PATCH(self):
+        self._dispatch('PATCH')
+
+    def do_DELETE(self):
+        self._dispatch('DELETE')
+
+
+class SupabaseStandIn(_StandIn):
+    """PostgREST-compatible subset over an in-memory SQLite products table."""
+
+    name = 'supabase'
+    handler = _SupabaseHandler
+    tables = {'products': PRODUCT_COLUMNS}
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0):
+        super().__init__(host, port)
+        self.latency = latency
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(':memory:', check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute(
+            'CREATE TABLE products (id INTEGER PRIMARY KEY AUTOINCREMENT, company_name TEXT, '
+            'product_name TEXT, price REAL, rating REAL, reviews INTEGER, '
+            "created_at TEXT DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ', 'now')))"
+        )
+        self._db.execute('CREATE INDEX products_company ON products (company_name)')
+
+    def seed(self, products):
+        self.query('POST', 'products', [], products, returning=False)
+
+    def _where(self, table, params):
+        clauses = []
+        values = []
+        for column, expression in params:
+            if column in ('select', 'limit', 'offset', 'order'):
+                continue
+            if column not in self.tables[table]:
+                raise ValueError(f'column "{column}" does not exist')
+            operator, _, value = expression.partition('.')
+            if operator == 'in':
+                items = next(csv.reader([value.strip('()')], skipinitialspace=True)) if value.strip('()') else []
+                clauses.append(f'{column} IN ({", ".join("?" * len(items))})')
+                values.extend(items)
+            elif operator in FILTER_OPERATORS:
+                clauses.append(f'{column} {FILTER_OPERATORS[operator]} ?')
+                values.append(value)
+            else:
+                raise ValueError(f'unsupported operator "{operator}"')
+        return (' WHERE ' + ' AND '.join(clauses) if clauses else ''), values
+
+    def query(self, method, table, params, body, returning=True):
+        if self.latency:
+            time.sleep(self.latency)
+        columns = self.tables[table]
+        where, values = self._where(table, params)
+        options = dict(params)
+        with self._lock:
+            if method == 'GET':
+                selected = options.get('select', '*')
+                selected = columns if selected == '*' else [c for c in selected.split(',') if c in columns]
+                sql = f'SELECT {", ".join(selected)} FROM {table}{where} ORDER BY id'
+                if 'limit' in options:
+                    sql += f' LIMIT {int(options["limit"])} OFFSET {int(options.get("offset", 0))}'
+                return [dict(row) for row in self._db.execute(sql, values)]
+
+            if method == 'POST':
+                rows = body if isinstance(body, list) else [body]
+                # One executemany per column set; ids are assigned in order
+                # under the lock, so the new ones follow the current maximum
+                first = self._db.execute(f'SELECT COALESCE(MAX(id), 0) + 1 FROM {table}').fetchone()[0]
+                by_fields = {}
+                for row in rows:
+                    fields = tuple(c for c in row if c in columns and c != 'id')
+                    by_fields.setdefault(fields, []).append([row[c] for c in fields])
+                for fields, values in by_fields.items():
+                    self._db.executemany(
+                        f'INSERT INTO {table} ({", ".join(fields)}) VALUES ({", ".join("?" * len(fields))})', values
+                    )
+                self._db.commit()
+                if not returning:
+                    return []
+                last = self._db.execute(f'SELECT COALESCE(MAX(id), 0) FROM {table}').fetchone()[0]
+                return self._rows(table, list(range(first, last + 1)))
+
+            ids = [row['id'] for row in self._db.execute(f'SELECT id FROM {table}{where}', values)]
+            if method == 'PATCH':
+                fields = [c for c in body if c in columns and c != 'id']
+                if fields and ids:
+                    self._db.execute(
+                        f'UPDATE {table} SET {", ".join(f"{c} = ?" for c in fields)} '
+                        f'WHERE id IN ({", ".join("?" * len(ids))})',
+                        [body[c] for c in fields] + ids
+                    )
+                    self._db.commit()
+                return self._rows(table, ids)
+
+            if method == 'DELETE':
+                deleted = self._rows(table, ids)
+                if ids:
+                    self._db.execute(f'DELETE FROM {table} WHERE id IN ({", ".join("?" * len(ids))})', ids)
+                    self._db.commit()
+                return deleted
+        raise ValueError(f'unsupported method {method}')
+
+    def _rows(self, table, ids):
+        if not ids:
+            return []
+        return [dict(row) for row in self._db.execute(
+            f'SELECT * FROM {table} WHERE id IN ({", ".join("?" * len(ids))}) ORDER BY id', ids
+        )]
@@ -0,0 +1,241 @@
+"""
+Incremental JSON readers for large scrape_callback payloads.
+
+Both readers pull fixed-size chunks from a file-like request stream and yield
+one product object at a time, so memory is bounded by the largest single
+product rather than by the size of the whole body. A product (or NDJSON
+line) longer than max_buffer characters raises StreamFormatError instead of
+growing the buffer without limit.
+
+The JSON reader accepts the same bodies as ingest.flatten_result_sets(): a
+product array, {"products": [...]}, or the batched
+{"results": [{"companyName": ..., "products": [...]}]} form, whose products
+are streamed one by one with the result set's company name filled in.
+"""
+import codecs
+import json
+
+from django.conf import settings
+
+from .ingest import result_set_failure, with_company_name
+
+READ_SIZE = 64 * 1024
+MAX_BUFFER = 8 * 1024 * 1024
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = ' \t\n\r'
+
+
+class StreamFormatError(ValueError):
+    pass
+
+
+def _chunks(stream, read_size):
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    while True:
+        data = stream.read(read_size)
+        if not data:
+            tail = decoder.decode(b'', final=True)
+            if tail:
+                yield tail
+            return
+        yield decoder.decode(data)
+
+
+def _too_large(max_buffer):
+    return StreamFormatError(f"A single JSON value is larger than the {max_buffer} character stream buffer")
+
+
+def iter_ndjson(stream, read_size=READ_SIZE, max_buffer=MAX_BUFFER):
+    """Yield one decoded object per non-empty line."""
+    buffer = ''
+    line_number = 0
+    for chunk in _chunks(stream, read_size):
+        buffer += chunk
+        *lines, buffer = buffer.split('\n')
+        for line in lines:
+            line_number += 1
+            if line.strip():
+                yield _loads_line(line, line_number)
+        if len(buffer) > max_buffer:
+            raise _too_large(max_buffer)
+    if buffer.strip():
+        yield _loads_line(buffer, line_number + 1)
+
+
+def _loads_line(line, line_number):
+    try:
+        return json.loads(line)
+    except ValueError as e:
+        raise StreamFormatError(f"Invalid JSON on line {line_number}: {str(e)}")
+
+
+class _Reader:
+    """A window over the decoded stream with just enough JSON structure to walk arrays and objects."""
+
+    def __init__(self, stream, read_size, max_buffer):
+        self.chunks = _chunks(stream, read_size)
+        self.read_size = read_size
+        self.max_buffer = max_buffer
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def fill(self):
+        try:
+            chunk = next(self.chunks)
+        except StopIteration:
+            chunk = ''
+            self.eof = True
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        if len(self.buffer) > self.max_buffer:
+            raise _too_large(self.max_buffer)
+
+    def peek(self):
+        """The next non-whitespace character, or '' at the end of the stream."""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if self.eof:
+                return ''
+            self.fill()
+
+    def take(self, expected, message):
+        char = self.peek()
+        if not char:
+            raise StreamFormatError('Unexpected end of JSON')
+        if char not in expected:
+            raise StreamFormatError(message)
+        self.pos += 1
+        return char
+
+    def value(self):
+        """Decode one complete JSON value."""
+        self.peek()
+        while True:
+            try:
+                item, end = _decoder.raw_decode(self.buffer, self.pos)
+            except ValueError as e:
+                if self.eof:
+                    raise StreamFormatError(f"Invalid JSON in products array: {str(e)}")
+                self.fill()
+                continue
+            if end == len(self.buffer) and not self.eof:
+                # A number or literal might continue in the next chunk
+                self.fill()
+                continue
+            break
+        self.pos = end
+        if self.pos > self.read_size:
+            self.buffer = self.buffer[self.pos:]
+            self.pos = 0
+        return item
+
+    def elements(self, what):
+        """Step through an array; the caller consumes each element."""
+        self.take('[', f"Expected a JSON array of {what}")
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            yield
+            if self.take(',]', 'Expected comma between array elements') == ']':
+                return
+
+    def members(self, what):
+        """Yield an object's keys; the caller consumes each value."""
+        self.take('{', f"Expected a JSON object for {what}")
+        if self.peek() == '}':
+            self.pos += 1
+            return
+        while True:
+            if self.peek() != '"':
+                raise StreamFormatError(f"Expected a string key in {what}")
+            key = self.value()
+            self.take(':', "Expected ':' after object key")
+            yield key
+            if self.take(',}', 'Expected comma between object members') == '}':
+                return
+
+
+def _result_set_products(reader, failed):
+    """
+    Products of one result set. They are streamed once companyName is
+    known, so it should come before "products"; products already streamed
+    are kept even if an "error" follows them.
+    """
+    company = None
+    error = None
+    count = 0
+    pending = []
+    for key in reader.members('result set'):
+        if key in ('companyName', 'company_name') and not company:
+            company = reader.value()
+        elif key == 'error':
+            error = reader.value()
+        elif key == 'products' and reader.peek() == '[':
+            for _ in reader.elements('products'):
+                product = reader.value()
+                count += 1
+                if company and not error:
+                    yield with_company_name(product, company)
+                else:
+                    pending.append(product)
+        else:
+            reader.value()
+    failure = result_set_failure(company, error, count)
+    if failure:
+        failed.append(failure)
+        return
+    for product in pending:
+        yield with_company_name(product, company)
+
+
+def iter_json_array(stream, read_size=READ_SIZE, max_buffer=MAX_BUFFER, failed=None):
+    """
+    Yield products from a JSON body as they are read.
+
+    The body is a product array, {"products": [...]}, or
+    {"results": [...]} with per-company result sets, whose failures are
+    appended to failed as flatten_result_sets() reports them. Anything after
+    the products or results array is ignored.
+    """
+    failed = [] if failed is None else failed
+    reader = _Reader(stream, read_size, max_buffer)
+    char = reader.peek()
+    if char == '[':
+        for _ in reader.elements('products'):
+            yield reader.value()
+        return
+    if char != '{':
+        raise StreamFormatError('Expected a JSON array of products')
+    for key in reader.members('the payload'):
+        if key == 'products' and reader.peek() == '[':
+            for _ in reader.elements('products'):
+                yield reader.value()
+            return
+        if key == 'results' and reader.peek() == '[':
+            for _ in reader.elements('result sets'):
+                yield from _result_set_products(reader, failed)
+            return
+        reader.value()
+    raise StreamFormatError('No products array found in JSON object')
+
+
+def iter_products(request, read_size=READ_SIZE, failed=None):
+    """Pick the reader from the request's content type."""
+    max_buffer = settings.INGEST_STREAM_MAX_BUFFER
+    if 'ndjson' in request.content_type or 'jsonlines' in request.content_type:
+        return iter_ndjson(request, read_size, max_buffer)
+    return iter_json_array(request, read_size, max_buffer, failed)
+
+
+def is_streaming_request(request):
+    return (
+        request.GET.get('stream') in ('1', 'true')
+        or 'ndjson' in request.content_type
+        or 'jsonlines' in request.content_type
+    )
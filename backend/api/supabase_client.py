@@ -0,0 +1,236 @@
+"""
+Resilient access to Supabase.
+
+The raw supabase-py client has no retry policy and a shared HTTP session
+with default pool settings, so a slow Supabase ties up every worker.
+ResilientSupabase keeps the familiar ``table(...)`` query builder but runs
+queries through ``execute()``, which adds:
+
+- a pooled keep-alive HTTP session with per-call timeouts
+- jittered exponential retries for idempotent reads
+- a circuit breaker, shared by all workers through the cache, that fails
+  fast after repeated errors and lets reads fall back to the local
+  ``Product`` table while it is open
+"""
+import logging
+import random
+import time
+
+import httpx
+from django.conf import settings
+from django.core.cache import cache
+from postgrest.exceptions import APIError
+from supabase import create_client
+
+from . import metrics
+from .cache import update_many
+
+
+# PostgREST codes for a database it cannot reach, a schema cache it cannot
+# load or a connection pool timeout, and the Postgres SQLSTATE classes for
+# connection errors, exhausted resources and operator intervention
+# (shutdowns, statement timeouts)
+UNAVAILABLE_CODES = {'PGRST000', 'PGRST001', 'PGRST002', 'PGRST003'}
+UNAVAILABLE_SQLSTATE_CLASSES = {'08', '53', '57'}
+
+
+class CircuitOpenError(Exception):
+    """Raised when Supabase is skipped because the circuit breaker is open."""
+
+
+class LocalResponse:
+    """Stand-in for a postgrest APIResponse built from local rows."""
+
+    def __init__(self, data):
+        self.data = data
+        self.count = len(data)
+
+
+def local_products(companies=None):
+    """Return local Product rows shaped like Supabase 'products' rows."""
+    from .companies import company_ids
+    from .models import Product
+
+    queryset = Product.objects.all()
+    if companies is not None:
+        queryset = queryset.filter(company_id__in=company_ids(companies))
+    return [
+        {
+            'id': str(row['id']),
+            'company_name': row['company_name'],
+            'product_name': row['product_name'],
+            'price': float(row['price']),
+            'rating': float(row['rating']),
+            'reviews': row['reviews'],
+        }
+        for row in queryset.values('id', 'company_name', 'product_name', 'price', 'rating', 'reviews')
+    ]
+
+
+class CircuitBreaker:
+    """
+    Closed -> open after failure_threshold consecutive failures; open ->
+    half-open after reset_timeout, when a single probe call is let through.
+    The probe's outcome closes or re-opens the circuit.
+    """
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30):
+        self.name = name
+        self.key = f'breaker:{name}'
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+    def _initial(self):
+        return {'state': 'closed', 'failures': 0, 'opened_at': None, 'probe_at': None}
+
+    def snapshot(self):
+        data = cache.get(self.key) or self._initial()
+        state = data['state']
+        if state == 'open' and time.time() - data['opened_at'] >= self.reset_timeout:
+            state = 'half_open'
+        return {
+            'state': state,
+            'failures': data['failures'],
+            'opened_at': data['opened_at'],
+            'failure_threshold': self.failure_threshold,
+            'reset_timeout': self.reset_timeout,
+        }
+
+    def allow(self):
+        data = cache.get(self.key)
+        if data is None or data['state'] == 'closed':
+            return True
+
+        def claim_probe(current):
+            data = current.get(self.key) or self._initial()
+            now = time.time()
+            if data['state'] == 'closed':
+                return {}, True
+            if now - data['opened_at'] < self.reset_timeout:
+                return {}, False
+            # Half-open: let one caller through per reset_timeout window
+            if data['probe_at'] is not None and now - data['probe_at'] < self.reset_timeout:
+                return {}, False
+            return {self.key: {**data, 'probe_at': now}}, True
+
+        return update_many(cache, [self.key], claim_probe, None)
+
+    def record_success(self):
+        data = cache.get(self.key)
+        if data is not None and (data['state'] != 'closed' or data['failures']):
+            if data['state'] != 'closed':
+                logging.info(f"Circuit breaker '{self.name}' closed")
+            cache.set(self.key, self._initial(), None)
+
+    def record_failure(self):
+        def add_failure(current):
+            data = current.get(self.key) or self._initial()
+            failures = data['failures'] + 1
+            if data['state'] != 'closed' or failures >= self.failure_threshold:
+                data = {'state': 'open', 'failures': failures, 'opened_at': time.time(), 'probe_at': None}
+            else:
+                data = {**data, 'failures': failures}
+            return {self.key: data}, data['state']
+
+        state = update_many(cache, [self.key], add_failure, None)
+        if state == 'open':
+            logging.error(f"Circuit breaker '{self.name}' open after repeated failures")
+            metrics.incr(f'{self.name}.breaker_opened')
+
+
+class ResilientSupabase:
+    def __init__(self, url, key, timeout=10, max_connections=20, max_keepalive=10,
+                 keepalive_expiry=30, read_retries=2, retry_backoff=0.2,
+                 failure_threshold=5, reset_timeout=30):
+        self.url = url
+        self.key = key
+        self.timeout = timeout
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=keepalive_expiry
+        )
+        self.read_retries = read_retries
+        self.retry_backoff = retry_backoff
+        self.breaker = CircuitBreaker('supabase', failure_threshold, reset_timeout)
+        self._client = None
+
+    @classmethod
+    def from_settings(cls):
+        return cls(settings.SUPABASE_URL, settings.SUPABASE_KEY, **settings.SUPABASE_CLIENT)
+
+    @property
+    def client(self):
+        if self._client is None:
+            client = create_client(supabase_url=self.url, supabase_key=self.key)
+            # Swap postgrest's default session for a pooled keep-alive one
+            # with our timeout; the base URL and auth headers are unchanged.
+            postgrest = client.postgrest
+            default_session = postgrest.session
+            postgrest.session = httpx.Client(
+                base_url=default_session.base_url,
+                headers=default_session.headers,
+                timeout=self.timeout,
+                limits=self.limits
+            )
+            default_session.close()
+            self._client = client
+        return self._client
+
+    def table(self, table_name):
+        return self.client.table(table_name)
+
+    def _is_failure(self, error):
+        # PostgREST errors for bad requests are the caller's problem, not
+        # Supabase being unavailable; gateway errors, rate limits and lost
+        # database connections are outages.
+        if not isinstance(error, APIError):
+            return True
+        code = str(error.code or '')
+        if len(code) == 3 and code.isdigit():
+            # Non-JSON error bodies carry the HTTP status as their code
+            return int(code) >= 500 or int(code) == 429
+        return code in UNAVAILABLE_CODES or code[:2] in UNAVAILABLE_SQLSTATE_CLASSES
+
+    def execute(self, query, read=False, fallback=None):
+        """
+        Execute a query builder.
+
+        Reads (read=True) are retried with jittered backoff and, when
+        Supabase is unavailable or the circuit is open, answered by
+        fallback() if one is given. Writes are attempted once.
+        """
+        if not self.breaker.allow():
+            metrics.incr('supabase.short_circuited')
+            if read and fallback is not None:
+                metrics.incr('supabase.fallbacks')
+                return LocalResponse(fallback())
+            raise CircuitOpenError('Supabase circuit breaker is open')
+
+        attempts = 1 + (self.read_retries if read else 0)
+        for attempt in range(attempts):
+            metrics.incr('supabase.calls')
+            try:
+                response = query.execute()
+            except Exception as e:
+                if not self._is_failure(e):
+                    raise
+                metrics.incr('supabase.failures')
+                if attempt + 1 < attempts:
+                    delay = self.retry_backoff * (2 ** attempt) * random.uniform(0.5, 1.5)
+                    logging.warning(f"Supabase read failed ({str(e)}), retrying in {delay:.2f}s")
+                    metrics.incr('supabase.retries')
+                    time.sleep(delay)
+                    continue
+                self.breaker.record_failure()
+                if read and fallback is not None:
+                    logging.error(f"Supabase unavailable, serving local data: {str(e)}")
+                    metrics.incr('supabase.fallbacks')
+                    return LocalResponse(fallback())
+                raise
+            self.breaker.record_success()
+            return response
+
+
+supabase = ResilientSupabase.from_settings()
+metrics.register_gauge('supabase_breaker', supabase.breaker.snapshot)
@@ -0,0 +1,99 @@
+"""
+Synthetic product catalogs for scale testing (see the generate_catalog
+command).
+
+The shapes follow a scraped marketplace rather than uniform noise:
+
+- products per company follow a Zipf law, so a few companies carry most of
+  the catalog and every company has at least one product
+- each company sells mostly in one category; prices are log-normal around
+  the category's median and most end in .99
+- reviews are heavy tailed, with a share of products never reviewed
+- ratings cluster around a per-company quality and skew high, spreading
+  wider for products with few reviews
+
+Products are generated with NumPy one company at a time, in company order,
+so a seed always yields the same catalog.
+"""
+import numpy as np
+
+# (category, median price)
+CATEGORIES = [
+    ('Headphones', 60), ('Speaker', 80), ('Charger', 20), ('Cable', 10), ('Laptop', 900),
+    ('Phone', 500), ('Tablet', 350), ('Monitor', 250), ('Keyboard', 45), ('Mouse', 25),
+    ('Camera', 600), ('Watch', 200), ('Router', 90), ('Drive', 70), ('Lamp', 35),
+    ('Backpack', 55), ('Blender', 75), ('Kettle', 40), ('Vacuum', 180), ('Shoes', 85),
+]
+ADJECTIVES = [
+    'Apex', 'Bright', 'Blue', 'Clear', 'Core', 'Crest', 'Echo', 'Golden', 'Iron', 'Lumen',
+    'Nova', 'North', 'Prime', 'Pure', 'Quantum', 'Rapid', 'Silver', 'Solar', 'Swift', 'True',
+]
+NOUNS = [
+    'Forge', 'Labs', 'Works', 'Systems', 'Goods', 'Supply', 'Digital', 'Audio', 'Home', 'Gear',
+    'Electronics', 'Design', 'Tech', 'Craft', 'Outfitters', 'Devices', 'Collective', 'Co', 'Brands', 'Market',
+]
+
+CATEGORY_NAMES = [name for name, _ in CATEGORIES]
+CATEGORY_MEDIANS = np.array([median for _, median in CATEGORIES], dtype=np.float64)
+
+
+def company_names(count):
+    """Distinct, title-cased names that pass validate_company_name()."""
+    pairs = len(ADJECTIVES) * len(NOUNS)
+    names = []
+    for i in range(count):
+        name = f"{ADJECTIVES[i % len(ADJECTIVES)]} {NOUNS[(i // len(ADJECTIVES)) % len(NOUNS)]}"
+        names.append(f"{name} {i // pairs + 1}" if i >= pairs else name)
+    return names
+
+
+class SyntheticCatalog:
+    def __init__(self, companies, products, skew=1.1, seed=0):
+        if companies < 1 or products < companies:
+            raise ValueError('Need at least one company and one product per company')
+        self.rng = np.random.default_rng(seed)
+        self.names = company_names(companies)
+        weights = 1.0 / np.arange(1, companies + 1) ** skew
+        self.rng.shuffle(weights)
+        self.counts = self.rng.multinomial(products - companies, weights / weights.sum()) + 1
+        self.quality = 3.3 + 1.5 * self.rng.beta(5, 2, companies)
+        self.category = self.rng.integers(len(CATEGORIES), size=companies)
+
+    def __len__(self):
+        return len(self.names)
+
+    def products(self, index):
+        """
+        One company's products as (company_name, product_name, price,
+        rating, reviews) tuples of plain Python values.
+        """
+        rng = self.rng
+        n = int(self.counts[index])
+        category = np.where(
+            rng.random(n) < 0.7, self.category[index], rng.integers(len(CATEGORIES), size=n)
+        )
+        price = np.clip(CATEGORY_MEDIANS[category] * rng.lognormal(0, 0.6, n), 1, 99999)
+        price = np.where(rng.random(n) < 0.6, np.floor(price) + 0.99, np.round(price, 2))
+        reviews = np.floor(rng.lognormal(3.5, 1.8, n)).astype(np.int64)
+        reviews[rng.random(n) < 0.12] = 0
+        spread = 0.9 / np.sqrt(1 + np.log1p(reviews))
+        rating = np.round(np.clip(rng.normal(self.quality[index], spread), 1, 5), 1)
+
+        company = self.names[index]
+        return [
+            (company, f"{company} {CATEGORY_NAMES[c]} {chr(65 + i % 26)}{100 + i // 26}", p, r, v)
+            for i, (c, p, r, v) in enumerate(zip(category.tolist(), price.tolist(), rating.tolist(),
+                                                 reviews.tolist()))
+        ]
+
+
+def make_product(row):
+    """A product as the Make.com scenario posts it, with formatted numbers."""
+    company, name, price, rating, reviews = row
+    return {
+        'company_name': company,
+        'product_name': name,
+        'price': f"${price:,.2f}",
+        'rating': rating,
+        'reviews': f"{reviews:,}",
+    }
@@ -1,3 +1,1263 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+import requests
+
+from django.contrib import admin
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection, connections
+from django.db.backends.sqlite3.base import DatabaseWrapper as SQLiteDatabaseWrapper
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.utils import timezone
+from postgrest.exceptions import APIError
+from rest_framework.parsers import JSONParser
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from . import best_products, companies, events, freshness, ingest_queue, scraping, tracing
+from .analytics import build_insights, compute_insights
+from .cache import SQLiteCache
+from .ingest import flatten_result_sets, ingest_products, normalize_product
+from .companies import get_or_create_companies
+from .company_index import CompanyIndex
+from .events import scrape_events
+from .models import Company, CompanyBestProduct, Product, RequestProfile, ScrapeTrace
+from .profiling import ProfilingMiddleware
+from .routers import ReadReplicaRouter
+from .scraping import dispatch_scrape
+from .serializers import ProductRowSerializer, ProductSerializer
+from .snapshot import ProductSnapshot
+from .standins import MakeStandIn, SupabaseStandIn
+from .supabase_client import CircuitOpenError, ResilientSupabase
+from .streaming import StreamFormatError, iter_json_array, iter_ndjson
+from .throttling import ScrapeRateThrottle, take_tokens
+
+TOKEN_BUCKET_RATES = {'scrape': '5/hour', 'scrape_company': '2/hour', 'fetch': '60/minute'}
+
+
+class CacheTestCase(TestCase):
+    """Runs every test against its own SQLite cache file."""
+
+    def setUp(self):
+        super().setUp()
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp, ignore_errors=True)
+        settings = override_settings(CACHES={'default': {
+            'BACKEND': 'api.cache.SQLiteCache',
+            'LOCATION': os.path.join(self.tmp, 'cache.sqlite3'),
+        }})
+        settings.enable()
+        self.addCleanup(settings.disable)
+        cache.clear()
+        # The alias map is process-local and would outlive the rolled back rows
+        companies._state['version'] = None
+
+
+class QueueTestCase(CacheTestCase):
+    """Also gives every test its own ingest queue file."""
+
+    def setUp(self):
+        super().setUp()
+        self.queue = ingest_queue.IngestQueue(os.path.join(self.tmp, 'ingest_queue.sqlite3'))
+        patcher = mock.patch('api.ingest_queue.queue', self.queue)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+class FakeQuery:
+    def __init__(self, op='select', data=None):
+        self.op = op
+        self.data = data
+        self.filters = []
+
+    def select(self, columns):
+        return FakeQuery('select')
+
+    def insert(self, data, returning=None):
+        return FakeQuery('insert', data)
+
+    def update(self, data):
+        return FakeQuery('update', data)
+
+    def in_(self, column, values):
+        self.filters.append((column, set(values)))
+        return self
+
+    def eq(self, column, value):
+        self.filters.append((column, {value}))
+        return self
+
+
+class FakeSupabase:
+    """In-memory stand-in for the Supabase products table."""
+
+    def __init__(self):
+        self.rows = []
+        self.writes = []
+        self.failing = set()
+
+    def table(self, name):
+        return FakeQuery()
+
+    def execute(self, query, read=False, fallback=None):
+        if query.op in self.failing:
+            raise Exception(f"Supabase {query.op} failed")
+        rows = [row for row in self.rows if all(row[column] in values for column, values in query.filters)]
+        if query.op == 'insert':
+            data = query.data if isinstance(query.data, list) else [query.data]
+            rows = [{**row, 'id': len(self.rows) + index + 1} for index, row in enumerate(data)]
+            self.rows.extend(rows)
+        elif query.op == 'update':
+            for row in rows:
+                row.update(query.data)
+        if query.op != 'select':
+            self.writes.append(query.op)
+        return SimpleNamespace(data=rows)
+
+
+def scraped(company, *products):
+    return [
+        normalize_product({'company_name': company, 'product_name': name, 'price': price,
+                           'rating': 4.5, 'reviews': 10})
+        for name, price in products
+    ]
+
+
+class SQLiteCacheTests(CacheTestCase):
+    def test_cull_frequency_zero_empties_the_cache_before_writing(self):
+        full = SQLiteCache(os.path.join(self.tmp, 'full.sqlite3'),
+                           {'OPTIONS': {'MAX_ENTRIES': 3, 'CULL_FREQUENCY': 0}})
+        for key in 'abcd':
+            full.set(key, key)
+        full.set('e', 'e')
+        self.assertEqual(full.get_many(list('abcde')), {'e': 'e'})
+
+    def test_add_only_replaces_expired_entries(self):
+        self.assertTrue(cache.add('k', 'a', 0.05))
+        self.assertFalse(cache.add('k', 'b'))
+        time.sleep(0.1)
+        self.assertIsNone(cache.get('k'))
+        self.assertTrue(cache.add('k', 'c'))
+        self.assertEqual(cache.get('k'), 'c')
+
+    def test_concurrent_incr_loses_no_updates(self):
+        cache.set('n', 0)
+        cache.set('p', 1.5)
+
+        def bump():
+            for _ in range(50):
+                cache.incr('n')
+                cache.incr('p')
+
+        threads = [threading.Thread(target=bump) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual((cache.get('n'), cache.get('p')), (200, 201.5))
+        with self.assertRaises(ValueError):
+            cache.incr('missing')
+
+    def test_get_or_set_computes_a_missing_entry_once(self):
+        calls = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.2)
+            return 'value'
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(cache.get_or_set('k', compute, 60)))
+                   for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual((len(calls), results), (1, ['value'] * 6))
+
+    def test_entries_near_expiry_are_recomputed_early(self):
+        def slow(value):
+            def compute():
+                time.sleep(0.05)
+                return value
+            return compute
+
+        cache.get_or_set('k', slow('old'), 0.5)
+        with mock.patch('api.cache.random.random', return_value=0.0):
+            self.assertEqual(cache.get_or_set('k', slow('new'), 0.5), 'old')
+        # A draw near 1 stretches the ~0.05s compute time past the 0.5s left
+        with mock.patch('api.cache.random.random', return_value=0.999999):
+            self.assertEqual(cache.get_or_set('k', slow('new'), 0.5), 'new')
+
+class Query:
+    """A query builder whose execute() replays the given outcomes."""
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+
+    def execute(self):
+        self.calls += 1
+        outcome = self.outcomes.pop(0) if len(self.outcomes) > 1 else self.outcomes[0]
+        if isinstance(outcome, Exception):
+            raise outcome
+        return SimpleNamespace(data=outcome)
+
+
+class SupabaseBreakerTests(CacheTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = ResilientSupabase('http://supabase.invalid', 'key', read_retries=2, retry_backoff=0,
+                                        failure_threshold=2, reset_timeout=60)
+
+    def test_reads_are_retried_and_writes_are_not(self):
+        read = Query(ConnectionError('down'), ConnectionError('down'), ['row'])
+        self.assertEqual(self.client.execute(read, read=True).data, ['row'])
+        self.assertEqual(read.calls, 3)
+        write = Query(ConnectionError('down'))
+        with self.assertRaises(ConnectionError):
+            self.client.execute(write)
+        self.assertEqual(write.calls, 1)
+
+    def test_breaker_opens_after_repeated_failures_and_reads_fall_back(self):
+        for _ in range(2):
+            with self.assertRaises(ConnectionError):
+                self.client.execute(Query(ConnectionError('down')))
+        self.assertEqual(self.client.breaker.snapshot()['state'], 'open')
+
+        skipped = Query(['row'])
+        with self.assertRaises(CircuitOpenError):
+            self.client.execute(skipped)
+        self.assertEqual(self.client.execute(skipped, read=True, fallback=lambda: ['local']).data, ['local'])
+        self.assertEqual(skipped.calls, 0)
+
+    def test_postgrest_errors_do_not_count_as_outages(self):
+        for code in (None, '42703', '23505', '400'):
+            with self.assertRaises(APIError):
+                self.client.execute(Query(APIError({'message': 'bad filter', 'code': code})))
+        self.assertEqual(self.client.breaker.snapshot()['state'], 'closed')
+
+    def test_unavailable_responses_open_the_breaker(self):
+        for _ in range(2):
+            with self.assertRaises(APIError):
+                self.client.execute(Query(APIError({'message': 'JSON could not be generated', 'code': 503})))
+        self.assertEqual(self.client.breaker.snapshot()['state'], 'open')
+
+        self.client.breaker.record_success()
+        unavailable = Query(APIError({'code': '429'}), APIError({'code': 'PGRST001'}), ['row'])
+        self.assertEqual(self.client.execute(unavailable, read=True).data, ['row'])
+        self.assertEqual(unavailable.calls, 3)
+        with self.assertRaises(APIError):
+            self.client.execute(Query(APIError({'message': 'canceling statement due to statement timeout',
+                                                'code': '57014'})))
+        self.assertEqual(self.client.breaker.snapshot()['failures'], 1)
+
+    def test_half_open_lets_one_probe_through(self):
+        breaker = self.client.breaker
+        breaker.record_failure()
+        breaker.record_failure()
+        self.assertFalse(breaker.allow())
+        now = time.time()
+        with mock.patch('api.supabase_client.time.time', return_value=now + 61):
+            self.assertEqual(breaker.snapshot()['state'], 'half_open')
+            with self.assertRaises(ConnectionError):
+                self.client.execute(Query(ConnectionError('still down')))
+            self.assertFalse(breaker.allow())
+        with mock.patch('api.supabase_client.time.time', return_value=now + 122):
+            self.assertTrue(breaker.allow())
+            self.assertFalse(breaker.allow())
+        with mock.patch('api.supabase_client.time.time', return_value=now + 183):
+            self.assertEqual(self.client.execute(Query(['row'])).data, ['row'])
+        self.assertEqual(breaker.snapshot()['state'], 'closed')
+        self.assertTrue(breaker.allow())
+
+@override_settings(TOKEN_BUCKET_RATES=TOKEN_BUCKET_RATES)
+class ScrapeThrottleTests(CacheTestCase):
+    def request(self, companies, ip='10.0.0.1'):
+        factory = APIRequestFactory()
+        request = factory.post('/api/scrape/', {'companies': companies}, format='json', REMOTE_ADDR=ip)
+        return Request(request, parsers=[JSONParser()])
+
+    def tokens(self, key):
+        # Whole tokens; buckets refill continuously between calls
+        return int(cache.get(key)[0])
+
+    def test_takes_client_and_company_tokens_together(self):
+        throttle = ScrapeRateThrottle()
+        self.assertTrue(throttle.allow_request(self.request(['Apple', 'Samsung']), None))
+        self.assertEqual(self.tokens('throttle:scrape:10.0.0.1'), 3)
+        self.assertEqual(self.tokens('throttle:scrape_company:Apple'), 1)
+        self.assertEqual(self.tokens('throttle:scrape_company:Samsung'), 1)
+
+    def test_company_denial_spends_no_client_tokens(self):
+        throttle = ScrapeRateThrottle()
+        for ip in ('10.0.0.2', '10.0.0.3'):
+            self.assertTrue(throttle.allow_request(self.request(['Apple'], ip), None))
+        self.assertIsNone(cache.get('throttle:scrape:10.0.0.1'))
+
+        self.assertFalse(throttle.allow_request(self.request(['Apple', 'Samsung']), None))
+        self.assertGreater(throttle.wait(), 0)
+        self.assertEqual(self.tokens('throttle:scrape:10.0.0.1'), 5)
+        self.assertEqual(self.tokens('throttle:scrape_company:Samsung'), 2)
+        self.assertEqual(self.tokens('throttle:scrape_company:Apple'), 0)
+
+    def test_client_denial_spends_no_company_tokens(self):
+        throttle = ScrapeRateThrottle()
+        self.assertTrue(throttle.allow_request(self.request(['Apple', 'Samsung', 'Sony', 'Dell']), None))
+        self.assertFalse(throttle.allow_request(self.request(['Lenovo', 'Asus']), None))
+        self.assertEqual(self.tokens('throttle:scrape:10.0.0.1'), 1)
+        self.assertEqual(self.tokens('throttle:scrape_company:Lenovo'), 2)
+        self.assertEqual(self.tokens('throttle:scrape_company:Asus'), 2)
+
+    def test_rejected_requests_spend_no_tokens(self):
+        throttle = ScrapeRateThrottle()
+        for body in (['Apple'], {'companies': []}, {'companies': 'Apple'}, {'companies': ['Apple', 'Bad!']}):
+            request = APIRequestFactory().post('/api/scrape/', body, format='json', REMOTE_ADDR='10.0.0.1')
+            self.assertTrue(throttle.allow_request(Request(request, parsers=[JSONParser()]), None))
+            response = self.client.post('/api/scrape/', body, content_type='application/json')
+            self.assertEqual(response.status_code, 400, body)
+        self.assertIsNone(cache.get('throttle:scrape:10.0.0.1'))
+        self.assertIsNone(cache.get('throttle:scrape:127.0.0.1'))
+        self.assertIsNone(cache.get('throttle:scrape_company:Apple'))
+
+    def test_take_tokens_is_all_or_nothing(self):
+        rate = 1 / 3600
+        self.assertTrue(take_tokens([('b', 2, rate, 2)], now=1000)[0])
+        allowed, wait, states = take_tokens([('a', 2, rate, 1), ('b', 2, rate, 1)], now=1000)
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(wait, 3600)
+        self.assertEqual(states, {'a': (2, 2), 'b': (2, 0)})
+        self.assertEqual(cache.get('a'), (2, 1000))
+
+
+class IngestHashTests(QueueTestCase):
+    def setUp(self):
+        super().setUp()
+        self.remote = FakeSupabase()
+        patcher = mock.patch('api.supabase_client.supabase', self.remote)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_unchanged_rows_skip_local_and_remote_writes(self):
+        ingest_products(scraped('Apple', ('Phone', 999), ('Watch', 399)))
+        self.remote.writes.clear()
+
+        result = ingest_products(scraped('Apple', ('Phone', 999), ('Watch', 449)))
+        self.assertEqual(result.counts(), {'new_count': 0, 'changed_count': 1, 'unchanged_count': 1})
+        self.assertEqual(self.remote.writes, ['update'])
+        self.assertEqual(Product.objects.get(product_name='Watch').price, 449)
+        self.assertEqual(Product.objects.count(), 2)
+
+    def test_failed_remote_write_is_retried_by_identical_scrape(self):
+        self.remote.failing.add('insert')
+        result = ingest_products(scraped('Apple', ('Phone', 999), ('Watch', 399)))
+        self.assertEqual(result.errors[0]['stage'], 'supabase_insert')
+        self.assertEqual(set(Product.objects.values_list('synced_hash', flat=True)), {''})
+
+        self.remote.failing.clear()
+        result = ingest_products(scraped('Apple', ('Phone', 999), ('Watch', 399)))
+        self.assertEqual(result.counts()['unchanged_count'], 2)
+        self.assertEqual(sorted(row['product_name'] for row in self.remote.rows), ['Phone', 'Watch'])
+        for product in Product.objects.all():
+            self.assertEqual(product.synced_hash, product.content_hash)
+
+        self.remote.writes.clear()
+        ingest_products(scraped('Apple', ('Phone', 999), ('Watch', 399)))
+        self.assertEqual(self.remote.writes, [])
+
+    def test_local_only_ingest_leaves_rows_unsynced(self):
+        ingest_products(scraped('Apple', ('Phone', 999)), sync_remote=False)
+        self.assertEqual(self.remote.writes, [])
+        self.assertEqual(Product.objects.get().synced_hash, '')
+
+    def test_remote_rows_are_matched_through_aliases(self):
+        self.remote.rows.append({'id': 1, 'company_name': 'apple inc.', 'product_name': 'Phone', 'price': 899.0})
+        ingest_products(scraped('Apple Inc', ('Phone', 999)))
+        self.assertEqual(self.remote.writes, ['update'])
+        self.assertEqual(self.remote.rows, [{'id': 1, 'company_name': 'Apple Inc', 'product_name': 'Phone',
+                                             'price': 999.0, 'rating': 4.5, 'reviews': '10'}])
+
+    def test_created_product_starts_out_synced(self):
+        with mock.patch('api.views.supabase', self.remote):
+            response = self.client.post('/api/products/', {'company_name': 'Apple', 'product_name': 'Phone', 'price': 999,
+                                                           'rating': 4.5, 'reviews': 10},
+                                        content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        product = Product.objects.get()
+        self.assertEqual(product.synced_hash, product.content_hash)
+
+        ingest_products(scraped('Apple', ('Phone', 999)))
+        self.assertEqual(self.remote.writes, ['insert'])
+
+
+class StreamingParserTests(TestCase):
+    def stream(self, payload, **kwargs):
+        failed = []
+        body = io.BytesIO(json.dumps(payload).encode())
+        return list(iter_json_array(body, read_size=7, failed=failed, **kwargs)), failed
+
+    def test_array_and_wrapped_products(self):
+        products = [{'product_name': 'Phone', 'price': '$1,299.00'}, {'product_name': 'Watch', 'price': 3}]
+        self.assertEqual(self.stream(products), (products, []))
+        self.assertEqual(self.stream({'traceIds': ['a'], 'products': products, 'more': [1]}), (products, []))
+        lines = b''.join(json.dumps(product).encode() + b'\n\n' for product in products)
+        self.assertEqual(list(iter_ndjson(io.BytesIO(lines), read_size=7)), products)
+
+    def test_result_sets_match_flatten_result_sets(self):
+        payload = {'traceId': 't1', 'results': [
+            {'companyName': 'Apple', 'products': [{'product_name': 'Phone'}, {'product_name': 'Mac',
+                                                                            'company_name': 'Apple Inc'}]},
+            {'products': [{'product_name': 'Lost'}]},
+            {'companyName': 'Sony', 'error': 'Timed out'},
+            {'companyName': 'Dell', 'products': []},
+            {'products': [{'product_name': 'Laptop'}], 'company_name': 'Lenovo'},
+        ]}
+        self.assertEqual(self.stream(payload), flatten_result_sets(payload))
+        products, failed = self.stream(payload)
+        self.assertEqual([p['company_name'] for p in products], ['Apple', 'Apple Inc', 'Lenovo'])
+        self.assertEqual([f['company'] for f in failed], [None, 'Sony', 'Dell'])
+
+    def test_buffer_cap(self):
+        products = [{'product_name': 'Phone', 'description': 'x' * 500}]
+        self.assertEqual(self.stream(products, max_buffer=1000)[0], products)
+        with self.assertRaises(StreamFormatError):
+            self.stream(products, max_buffer=100)
+        with self.assertRaises(StreamFormatError):
+            list(iter_ndjson(io.BytesIO(b'{"a": "' + b'x' * 500 + b'"}\n'), read_size=7, max_buffer=100))
+
+    def test_malformed_payloads(self):
+        for body in (b'{"products": [{"a": 1} {"b": 2}]}', b'[{"a": 1},', b'"text"', b'{"items": [1]}',
+                     b'{"results": [1]}'):
+            with self.subTest(body=body), self.assertRaises(StreamFormatError):
+                list(iter_json_array(io.BytesIO(body), read_size=4))
+
+
+class IngestQueueTests(QueueTestCase):
+    def products(self, *names):
+        return scraped('Apple', *[(name, 10) for name in names])
+
+    def test_claim_requeues_only_batches_of_other_owners(self):
+        first = self.queue.enqueue(self.products('Phone'), 'callback')
+        second = self.queue.enqueue(self.products('Watch'), 'callback')
+        self.assertEqual([b['batch_id'] for b in self.queue.claim('old', 1)], [first])
+
+        # The old writer's lease ran out mid-write and a new writer took over
+        self.assertEqual([b['batch_id'] for b in self.queue.claim('new', 1)], [first])
+        self.assertEqual([b['batch_id'] for b in self.queue.claim('new', 1)], [second])
+        self.assertEqual(self.queue.status(first)['status'], 'processing')
+
+        # The old writer finishing late can no longer complete or fail it
+        self.assertEqual(self.queue.complete('old', {first: {'processed_count': 1}}), 0)
+        self.queue.fail('old', [first], 'late')
+        self.assertEqual(self.queue.status(first)['status'], 'processing')
+        self.assertEqual(self.queue.complete('new', {first: {'processed_count': 1}, second: {}}), 2)
+        self.assertEqual(self.queue.status(first)['status'], 'done')
+
+    def test_fail_requeues_with_backoff(self):
+        batch_id = self.queue.enqueue(self.products('Phone'), 'callback')
+        self.queue.claim('writer', 10)
+        self.queue.fail('writer', [batch_id], 'boom')
+        status = self.queue.status(batch_id)
+        self.assertEqual((status['status'], status['error'], status['attempts']), ('queued', 'boom', 1))
+        self.assertFalse(self.queue.has_queued([batch_id]))
+
+    def test_lease_is_exclusive(self):
+        self.assertTrue(self.queue.acquire_lease('a'))
+        self.assertFalse(self.queue.acquire_lease('b'))
+        self.queue.release_lease('a')
+        self.assertTrue(self.queue.acquire_lease('b'))
+
+    def test_heartbeat_keeps_the_lease_through_long_writes(self):
+        self.assertTrue(self.queue.acquire_lease('writer', 0.3))
+        with self.queue.heartbeat('writer', 0.3) as lost:
+            time.sleep(0.6)
+            self.assertFalse(self.queue.acquire_lease('other', 0.3))
+        self.assertFalse(lost.is_set())
+
+    def test_heartbeat_reports_a_lost_lease(self):
+        self.assertTrue(self.queue.acquire_lease('writer', 0.3))
+        with self.queue.heartbeat('writer', 0.3) as lost:
+            # e.g. the process was suspended past the lease and another writer took over
+            self.queue.release_lease('writer')
+            self.assertTrue(self.queue.acquire_lease('other', 5))
+            self.assertTrue(lost.wait(1))
+        self.assertEqual(self.queue.lease_holder(), 'other')
+
+    def test_drain_own_writes_only_the_callers_batches(self):
+        mine = self.queue.enqueue(self.products('Phone'), 'callback', sync_remote=False)
+        theirs = self.queue.enqueue(self.products('Watch'), 'callback', sync_remote=False)
+        self.assertEqual(ingest_queue.drain_own([mine]), 1)
+        self.assertEqual(self.queue.status(mine)['status'], 'done')
+        self.assertEqual(self.queue.status(theirs)['status'], 'queued')
+        self.assertEqual(list(Product.objects.values_list('product_name', flat=True)), ['Phone'])
+        self.assertIsNone(self.queue.lease_holder())
+
+    def test_drain_own_leaves_batches_to_a_running_worker(self):
+        self.queue.acquire_lease('writer:1:abc')
+        batch_id = self.queue.enqueue(self.products('Phone'), 'callback', sync_remote=False)
+        self.assertEqual(ingest_queue.drain_own([batch_id]), 0)
+        self.assertEqual(self.queue.status(batch_id)['status'], 'queued')
+
+        self.assertEqual(ingest_queue.drain('writer:1:abc'), 1)
+        self.assertEqual(self.queue.status(batch_id)['result']['new_count'], 1)
+
+
+class ScrapeCallbackQueueTests(QueueTestCase):
+    def post(self, products):
+        return self.client.post('/api/webhook/scrape-callback/', products, content_type='application/json')
+
+    def callback_products(self, *names):
+        return [{'company_name': 'Apple', 'product_name': name, 'price': '$10.00', 'rating': 4, 'reviews': '1,200'}
+                for name in names]
+
+    def test_default_settings_write_callbacks_and_test_mode_samples(self):
+        with mock.patch('api.supabase_client.supabase', FakeSupabase()):
+            response = self.post(self.callback_products('Phone'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['status'], 'done')
+        with mock.patch('api.views.TEST_MODE', True):
+            response = self.client.post('/api/scrape/', {'companies': ['Sony']}, content_type='application/json')
+        self.assertEqual(response.json()['batches'][0]['status'], 'done')
+        self.assertEqual(sorted(Product.objects.values_list('product_name', flat=True)),
+                         ['Phone', 'Sample Product from Sony'])
+        self.assertFalse(self.queue.has_queued())
+
+    @override_settings(INGEST_INLINE_DRAIN=False)
+    def test_callbacks_only_enqueue_without_inline_drain(self):
+        response = self.post(self.callback_products('Phone'))
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()['status'], 'queued')
+        self.assertFalse(Product.objects.exists())
+
+    @override_settings(INGEST_INLINE_DRAIN=True)
+    def test_inline_drain_writes_only_the_callers_batch(self):
+        other = self.queue.enqueue(scraped('Apple', ('Watch', 10)), 'callback', sync_remote=False)
+        with mock.patch('api.supabase_client.supabase', FakeSupabase()):
+            response = self.post(self.callback_products('Phone'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['result']['new_count'], 1)
+        self.assertEqual(self.queue.status(other)['status'], 'queued')
+        self.assertEqual(list(Product.objects.values_list('product_name', flat=True)), ['Phone'])
+
+
+    @override_settings(INGEST_CHUNK_SIZE=1)
+    def test_stream_cut_short_reports_the_batches_it_queued(self):
+        lines = b''.join(json.dumps(product).encode() + b'\n' for product in self.callback_products('Phone', 'Watch'))
+        with mock.patch('api.supabase_client.supabase', FakeSupabase()):
+            response = self.client.post('/api/webhook/scrape-callback/', lines + b'{"company_name": \n',
+                                        content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 207)
+        self.assertTrue(response.json()['error'].startswith('Invalid data format'))
+        self.assertEqual([batch['status'] for batch in response.json()['batches']], ['done', 'done'])
+        self.assertEqual(sorted(Product.objects.values_list('product_name', flat=True)), ['Phone', 'Watch'])
+
+        response = self.client.post('/api/webhook/scrape-callback/', b'{"company_name": \n',
+                                    content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue(response.json()['error'].startswith('Invalid data format'))
+
+
+class CatalogCommandTests(QueueTestCase):
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch('api.management.commands.import_products.queue', self.queue)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_export_matches_companies_through_aliases(self):
+        ingest_products(scraped('Apple', ('Phone', 999)) + scraped('Sony', ('TV', 499)), sync_remote=False)
+        apple = Company.objects.get(name='Apple')
+        Product.objects.create(company=apple, company_name='apple inc', product_name='Watch', price=399,
+                               rating=4, reviews=3)
+        path = os.path.join(self.tmp, 'export.ndjson')
+        call_command('export_products', path, company=['APPLE', 'Nokia'], stderr=io.StringIO())
+        with open(path) as exported:
+            names = sorted(json.loads(line)['product_name'] for line in exported)
+        self.assertEqual(names, ['Phone', 'Watch'])
+
+    def write_import(self, *names):
+        path = os.path.join(self.tmp, 'import.ndjson')
+        with open(path, 'w') as output:
+            for name in names:
+                output.write(json.dumps({'company_name': 'Apple', 'product_name': name, 'price': '10',
+                                         'rating': '4', 'reviews': 1}) + '\n')
+        return path
+
+    def test_import_holds_the_writer_lease(self):
+        path = self.write_import('Phone', 'Watch')
+        self.queue.acquire_lease('writer:1:abc')
+        with self.assertRaises(CommandError):
+            call_command('import_products', path, stderr=io.StringIO())
+        self.assertFalse(Product.objects.exists())
+
+        self.queue.release_lease('writer:1:abc')
+        with mock.patch('api.management.commands.import_products.ingest_products',
+                        side_effect=lambda chunk, sync_remote: self.check_lease(chunk, sync_remote)):
+            call_command('import_products', path, stderr=io.StringIO())
+        self.assertEqual(Product.objects.count(), 2)
+        self.assertIsNone(self.queue.lease_holder())
+
+    def check_lease(self, chunk, sync_remote):
+        self.assertTrue(self.queue.lease_holder().startswith('import_products:'))
+        return ingest_products(chunk, sync_remote=sync_remote)
+
+    def test_changed_rows_take_the_canonical_company_name(self):
+        apple_id, _ = get_or_create_companies(['Apple'])['Apple']
+        Product.objects.create(company_id=apple_id, company_name='apple inc', product_name='Phone', price=999,
+                               rating=4.5, reviews=10)
+        result = ingest_products(scraped('APPLE', ('Phone', 899)), sync_remote=False)
+        self.assertEqual(result.counts()['changed_count'], 1)
+        self.assertEqual(Product.objects.get().company_name, 'Apple')
+
+
+class GenerateCatalogTests(QueueTestCase):
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch('api.management.commands.generate_catalog.queue', self.queue)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def generate(self, *args):
+        call_command('generate_catalog', '--local', '--companies', '5', '--products', '200', '--batch-size', '50',
+                     *args, stderr=io.StringIO())
+
+    def test_rerun_refuses_or_replaces(self):
+        self.generate()
+        self.assertEqual(Product.objects.count(), 200)
+        with self.assertRaisesMessage(CommandError, '--replace'):
+            self.generate()
+        self.assertEqual(Product.objects.count(), 200)
+
+        self.generate('--replace')
+        self.assertEqual(Product.objects.count(), 200)
+        self.assertEqual(Company.objects.count(), 5)
+        self.assertIsNone(self.queue.lease_holder())
+
+    def test_stops_when_the_lease_is_lost(self):
+        lost = threading.Event()
+        lost.set()
+        heartbeat = mock.MagicMock()
+        heartbeat.return_value.__enter__.return_value = lost
+        with mock.patch.object(self.queue, 'heartbeat', heartbeat), \
+                self.assertRaisesMessage(CommandError, 'Lost the ingest writer lease'):
+            self.generate()
+        self.assertFalse(Product.objects.exists())
+
+
+@override_settings(PRODUCT_SNAPSHOT_CHECK_SECONDS=0)
+class SnapshotTests(QueueTestCase):
+    def setUp(self):
+        super().setUp()
+        self.snapshot = ProductSnapshot()
+        with self.captureOnCommitCallbacks(execute=True):
+            ingest_products(scraped('Apple', ('Phone', 999), ('Watch', 399)) + scraped('Sony', ('TV', 499)),
+                            sync_remote=False)
+
+    def names(self):
+        columns = self.snapshot.get()
+        return sorted(columns.product_names[code] for code in columns.product)
+
+    def test_ingest_updates_show_up_incrementally(self):
+        self.assertEqual(self.names(), ['Phone', 'TV', 'Watch'])
+        with self.captureOnCommitCallbacks(execute=True):
+            ingest_products(scraped('Apple', ('Phone', 899), ('Pad', 599)), sync_remote=False)
+        self.assertEqual(self.names(), ['Pad', 'Phone', 'TV', 'Watch'])
+        apple = Company.objects.get(name='Apple').id
+        # Ties on rating and reviews go to the lowest id
+        best = self.snapshot.best([apple])[apple]
+        self.assertEqual((best['product_name'], best['price']), ('Phone', 899))
+        self.assertEqual(self.snapshot.stats_counters['incremental_refreshes'], 1)
+
+    @mock.patch('api.views.TEST_MODE', True)
+    @override_settings(INGEST_INLINE_DRAIN=False)
+    def test_scrape_delete_and_test_mode_products_show_up(self):
+        self.assertEqual(self.names(), ['Phone', 'TV', 'Watch'])
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/scrape/', {'companies': ['apple']}, content_type='application/json')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(self.names(), ['TV'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ingest_queue.drain('writer')
+        self.assertEqual(self.names(), ['Sample Product from Apple', 'TV'])
+
+
+@override_settings(SSE_MAX_SECONDS=2, SSE_POLL_INTERVAL=0.05, SSE_KEEPALIVE_SECONDS=0.2)
+class ScrapeEventsTests(QueueTestCase):
+    def setUp(self):
+        super().setUp()
+        self.apple_id, _ = get_or_create_companies(['Apple'])['Apple']
+        # Warm the alias map here; the ASGI app resolves names in another thread
+        companies.resolve('Apple')
+
+    def stream(self, query, app=scrape_events, path='/api/scrape/events/'):
+        messages = []
+
+        async def receive():
+            await asyncio.sleep(10)
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            messages.append(message)
+
+        scope = {'type': 'http', 'method': 'GET', 'path': path, 'query_string': query.encode(), 'headers': []}
+        asyncio.run(app(scope, receive, send))
+        body = b''.join(message.get('body', b'') for message in messages).decode()
+        return messages[0]['status'], [line[len('event: '):] for line in body.splitlines()
+                                       if line.startswith('event: ')]
+
+    def test_scrape_returns_the_canonical_names_and_ids_to_watch(self):
+        with mock.patch('api.views.TEST_MODE', True):
+            response = self.client.post('/api/scrape/', {'companies': ['APPLE']}, content_type='application/json')
+        self.assertEqual(response.json()['companies'], ['Apple'])
+        self.assertEqual(response.json()['company_ids'], {'Apple': self.apple_id})
+
+    def test_watch_by_company_id(self):
+        events.publish({self.apple_id: {'company_id': self.apple_id, 'company_name': 'Apple'}})
+        self.assertEqual(self.stream(f'company_ids={self.apple_id}&since=0'), (200, ['watching', 'scrape', 'done']))
+
+    def test_watch_by_other_spelling(self):
+        events.publish({self.apple_id: {'company_id': self.apple_id, 'company_name': 'Apple'}})
+        self.assertEqual(self.stream('companies=apple&since=0'), (200, ['watching', 'scrape', 'done']))
+
+    def test_waits_for_missing_events_until_timeout(self):
+        self.assertEqual(self.stream(f'company_ids={self.apple_id}'), (200, ['watching', 'timeout']))
+
+    def test_rejects_bad_ids(self):
+        self.assertEqual(self.stream('company_ids=apple')[0], 400)
+
+    @override_settings(PRODUCT_SNAPSHOT_ENABLED=False)
+    def test_asgi_app_routes_the_path_with_or_without_trailing_slash(self):
+        from pullup.asgi import application
+
+        for path in ('/api/scrape/events/', '/api/scrape/events'):
+            self.assertEqual(self.stream('company_ids=apple', application, path)[0], 400)
+
+
+class PopularityTests(CacheTestCase):
+    def test_concurrent_hits_are_all_counted(self):
+        def hits():
+            for _ in range(25):
+                freshness.record_hits([1, 2])
+
+        threads = [threading.Thread(target=hits) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        freshness.record_hits([2, 2, 3])
+        self.assertEqual(freshness.popularity(company_ids=[1, 2, 3, 4]), {1: 100, 2: 101, 3: 1})
+
+    def test_hits_are_summed_over_the_window(self):
+        with mock.patch('api.freshness._hour', return_value=1000):
+            freshness.record_hits([1])
+        with mock.patch('api.freshness._hour', return_value=1010):
+            freshness.record_hits([1, 2])
+            self.assertEqual(freshness.popularity(24, company_ids=[1, 2]), {1: 2, 2: 1})
+            self.assertEqual(freshness.popularity(5, company_ids=[1, 2]), {1: 1, 2: 1})
+
+    def test_whole_window_reads_only_requested_companies(self):
+        with mock.patch('api.freshness._hour', return_value=1000):
+            freshness.record_hits([1, 2])
+            freshness.record_hits([2])
+        with mock.patch('api.freshness._hour', return_value=1010):
+            freshness.record_hits([2, 3])
+            self.assertEqual(freshness.requested_companies(24), {1, 2, 3})
+            self.assertEqual(freshness.requested_companies(5), {2, 3})
+            self.assertEqual(freshness.popularity(24), {1: 1, 2: 3, 3: 1})
+
+    def test_refresh_candidates_rank_stale_companies_by_hits(self):
+        ids = {name: match[0] for name, match in get_or_create_companies(['Apple', 'Sony', 'Dell']).items()}
+        freshness.record_hits([ids['Apple'], ids['Sony']])
+        freshness.record_hits([ids['Sony']])
+        Company.objects.filter(id=ids['Apple']).update(last_scraped_at=timezone.now())
+        self.assertEqual([c[1] for c in freshness.refresh_candidates()], ['Sony'])
+
+
+class CompanyIndexTests(CacheTestCase):
+    def setUp(self):
+        super().setUp()
+        self.index = CompanyIndex()
+        self.ids = {name: match[0] for name, match in get_or_create_companies(['Samsung', 'Sony']).items()}
+
+    def names(self, query):
+        return [s['company_name'] for s in self.index.suggest(query) if s['match'] == 'prefix']
+
+    def test_new_companies_and_aliases_are_added_in_place(self):
+        self.assertEqual(self.names('sam'), ['Samsung'])
+        data = self.index._data
+        get_or_create_companies(['Samsung Electronics', 'Dell'])
+        self.assertEqual(self.names('dell'), ['Dell'])
+        self.assertEqual(self.names('samsung elec'), ['Samsung Electronics'])
+        self.assertIs(self.index._data, data)
+
+    def test_deleted_company_leaves_the_index(self):
+        self.assertEqual(self.index.resolve('samsnug'), (self.ids['Samsung'], 'Samsung'))
+        Company.objects.filter(id=self.ids['Samsung']).delete()
+        companies.invalidate()
+        self.assertEqual(self.names('sam'), [])
+        self.assertIsNone(self.index.resolve('samsnug'))
+        self.assertEqual(self.names('son'), ['Sony'])
+
+    def test_renamed_company_resolves_only_under_its_new_name(self):
+        self.assertEqual(self.names('sony'), ['Sony'])
+        Company.objects.filter(id=self.ids['Sony']).update(name='Sony Group')
+        companies.invalidate()
+        self.assertEqual(self.names('sony'), ['Sony Group'])
+        self.assertEqual(self.index.resolve('Sony Grup'), (self.ids['Sony'], 'Sony Group'))
+
+    def test_merged_aliases_move_to_the_surviving_company(self):
+        get_or_create_companies(['Samsung Electronics'])
+        self.assertEqual(self.names('samsung elec'), ['Samsung Electronics'])
+        survivor = Company.objects.get(id=self.ids['Sony'])
+        survivor.aliases = ['Samsung Electronics']
+        survivor.save()
+        Company.objects.filter(id__in=[self.ids['Samsung'], companies.resolve('Samsung Electronics')[0]]).delete()
+        companies.invalidate()
+        self.assertEqual(self.names('samsung elec'), ['Sony'])
+
+    @override_settings(PRODUCT_SNAPSHOT_CHECK_SECONDS=0)
+    def test_admin_rename_and_delete_refresh_products_best_rows_and_snapshot(self):
+        ingest_products(scraped('Samsung', ('Galaxy', 899)) + scraped('Sony', ('TV', 499)), sync_remote=False)
+        snapshot = ProductSnapshot()
+        self.assertEqual(snapshot.best([self.ids['Samsung']])[self.ids['Samsung']]['company_name'], 'Samsung')
+        model_admin = admin.site._registry[Company]
+        request = RequestFactory().post('/admin/')
+
+        samsung = Company.objects.get(id=self.ids['Samsung'])
+        samsung.name = 'Samsung Electronics'
+        with self.captureOnCommitCallbacks(execute=True):
+            model_admin.save_model(request, samsung, SimpleNamespace(changed_data=['name']), True)
+        self.assertEqual(Product.objects.get(product_name='Galaxy').company_name, 'Samsung Electronics')
+        self.assertEqual(CompanyBestProduct.objects.get(company_id=samsung.id).company_name, 'Samsung Electronics')
+        self.assertEqual(snapshot.best([samsung.id])[samsung.id]['company_name'], 'Samsung Electronics')
+        self.assertEqual(self.names('samsung'), ['Samsung Electronics'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            model_admin.delete_queryset(request, Company.objects.filter(id=self.ids['Sony']))
+        self.assertFalse(CompanyBestProduct.objects.filter(company_id=self.ids['Sony']).exists())
+        self.assertEqual(snapshot.best([self.ids['Sony']]), {})
+        self.assertEqual(self.names('son'), [])
+
+
+class ProfilingTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp, ignore_errors=True)
+        settings = override_settings(PROFILING_ENABLED=True, PROFILING_TOKEN='secret', PROFILING_SAMPLE_RATE=0,
+                                     PROFILING_MAX_TRACES=2, PROFILING_DIR=self.tmp)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        def view(request):
+            Product.objects.count()
+            return HttpResponse('ok')
+
+        self.middleware = ProfilingMiddleware(view)
+
+    def get(self, **headers):
+        request = RequestFactory().get('/api/compare/', **headers)
+        request.user = SimpleNamespace(is_active=True, is_staff=False)
+        return self.middleware(request)
+
+    def test_flag_without_staff_or_token_is_ignored(self):
+        for headers in ({}, {'HTTP_X_PROFILE_TOKEN': 'secreT'}, {'HTTP_X_PROFILE_TOKEN': 'sécret'}):
+            response = self.get(HTTP_X_PROFILE='1', **headers)
+            self.assertNotIn('X-Profile-Id', response)
+        self.assertEqual(RequestProfile.objects.count(), 0)
+
+    def test_token_profiles_the_request_with_its_sql(self):
+        response = self.get(HTTP_X_PROFILE='1', HTTP_X_PROFILE_TOKEN='secret')
+        profile = RequestProfile.objects.get(profile_id=response['X-Profile-Id'])
+        self.assertEqual((profile.trigger, profile.status_code, profile.path), ('token', 200, '/api/compare/'))
+        self.assertGreaterEqual(profile.sql_count, 1)
+        self.assertTrue(os.path.exists(profile.stats_file))
+        with open(profile.timeline_file) as f:
+            timeline = json.load(f)
+        self.assertTrue(any(event['kind'] == 'sql' and 'api_product' in event['label'] for event in timeline['events']))
+        # The SQL wrapper is only installed for the profiled request
+        self.assertNotIn(
+            'api.profiling', [wrapper.__module__ for wrapper in connection.execute_wrappers]
+        )
+
+    def test_oldest_traces_beyond_the_limit_are_deleted(self):
+        for _ in range(3):
+            self.get(HTTP_X_PROFILE='1', HTTP_X_PROFILE_TOKEN='secret')
+        self.assertEqual(RequestProfile.objects.count(), 2)
+        self.assertEqual(len([name for name in os.listdir(self.tmp) if name.endswith('.json')]), 2)
+
+
+class InsightsTests(CacheTestCase):
+    def test_vectorized_metrics_match_a_per_product_loop(self):
+        rng = np.random.default_rng(1)
+        company = rng.integers(3, size=40).astype(np.int32)
+        price = rng.uniform(10, 500, 40).round(2)
+        rating = rng.uniform(1, 5, 40).round(1)
+        reviews = rng.integers(0, 100, 40).astype(np.float64)
+        metrics = compute_insights(company, price, rating, reviews, 3)
+
+        prior_weight = float(np.median(reviews))
+        for i in range(40):
+            others = [rating[j] for j in range(40) if company[j] != company[i]]
+            mean = sum(others) / len(others)
+            std = (sum((r - mean) ** 2 for r in others) / len(others)) ** 0.5
+            self.assertAlmostEqual(metrics['rating_z'][i], (rating[i] - mean) / std)
+            self.assertAlmostEqual(metrics['price_percentile'][i], 100 * sum(p <= price[i] for p in price) / 40)
+            self.assertAlmostEqual(
+                metrics['weighted_rating'][i],
+                (reviews[i] * rating[i] + prior_weight * rating.mean()) / (reviews[i] + prior_weight)
+            )
+        for code in range(3):
+            mine = company == code
+            self.assertAlmostEqual(metrics['company']['avg_price'][code], price[mine].mean())
+            self.assertEqual(metrics['company']['total_reviews'][code], reviews[mine].sum())
+
+    def test_insights_cover_known_companies_and_report_missing_ones(self):
+        ingest_products(scraped('Apple', ('iPhone', 999), ('iPad', 499))
+                        + scraped('Samsung', ('Galaxy', 899)), sync_remote=False)
+        insights = build_insights(['apple', 'Samsung', 'Nokia'])
+        self.assertEqual(insights['total_products'], 3)
+        self.assertEqual([row['company_name'] for row in insights['companies']], ['Apple', 'Samsung'])
+        self.assertEqual(insights['missing_companies'], ['Nokia'])
+        # Every competitor has the same rating, so z-scores are undefined
+        self.assertEqual([row['mean_rating_z'] for row in insights['companies']], [None, None])
+
+        response = self.client.get('/api/compare/insights/?companies=Apple,Samsung&limit=-5')
+        self.assertEqual(len(response.json()['products']), 1)
+
+        alone = build_insights(['Apple'], limit=1)
+        self.assertEqual(len(alone['products']), 1)
+        # No competitors, so no z-scores
+        self.assertIsNone(alone['companies'][0]['mean_rating_z'])
+        self.assertIsNone(alone['products'][0]['rating_z'])
+
+
+class CompanyAliasTests(CacheTestCase):
+    def test_spelling_variants_share_one_company(self):
+        ingest_products(scraped('samsung', ('Galaxy', 899)) + scraped(' SAMSUNG ', ('Tab', 649))
+                        + scraped('Samsung.', ('Watch', 249)), sync_remote=False)
+        company = Company.objects.get()
+        self.assertEqual(companies.alias_key(company.name), 'samsung')
+        self.assertEqual(set(Product.objects.values_list('company_id', 'company_name')), {(company.id, company.name)})
+        self.assertEqual(companies.canonical_names(['samsung', 'SAMSUNG', 'nokia']), [company.name, 'Nokia'])
+
+    def test_stored_aliases_resolve_after_invalidate(self):
+        company = Company.objects.create(name='Hewlett Packard')
+        self.assertIsNone(companies.resolve('HP'))
+        company.aliases = ['HP']
+        company.save()
+        # Another worker's map stays cached until the shared version moves
+        self.assertIsNone(companies.resolve('hp'))
+        companies.invalidate()
+        self.assertEqual(companies.resolve('hp'), (company.id, 'Hewlett Packard'))
+        self.assertEqual(companies.company_ids(['HP', 'hewlett-packard', 'Dell']), [company.id])
+        self.assertEqual(companies.query_names(['hp']), ['HP', 'Hewlett Packard'])
+
+    def test_editing_company_name_moves_the_product(self):
+        ingest_products(scraped('Apple', ('Phone', 999), ('Watch', 399)) + scraped('Sony', ('TV', 499)),
+                        sync_remote=False)
+        apple, sony = Company.objects.get(name='Apple'), Company.objects.get(name='Sony')
+        phone = Product.objects.get(product_name='Phone')
+        self.assertEqual(CompanyBestProduct.objects.get(company=apple).product_id, phone.id)
+
+        response = self.client.patch(f'/api/products/{phone.id}/', {'company_name': 'SONY'},
+                                     content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        phone.refresh_from_db()
+        self.assertEqual((phone.company_id, phone.company_name), (sony.id, 'Sony'))
+        # Rating and reviews tie, so the lowest id is each company's best
+        self.assertEqual(CompanyBestProduct.objects.get(company=apple).product_name, 'Watch')
+        self.assertEqual(CompanyBestProduct.objects.get(company=sony).product_id, phone.id)
+
+        phone.price = 899
+        phone.save()
+        self.assertEqual(phone.company_id, sony.id)
+
+
+@override_settings(MAKE_WEBHOOK_URL='https://make.invalid/hook', MAKE_BATCH_SIZE=2)
+class BatchDispatchTests(QueueTestCase):
+    def post(self, statuses):
+        responses = [SimpleNamespace(status_code=status, text='', json=lambda: {}) for status in statuses]
+        return mock.patch('api.scraping.requests.post', side_effect=responses)
+
+    def test_companies_are_sent_in_groups_with_their_trace_ids(self):
+        with self.post([200, 500]) as post:
+            successful, failed, trace_ids = dispatch_scrape(['Apple', 'Sony', 'Dell'], 'https://cb.invalid/')
+        payloads = [call.kwargs['json'] for call in post.call_args_list]
+        self.assertEqual([payload['companyNames'] for payload in payloads], [['Apple', 'Sony'], ['Dell']])
+        self.assertEqual(payloads[0]['traceIds'], {name: trace_ids[name] for name in ('Apple', 'Sony')})
+        # A failed group reports each of its companies
+        self.assertEqual((successful, [entry['company'] for entry in failed]), (['Apple', 'Sony'], ['Dell']))
+        self.assertEqual(scraping.calls_this_hour(), 2)
+
+    def test_batch_size_one_keeps_the_single_company_payload(self):
+        with self.post([200, 200]) as post:
+            dispatch_scrape(['Apple', 'Sony'], 'https://cb.invalid/', batch_size=1)
+        self.assertEqual([set(call.kwargs['json']) for call in post.call_args_list],
+                         [{'companyName', 'traceId'}] * 2)
+
+    @override_settings(INGEST_INLINE_DRAIN=True)
+    def test_batched_callback_writes_each_result_set_under_its_company(self):
+        payload = {'results': [
+            {'companyName': 'Apple', 'products': [{'product_name': 'Phone', 'price': '$10', 'rating': 4, 'reviews': '1'}]},
+            {'companyName': 'Sony', 'products': [{'product_name': 'TV', 'price': '$20', 'rating': 4, 'reviews': '2'}]},
+            {'companyName': 'Dell', 'products': [], 'error': 'blocked'},
+        ]}
+        with mock.patch('api.supabase_client.supabase', FakeSupabase()):
+            response = self.client.post('/api/webhook/scrape-callback/', payload, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([entry['company'] for entry in response.json()['failed_companies']], ['Dell'])
+        self.assertEqual(sorted(Product.objects.values_list('company_name', 'product_name')),
+                         [('Apple', 'Phone'), ('Sony', 'TV')])
+
+
+class StandInTests(CacheTestCase):
+    def setUp(self):
+        super().setUp()
+        self.supabase_standin = SupabaseStandIn().start()
+        self.addCleanup(self.supabase_standin.stop)
+
+    def test_supabase_client_round_trips_through_the_standin(self):
+        client = ResilientSupabase(self.supabase_standin.url, 'header.payload.signature', read_retries=0)
+        products = client.table('products')
+        client.execute(products.insert(
+            [{'company_name': 'Apple', 'product_name': 'Phone', 'price': 999, 'rating': 4.5, 'reviews': 10},
+             {'company_name': "Apple, Inc", 'product_name': 'Pad', 'price': 499, 'rating': 4.2, 'reviews': 5},
+             {'company_name': 'Sony', 'product_name': 'TV', 'price': 799, 'rating': 4.0, 'reviews': 3}],
+            returning='minimal'
+        ))
+        rows = client.execute(products.select('product_name').in_('company_name', ['Apple', 'Apple, Inc']), read=True)
+        self.assertEqual([row['product_name'] for row in rows.data], ['Phone', 'Pad'])
+
+        client.execute(products.update({'price': 899}).eq('product_name', 'Phone'))
+        client.execute(products.delete().eq('company_name', 'Sony'))
+        rows = client.execute(products.select('*'), read=True).data
+        self.assertEqual([(row['product_name'], row['price']) for row in rows], [('Phone', 899), ('Pad', 499)])
+
+        with self.assertRaises(APIError):
+            client.execute(products.select('*').eq('colour', 'red'), read=True)
+
+    def test_make_standin_calls_back_per_company(self):
+        delivered = threading.Event()
+        bodies = []
+
+        def callback(url, json=None, timeout=None):
+            bodies.append((url, json))
+            delivered.set()
+
+        make = MakeStandIn(callback_url='http://backend.invalid/cb', callback_delay=0, products_per_company=3).start()
+        self.addCleanup(make.stop)
+        session = requests.Session()
+        session.trust_env = False
+        with mock.patch('api.standins.requests.post', side_effect=callback):
+            response = session.post(make.webhook_url, json={'companyNames': ['Apple', 'Sony']})
+            self.assertTrue(delivered.wait(5))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((make.calls, make.companies), (1, 2))
+        url, body = bodies[0]
+        self.assertEqual(url, 'http://backend.invalid/cb')
+        self.assertEqual([(result['companyName'], len(result['products'])) for result in body['results']],
+                         [('Apple', 3), ('Sony', 3)])
+
+
+class BestProductTests(CacheTestCase):
+    def ingest(self, company, *products):
+        ingest_products([
+            normalize_product({'company_name': company, 'product_name': name, 'price': 10, 'rating': rating,
+                               'reviews': reviews})
+            for name, rating, reviews in products
+        ], sync_remote=False)
+
+    def best(self, company):
+        company_id = companies.resolve(company)[0]
+        incremental = best_products.lookup([company_id])[company_id].product_name
+        best_products.recompute([company_id])
+        # The incrementally maintained row matches a rebuild from scratch
+        self.assertEqual(best_products.lookup([company_id])[company_id].product_name, incremental)
+        return incremental
+
+    def test_best_row_follows_writes(self):
+        self.ingest('Apple', ('Phone', 4.5, 100), ('Pad', 4.5, 50), ('Watch', 4.0, 900))
+        self.assertEqual(self.best('Apple'), 'Phone')
+        self.ingest('Apple', ('Laptop', 4.8, 10))
+        self.assertEqual(self.best('Apple'), 'Laptop')
+        # The leader getting worse hands the lead to the next product
+        self.ingest('Apple', ('Laptop', 3.0, 10))
+        self.assertEqual(self.best('Apple'), 'Phone')
+        self.ingest('Apple', ('Pad', 4.5, 100))
+        self.assertEqual(self.best('Apple'), 'Phone')
+
+    def test_recompute_drops_companies_without_products(self):
+        self.ingest('Sony', ('TV', 4.0, 1))
+        company_id = companies.resolve('Sony')[0]
+        Product.objects.filter(company_id=company_id).delete()
+        best_products.recompute([company_id])
+        self.assertEqual(best_products.lookup([company_id]), {})
+
+
+@override_settings(PRODUCT_SNAPSHOT_CHECK_SECONDS=0)
+class CompareBatchTests(CacheTestCase):
+    def setUp(self):
+        super().setUp()
+        with self.captureOnCommitCallbacks(execute=True):
+            ingest_products(scraped('Apple', ('iPhone', 999)) + scraped('Samsung', ('Galaxy', 899))
+                            + scraped('Sony', ('TV', 799)), sync_remote=False)
+        self.supabase = FakeSupabase()
+        self.supabase.rows.append({'company_name': 'Nokia', 'product_name': '3310', 'price': 50, 'rating': 4.9,
+                                   'reviews': 7})
+        patcher = mock.patch('api.views.supabase', self.supabase)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def post(self, body):
+        return self.client.post('/api/compare/batch/', body, content_type='application/json')
+
+    def test_groups_are_answered_in_order_with_per_group_errors(self):
+        response = self.post({'groups': [['apple', 'Samsnug'], [], ['Sony', 'Nokia', 'Acme'], ['Acme']]})
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEqual([result['status'] for result in results], ['success', 'error', 'success', 'error'])
+        self.assertEqual([item['product_name'] for item in results[0]['data']], ['iPhone', 'Galaxy'])
+        self.assertEqual(results[0]['resolved_companies'], {'Samsnug': 'Samsung'})
+        self.assertEqual([item['company_name'] for item in results[2]['data']], ['Sony', 'Nokia'])
+        self.assertEqual(results[2]['missing_companies'], ['Acme'])
+
+    def test_all_groups_share_one_load(self):
+        groups = [['Apple', 'Sony'], ['Samsung', 'Nokia'], ['Nokia', 'Acme']] * 20
+        with mock.patch.object(self.supabase, 'execute', wraps=self.supabase.execute) as execute:
+            response = self.post({'groups': groups})
+        self.assertEqual(len(response.json()['results']), 60)
+        self.assertEqual(execute.call_count, 1)
+
+    @override_settings(COMPARE_BATCH_MAX_GROUPS=2)
+    def test_rejects_oversized_batches(self):
+        self.assertEqual(self.post({'groups': [['Apple']] * 3}).status_code, 400)
+
+
+class SQLiteProfileTests(TestCase):
+    def open(self, path, read_only=False):
+        wrapper = SQLiteDatabaseWrapper({**connection.settings_dict, 'NAME': path, 'READ_ONLY': read_only},
+                                        alias=f'tmp-{read_only}')
+        self.addCleanup(wrapper.close)
+        wrapper.ensure_connection()
+        return wrapper.connection
+
+    def test_new_connections_get_the_pragmas(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp, ignore_errors=True)
+        path = os.path.join(tmp, 'db.sqlite3')
+        with override_settings(SQLITE_PRAGMAS={'journal_mode': 'WAL', 'synchronous': 'NORMAL',
+                                               'busy_timeout': 1234}):
+            primary = self.open(path)
+            replica = self.open(path, read_only=True)
+        self.assertEqual(primary.execute('PRAGMA journal_mode').fetchone()[0], 'wal')
+        self.assertEqual(primary.execute('PRAGMA synchronous').fetchone()[0], 1)
+        self.assertEqual(primary.execute('PRAGMA busy_timeout').fetchone()[0], 1234)
+        primary.execute('CREATE TABLE t (x)')
+        primary.commit()
+
+        self.assertEqual(replica.execute('SELECT COUNT(*) FROM t').fetchone()[0], 0)
+        with self.assertRaises(sqlite3.OperationalError):
+            replica.execute('INSERT INTO t VALUES (1)')
+
+    def test_reads_leave_the_primary_only_inside_transactions(self):
+        router = ReadReplicaRouter()
+        self.assertEqual(router.db_for_write(Product), 'default')
+        with mock.patch.object(connections['default'], 'in_atomic_block', False):
+            self.assertEqual(router.db_for_read(Product), 'replica')
+        with mock.patch.object(connections['default'], 'in_atomic_block', True):
+            self.assertEqual(router.db_for_read(Product), 'default')
+        self.assertFalse(router.allow_migrate('replica', 'api'))
+
+
+class ProductRowSerializerTests(CacheTestCase):
+    def setUp(self):
+        super().setUp()
+        ingest_products(scraped('Apple', ('iPhone', 999.5), ('iPad', 499)) + scraped('Sony', ('TV', 1234.567)),
+                        sync_remote=False)
+        Product.objects.filter(product_name='iPad').update(updated_at=timezone.now().replace(microsecond=0))
+
+    def assert_matches_model_serializer(self):
+        reader = ProductRowSerializer()
+        rows = list(Product.objects.order_by('id').values_list(*reader.columns))
+        expected = ProductSerializer(Product.objects.order_by('id'), many=True).data
+        self.assertEqual(json.loads(json.dumps(reader.to_representation(rows))), json.loads(json.dumps(expected)))
+
+    def test_rows_match_the_model_serializer(self):
+        self.assert_matches_model_serializer()
+
+    @override_settings(TIME_ZONE='Asia/Kolkata')
+    def test_rows_match_the_model_serializer_outside_utc(self):
+        self.assert_matches_model_serializer()
+
+    def test_cursor_pages_cover_every_product_once(self):
+        seen = []
+        url = '/api/products/?page_size=2'
+        while url:
+            page = self.client.get(url).json()
+            seen.extend(product['product_name'] for product in page['results'])
+            url = page['next']
+        self.assertEqual(seen, ['TV', 'iPad', 'iPhone'])
+        product = Product.objects.get(product_name='TV')
+        self.assertEqual(self.client.get(f'/api/products/{product.id}/').json()['price'], '1234.57')
+        self.assertEqual(self.client.get('/api/products/0/').status_code, 404)
+
+
+@override_settings(MAKE_WEBHOOK_URL='https://make.invalid/hook', MAKE_BATCH_SIZE=1, INGEST_INLINE_DRAIN=True,
+                   SCRAPE_TRACE_MATCH_SECONDS=600)
+class ScrapeTracingTests(QueueTestCase):
+    def dispatch(self, *names):
+        response = SimpleNamespace(status_code=202, text='', json=lambda: {})
+        with mock.patch('api.scraping.requests.post', return_value=response):
+            return dispatch_scrape(list(names), 'https://cb.invalid/')[2]
+
+    def callback(self, products, **headers):
+        with mock.patch('api.supabase_client.supabase', FakeSupabase()):
+            return self.client.post('/api/webhook/scrape-callback/', products, content_type='application/json',
+                                    **headers)
+
+    def test_trace_runs_from_dispatch_to_written(self):
+        get_or_create_companies(['Apple'])
+        trace_id = self.dispatch('Apple')['Apple']
+        self.assertEqual(ScrapeTrace.objects.get(trace_id=trace_id).status, 'dispatched')
+
+        products = [{'company_name': 'Apple', 'product_name': 'Phone', 'price': '$10', 'rating': 4, 'reviews': '1'}]
+        response = self.callback(products, HTTP_X_TRACE_ID=trace_id)
+        self.assertEqual(response.json()['trace_ids'], [trace_id])
+        trace = tracing.detail(trace_id)
+        self.assertEqual((trace['status'], trace['company_id']), ('written', companies.resolve('Apple')[0]))
+        for span in ('dispatch_ms', 'make_ms', 'parse_ms', 'validate_ms', 'queue_ms', 'local_write_ms', 'total_ms'):
+            self.assertIsNotNone(trace[span], span)
+        self.assertGreaterEqual(trace['total_ms'], trace['make_ms'])
+
+        latency = self.client.get('/api/scrape/latency/?company=apple').json()
+        self.assertEqual(latency['aggregate']['statuses'], {'written': 1})
+        self.assertEqual(latency['companies']['Apple']['total']['count'], 1)
+
+    def test_callbacks_without_trace_ids_match_the_latest_waiting_trace(self):
+        self.dispatch('Sony')
+        latest = self.dispatch('Sony')['Sony']
+        other = self.dispatch('Dell')['Dell']
+        response = self.callback([{'company_name': 'sony', 'product_name': 'TV', 'price': '$5', 'rating': 4,
+                                   'reviews': '2'}])
+        self.assertEqual(response.json()['trace_ids'], [latest])
+        self.assertEqual(tracing.detail(other)['status'], 'dispatched')
+
+    def test_tracing_errors_never_fail_the_callback(self):
+        with mock.patch('api.tracing.ScrapeTrace.objects.filter', side_effect=RuntimeError('db gone')):
+            response = self.callback([{'company_name': 'Apple', 'product_name': 'Phone', 'price': '$10',
+                                       'rating': 4, 'reviews': '1'}])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['trace_ids'], [])
@@ -0,0 +1,172 @@
+"""
+Token-bucket throttling for the scrape endpoints.
+
+Each bucket is two numbers (tokens left, last refill time) kept in the shared
+cache, so checking a request is O(1) regardless of traffic and the budget is
+enforced across all worker processes. Rates come from TOKEN_BUCKET_RATES as
+"<capacity>/<period>"; a full bucket refills over one period.
+"""
+import time
+from urllib.parse import quote, unquote
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured, ValidationError
+from rest_framework.throttling import BaseThrottle
+
+from .cache import update_many
+from .companies import canonical_names, validate_company_name
+
+PERIODS = {'s': 1, 'sec': 1, 'second': 1, 'm': 60, 'min': 60, 'minute': 60,
+           'h': 3600, 'hour': 3600, 'd': 86400, 'day': 86400}
+
+
+def parse_rate(rate):
+    """Parse '30/hour' into (capacity, tokens per second)."""
+    try:
+        capacity, period = rate.split('/')
+        capacity = int(capacity)
+        seconds = PERIODS[period.strip().lower()]
+    except (ValueError, KeyError):
+        raise ImproperlyConfigured(f"Invalid token bucket rate '{rate}'")
+    return capacity, capacity / seconds
+
+
+def take_tokens(buckets, now=None):
+    """
+    Take tokens from every bucket or from none of them.
+
+    buckets is a list of (key, capacity, refill_rate, cost). Returns
+    (allowed, wait_seconds, states) where states maps each key to
+    (capacity, remaining tokens).
+    """
+    now = time.time() if now is None else now
+    timeout = max(int(capacity / rate) + 1 for _, capacity, rate, _ in buckets)
+
+    def consume(current):
+        levels = {}
+        wait = 0.0
+        for key, capacity, rate, cost in buckets:
+            tokens, updated = current.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            levels[key] = tokens
+            if tokens < cost:
+                wait = max(wait, (min(cost, capacity) - tokens) / rate)
+        allowed = wait == 0
+        if allowed:
+            for key, capacity, rate, cost in buckets:
+                levels[key] -= cost
+        new_values = {key: (levels[key], now) for key in levels}
+        states = {key: (capacity, levels[key]) for key, capacity, _, _ in buckets}
+        return new_values, (allowed, wait, states)
+
+    return update_many(cache, [key for key, _, _, _ in buckets], consume, timeout)
+
+
+def requested_companies(request):
+    """
+    Canonical names of the companies a scrape request asks for, or None when
+    scrape_products will reject the request, so a 400 spends no tokens.
+    """
+    if request.method == 'POST':
+        if not isinstance(request.data, dict):
+            return None
+        companies = request.data.get('companies', [])
+    else:
+        companies_param = request.GET.get('companies', '')
+        companies = [c.strip() for c in companies_param.split(',')] if companies_param else []
+    if not companies or not isinstance(companies, list):
+        return None
+    try:
+        return canonical_names([validate_company_name(company) for company in companies])
+    except ValidationError:
+        return None
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """Per-client token bucket for one endpoint scope."""
+    scope = None
+
+    def get_rate(self, scope=None):
+        scope = scope or self.scope
+        rates = getattr(settings, 'TOKEN_BUCKET_RATES', {})
+        if scope not in rates:
+            raise ImproperlyConfigured(f"No token bucket rate set for '{scope}' scope")
+        return parse_rate(rates[scope])
+
+    def get_cost(self, request, view):
+        return 1
+
+    def get_buckets(self, request, view):
+        capacity, rate = self.get_rate()
+        key = f"throttle:{self.scope}:{self.get_ident(request)}"
+        return [(key, capacity, rate, self.get_cost(request, view))]
+
+    def allow_request(self, request, view):
+        buckets = self.get_buckets(request, view)
+        if not buckets:
+            return True
+        allowed, self._wait, states = take_tokens(buckets)
+        # Exposed to RateLimitHeadersMiddleware via the underlying HttpRequest
+        ratelimits = getattr(request._request, 'ratelimits', {})
+        for key, (capacity, remaining) in states.items():
+            ratelimits[key] = (capacity, max(int(remaining), 0))
+        request._request.ratelimits = ratelimits
+        return allowed
+
+    def wait(self):
+        return self._wait
+
+
+class ScrapeRateThrottle(TokenBucketThrottle):
+    """
+    Scrape budget per client plus one per company shared by all clients, so
+    one company can't be rescraped in a loop. Each requested company costs
+    the client one token, since each is a Make.com run.
+
+    Both kinds of bucket are checked in one take_tokens() call: DRF asks
+    every throttle class even after one denies, so separate classes would
+    still spend tokens on a rejected request.
+    """
+    scope = 'scrape'
+    company_scope = 'scrape_company'
+
+    def get_buckets(self, request, view):
+        companies = requested_companies(request)
+        if companies is None:
+            return []
+        companies = sorted(set(companies))
+        capacity, rate = self.get_rate()
+        buckets = [(f"throttle:{self.scope}:{self.get_ident(request)}", capacity, rate, max(len(companies), 1))]
+        capacity, rate = self.get_rate(self.company_scope)
+        buckets.extend(
+            (f"throttle:{self.company_scope}:{quote(company)}", capacity, rate, 1) for company in companies
+        )
+        return buckets
+
+
+class FetchRateThrottle(TokenBucketThrottle):
+    scope = 'fetch'
+
+
+class RateLimitHeadersMiddleware:
+    """Add X-RateLimit-* headers describing the tightest bucket a request used."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        ratelimits = getattr(request, 'ratelimits', None)
+        if ratelimits:
+            key, (capacity, remaining) = min(ratelimits.items(), key=lambda item: item[1][1])
+            response['X-RateLimit-Limit'] = str(capacity)
+            response['X-RateLimit-Remaining'] = str(remaining)
+            response['X-RateLimit-Scope'] = key.split(':')[1]
+            companies = [
+                f"{unquote(k.split(':', 2)[2])}={v[1]}" for k, v in sorted(ratelimits.items())
+                if k.startswith('throttle:scrape_company:')
+            ]
+            if companies:
+                response['X-RateLimit-Company-Remaining'] = ', '.join(companies)
+        return response
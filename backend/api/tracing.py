@@ -0,0 +1,233 @@
+"""
+End-to-end scrape latency tracing.
+
+dispatch_scrape() starts one ScrapeTrace per company right before its
+Make.com call and sends the trace id in the webhook payload ("traceId", or
+"traceIds" keyed by company for a batched dispatch). The scenario echoes it
+back in the callback as "traceId" on the payload, a result set or a
+product, or in an X-Trace-Id header. Callbacks without one are matched to
+each company's latest trace still waiting, if it was dispatched within
+SCRAPE_TRACE_MATCH_SECONDS. The trace ids travel with the callback's
+ingest batches, so the writer can close the traces it wrote.
+
+Spans, in milliseconds:
+
+    dispatch        the webhook POST to Make.com
+    make            end of the dispatch until the callback arrived
+    parse           reading and parsing the callback payload
+    validate        normalize_product() over the payload
+    queue           waiting in the ingest queue
+    local_write     ingest_products() writing to the local database
+    supabase_write  ingest_products() syncing to Supabase
+
+plus total_ms, from dispatch to written. A streamed callback adds up its
+chunks' parse, validate and write spans, and keeps the longest queue wait.
+Batches merged into one writer transaction each get the whole
+transaction's write spans. Tracing must never fail the request it
+observes, so errors are logged and dropped.
+"""
+import functools
+import logging
+import uuid
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from .companies import canonical_names, resolve_many
+from .models import ScrapeTrace
+
+SPANS = ('dispatch_ms', 'make_ms', 'parse_ms', 'validate_ms', 'queue_ms', 'local_write_ms', 'supabase_write_ms')
+HEADER = 'X-Trace-Id'
+
+
+def _quiet(default=None):
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                logging.error(f"Scrape tracing failed in {func.__name__}: {str(e)}")
+                return default() if callable(default) else default
+        return wrapper
+    return decorator
+
+
+def _ms(delta):
+    return delta.total_seconds() * 1000
+
+
+# Dispatch
+
+@_quiet(dict)
+def start(companies):
+    """Start a trace per canonical company name; returns {name: trace_id}."""
+    now = timezone.now()
+    company_ids = {name: match[0] for name, match in resolve_many(companies).items() if match}
+    traces = [
+        ScrapeTrace(trace_id=uuid.uuid4().hex, company_id=company_ids.get(name), company_name=name, dispatched_at=now)
+        for name in companies
+    ]
+    ScrapeTrace.objects.bulk_create(traces)
+    return {trace.company_name: trace.trace_id for trace in traces}
+
+
+@_quiet()
+def dispatched(trace_ids, dispatch_ms, error=None):
+    fields = {'dispatch_ms': dispatch_ms}
+    if error is not None:
+        fields.update(status='dispatch_failed', error=str(error)[:1000])
+    ScrapeTrace.objects.filter(trace_id__in=trace_ids).update(**fields)
+
+
+# Callback
+
+@_quiet(list)
+def callback_traces(payload, products, headers):
+    """
+    Trace ids a callback belongs to: the ones echoed back in the payload,
+    its products or the X-Trace-Id header, else the latest waiting trace
+    of each company among products.
+    """
+    echoed = [part.strip() for part in (headers.get(HEADER) or '').split(',')]
+    if isinstance(payload, dict):
+        echoed.append(payload.get('traceId'))
+        echoed.extend(result.get('traceId') for result in payload.get('results') or [] if isinstance(result, dict))
+    echoed.extend(
+        product.get('traceId') or product.get('trace_id') for product in products if isinstance(product, dict)
+    )
+    echoed = {trace_id for trace_id in echoed if trace_id and isinstance(trace_id, str)}
+    if echoed:
+        return sorted(ScrapeTrace.objects.filter(trace_id__in=echoed).values_list('trace_id', flat=True))
+
+    names = canonical_names({product['company_name'] for product in products
+                             if isinstance(product, dict) and product.get('company_name')})
+    since = timezone.now() - timedelta(seconds=settings.SCRAPE_TRACE_MATCH_SECONDS)
+    latest = {}
+    for trace_id, name in (
+        ScrapeTrace.objects.filter(company_name__in=names, status__in=['dispatched', 'dispatch_failed'],
+                                   dispatched_at__gte=since)
+        .order_by('dispatched_at').values_list('trace_id', 'company_name')
+    ):
+        latest[name] = trace_id
+    return sorted(latest.values())
+
+
+@_quiet()
+def received(trace_ids, received_at):
+    """Record the callback's arrival and with it Make.com's turnaround."""
+    for trace in ScrapeTrace.objects.filter(trace_id__in=trace_ids, received_at__isnull=True).only(
+        'id', 'dispatched_at', 'dispatch_ms'
+    ):
+        make_ms = max(_ms(received_at - trace.dispatched_at) - (trace.dispatch_ms or 0), 0)
+        ScrapeTrace.objects.filter(id=trace.id).update(received_at=received_at, make_ms=make_ms)
+    # A dispatch that timed out on our side still reached Make.com. The
+    # writer may already have closed the trace, so never step back from it.
+    ScrapeTrace.objects.filter(trace_id__in=trace_ids, status__in=['dispatched', 'dispatch_failed']).update(
+        status='received'
+    )
+
+
+def _add(name, value):
+    return Coalesce(F(name), Value(0.0)) + Value(float(value))
+
+
+@_quiet()
+def add_spans(trace_ids, **spans):
+    """Add durations to spans that may be recorded several times, e.g. per chunk."""
+    if trace_ids and spans:
+        ScrapeTrace.objects.filter(trace_id__in=trace_ids).update(
+            **{f'{name}_ms': _add(f'{name}_ms', value) for name, value in spans.items()}
+        )
+
+
+# Ingest writer
+
+@_quiet()
+def written(batches, timings):
+    """Close the traces of ingest batches written in one transaction."""
+    now = timezone.now()
+    # Chunks of one streamed callback can share a transaction; its write
+    # spans count once per trace
+    queue_ms = {}
+    for batch in batches:
+        for trace_id in batch.get('trace_ids') or []:
+            queue_ms[trace_id] = max(queue_ms.get(trace_id, 0), batch['queue_ms'])
+    for pk, trace_id, dispatched_at in ScrapeTrace.objects.filter(trace_id__in=queue_ms).values_list(
+        'id', 'trace_id', 'dispatched_at'
+    ):
+        ScrapeTrace.objects.filter(id=pk).update(
+            status='written',
+            written_at=now,
+            total_ms=_ms(now - dispatched_at),
+            queue_ms=Greatest(Coalesce(F('queue_ms'), Value(0.0)), Value(float(queue_ms[trace_id]))),
+            local_write_ms=_add('local_write_ms', timings['local_write_ms']),
+            supabase_write_ms=_add('supabase_write_ms', timings['supabase_write_ms']),
+        )
+
+
+def purge(older_than_days):
+    cutoff = timezone.now() - timedelta(days=older_than_days)
+    return ScrapeTrace.objects.filter(dispatched_at__lt=cutoff).delete()[0]
+
+
+# Reporting
+
+def _percentile(sorted_values, pct):
+    index = min(int(round(pct / 100 * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+def distribution(values):
+    values = sorted(value for value in values if value is not None)
+    if not values:
+        return {'count': 0}
+    return {
+        'count': len(values),
+        'mean_ms': round(sum(values) / len(values), 1),
+        'p50_ms': round(_percentile(values, 50), 1),
+        'p90_ms': round(_percentile(values, 90), 1),
+        'p99_ms': round(_percentile(values, 99), 1),
+        'max_ms': round(values[-1], 1),
+    }
+
+
+def _summarize(rows):
+    return {
+        'traces': len(rows),
+        'statuses': dict(Counter(row['status'] for row in rows)),
+        'total': distribution(row['total_ms'] for row in rows),
+        'spans': {span[:-3]: distribution(row[span] for row in rows) for span in SPANS},
+    }
+
+
+def latency(hours=24, company=None):
+    """
+    End-to-end and per-span latency distributions of the traces dispatched
+    in the last hours, overall and per company.
+    """
+    traces = ScrapeTrace.objects.filter(dispatched_at__gte=timezone.now() - timedelta(hours=hours))
+    if company:
+        traces = traces.filter(company_name__in=canonical_names([company]))
+    rows = list(traces.values('company_name', 'status', 'total_ms', *SPANS))
+    by_company = {}
+    for row in rows:
+        by_company.setdefault(row['company_name'], []).append(row)
+    return {
+        'hours': hours,
+        'aggregate': _summarize(rows),
+        'companies': {name: _summarize(company_rows) for name, company_rows in sorted(by_company.items())},
+    }
+
+
+def detail(trace_id):
+    return (
+        ScrapeTrace.objects.filter(trace_id=trace_id)
+        .values('trace_id', 'company_id', 'company_name', 'status', 'error', 'dispatched_at', 'received_at',
+                'written_at', *SPANS, 'total_ms')
+        .first()
+    )
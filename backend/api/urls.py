@@ -1,6 +1,6 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import ProductViewSet, scrape_products, compare_products, scrape_callback, fetch_products
+from .views import ProductViewSet, scrape_products, compare_products, scrape_callback, fetch_products, catalog_query, ingest_batch_status, scrape_latency, scrape_trace, compare_batch, compare_insights, suggest_companies, health, metrics_view
 from . import views
 router = DefaultRouter()
 router.register(r'products', ProductViewSet)
@@ -8,8 +8,17 @@ router.register(r'products', ProductViewSet)
 urlpatterns = [
     path('', include(router.urls)),
     path('scrape/', scrape_products, name='scrape-products'),
+    path('scrape/latency/', scrape_latency, name='scrape-latency'),
+    path('scrape/traces/<str:trace_id>/', scrape_trace, name='scrape-trace'),
     path('compare/', compare_products, name='compare-products'),
+    path('compare/batch/', compare_batch, name='compare-batch'),
+    path('compare/insights/', compare_insights, name='compare-insights'),
+    path('companies/suggest/', suggest_companies, name='suggest-companies'),
     path('webhook/scrape-callback/', scrape_callback, name='scrape-callback'),
     path('products/', fetch_products, name='fetch_products'),
+    path('catalog/', catalog_query, name='catalog-query'),
+    path('ingest/batches/<str:batch_id>/', ingest_batch_status, name='ingest-batch'),
+    path('health/', health, name='health'),
+    path('metrics/', metrics_view, name='metrics'),
 
 ]
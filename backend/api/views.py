@@ -1,34 +1,43 @@
-from django.shortcuts import render
+from django.http import Http404
+from django.urls import reverse
 from rest_framework import viewsets, status
 from rest_framework.decorators import api_view, throttle_classes
 from rest_framework.response import Response
 from .models import Product
-from .serializers import ProductSerializer
-from supabase import create_client, Client
+from .serializers import ProductSerializer, ProductRowSerializer
+from .pagination import ProductCursorPagination
+from .supabase_client import supabase, local_products
+from .ingest import normalize_product, flatten_result_sets, InvalidProduct
+from . import ingest_queue
+from .analytics import build_insights
+from . import best_products
+from .snapshot import SORT_KEYS, snapshot as product_snapshot
+from . import snapshot
+from . import companies as companies_module
+from .companies import canonical_name, get_or_create_companies, query_names, resolve, validate_company_name
+from .company_index import index as company_index, resolve_names
+from .streaming import iter_products, is_streaming_request, StreamFormatError
+from .scraping import dispatch_scrape
+from . import freshness
+from . import metrics
+from . import tracing
+import time
 import os
 import logging
 import json
 from datetime import datetime
 import requests
 from dotenv import load_dotenv
-from django.core.cache import cache
-from rest_framework.throttling import AnonRateThrottle
-from django.core.validators import URLValidator
+from django.utils import timezone
+from .throttling import ScrapeRateThrottle, FetchRateThrottle
 from django.core.exceptions import ValidationError
-import re
 from django.conf import settings
 
 # Load environment variables
 load_dotenv()
 
-# Initialize Supabase client
-supabase: Client = create_client(
-    supabase_url=settings.SUPABASE_URL,
-    supabase_key=settings.SUPABASE_KEY
-)
-
 # Get Make.com webhook URL
-MAKE_WEBHOOK_URL = 'https://hook.eu2.make.com/0udpdkarnhtlsx1fgyeu9hxych3mj91c'
+MAKE_WEBHOOK_URL = settings.MAKE_WEBHOOK_URL
 
 # Test mode flag - set to False to use real Make.com webhook
 TEST_MODE = False
@@ -45,7 +54,7 @@ def insert_sample_data():
         ]
         
         # Insert the sample data
-        response = supabase.table('products').insert(sample_data).execute()
+        response = supabase.execute(supabase.table('products').insert(sample_data))
         logging.info(f"Sample data inserted successfully: {response.data}")
         return True
     except Exception as e:
@@ -77,44 +86,70 @@ if not TEST_MODE:
 class ProductViewSet(viewsets.ModelViewSet):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
+    pagination_class = ProductCursorPagination
+
+    # Reads skip model instances: values_list() rows are mapped straight to
+    # ProductSerializer's output by ProductRowSerializer
+
+    def list(self, request):
+        reader = ProductRowSerializer()
+        page = self.paginate_queryset(Product.objects.values_list(*reader.columns))
+        return self.get_paginated_response(reader.to_representation(page))
+
+    def retrieve(self, request, pk=None):
+        reader = ProductRowSerializer()
+        try:
+            row = Product.objects.filter(pk=pk).values_list(*reader.columns).first()
+        except (TypeError, ValueError):
+            row = None
+        if row is None:
+            raise Http404
+        return Response(reader.to_representation([row])[0])
 
     def create(self, request):
         try:
             data = request.data
             logger.info(f"ProductViewSet.create received data: {json.dumps(data, indent=2)}")
+            product = normalize_product(data)
+            company_id, product['company_name'] = get_or_create_companies([product['company_name']])[product['company_name']]
 
             # Save to Supabase
-            supabase_result = supabase.table('products').insert({
-                'company_name': data['company_name'],
-                'product_name': data['product_name'],
-                'price': float(data['price']),
-                'rating': float(data['rating']),
-                'reviews': data['reviews']
-            }).execute()
+            supabase_result = supabase.execute(supabase.table('products').insert({
+                'company_name': product['company_name'],
+                'product_name': product['product_name'],
+                'price': product['price'],
+                'rating': product['rating'],
+                'reviews': product['reviews']
+            }))
             logger.info(f"Saved to Supabase: {json.dumps(supabase_result.data[0], indent=2)}")
 
-            # Save to local database
-            product = Product.objects.create(
-                company_name=data['company_name'],
-                product_name=data['product_name'],
-                price=float(data['price']),
-                rating=float(data['rating']),
-                reviews=int(str(data['reviews']).replace(',', ''))
-            )
-            logger.info(f"Saved to local database: {product.id}")
+            # Save to local database through the single ingest writer; the row
+            # is already in Supabase, so it starts out synced
+            product['remote_synced'] = True
+            batch_id = ingest_queue.queue.enqueue([product], 'api', sync_remote=False)
+            if settings.INGEST_INLINE_DRAIN:
+                ingest_queue.drain_own([batch_id])
+            logger.info(f"Queued local write as ingest batch {batch_id}")
 
-            return Response(supabase_result.data[0], status=status.HTTP_201_CREATED)
+            return Response({**supabase_result.data[0], 'ingest_batch_id': batch_id}, status=status.HTTP_201_CREATED)
         except Exception as e:
             logger.error(f"Error in ProductViewSet.create: {str(e)}")
             return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-def validate_company_name(name):
-    if not name or not isinstance(name, str):
-        raise ValidationError('Company name must be a non-empty string')
-    if not re.match(r'^[a-zA-Z0-9\s\-\.]+$', name):
-        raise ValidationError('Company name contains invalid characters')
-    # Normalize company name to title case
-    return name.strip().title()
+    def perform_update(self, serializer):
+        company_id = serializer.instance.company_id
+        product = serializer.save()
+        if company_id != product.company_id:
+            # Moved to another company: release it from the old best row first
+            best_products.recompute([company_id])
+        best_products.products_written([product])
+        snapshot.changed()
+
+    def perform_destroy(self, instance):
+        company_id = instance.company_id
+        instance.delete()
+        best_products.recompute([company_id])
+        snapshot.changed()
 
 def get_callback_url(request):
     """Get the appropriate callback URL based on the environment"""
@@ -123,14 +158,18 @@ def get_callback_url(request):
         return f"{request.build_absolute_uri('/').rstrip('/')}/api/webhook/scrape-callback/"
     else:
         # Production
-        return "https://ayushthegreat.pythonanywhere.com/api/webhook/scrape-callback/"
+        return settings.SCRAPE_CALLBACK_URL
 
 @api_view(['GET', 'POST'])
-@throttle_classes([AnonRateThrottle])
+@throttle_classes([ScrapeRateThrottle])
 def scrape_products(request):
     try:
         # Get companies from either POST data or GET parameters
+        # throttling.requested_companies() mirrors these checks, so
+        # a request rejected here spends no tokens
         if request.method == 'POST':
+            if not isinstance(request.data, dict):
+                return Response({'error': 'Request body must be a JSON object'}, status=400)
             companies = request.data.get('companies', [])
         else:
             companies_param = request.GET.get('companies', '')
@@ -140,6 +179,8 @@ def scrape_products(request):
         
         if not companies:
             return Response({'error': 'No companies provided'}, status=400)
+        if not isinstance(companies, list):
+            return Response({'error': 'companies must be a list'}, status=400)
 
         # Validate company names
         validated_companies = []
@@ -152,94 +193,70 @@ def scrape_products(request):
                 logging.error(f"Invalid company name '{company}': {str(e)}")
                 return Response({'error': f'Invalid company name "{company}": {str(e)}'}, status=400)
 
+        # Map every name onto its canonical Company, so aliases share one row.
+        # The response returns the canonical names and ids; clients watch
+        # /api/scrape/events/ with those rather than what they typed.
+        resolved = get_or_create_companies(validated_companies)
+        company_ids = {}
+        for company_id, company_name in resolved.values():
+            company_ids[company_name] = company_id
+        validated_companies = list(company_ids)
+
         # Clear old products for these companies
-        Product.objects.filter(company_name__in=validated_companies).delete()
+        Product.objects.filter(company_id__in=company_ids.values()).delete()
+        best_products.recompute(company_ids.values())
+        snapshot.changed()
         logging.info(f"Cleared old products for companies: {validated_companies}")
 
         if TEST_MODE:
-            # Test mode: Create sample data
+            # Test mode: Queue sample data for the ingest writer
             logging.info("TEST MODE: Creating sample data")
-            for company in validated_companies:
-                sample_data = {
+            sample_data = [
+                {
                     'company_name': company,
                     'product_name': f"Sample Product from {company}",
                     'price': 99.99,
                     'rating': 4.5,
                     'reviews': 100
                 }
-                Product.objects.create(**sample_data)
-                logging.info(f"Created sample product for {company}")
+                for company in validated_companies
+            ]
+            batch_id = ingest_queue.queue.enqueue(sample_data, 'test', sync_remote=False)
+            logging.info(f"Queued sample products as ingest batch {batch_id}")
+            batches, _ = queued_batches(request, [batch_id])
 
             return Response({
                 'message': 'Sample data created successfully',
                 'companies': validated_companies,
-                'mode': 'test'
+                'company_ids': company_ids,
+                'mode': 'test',
+                'batches': batches
             }, status=202)
         else:
             # Production mode: Call Make.com webhook for each company
             callback_url = get_callback_url(request)
-            successful_requests = []
-            failed_requests = []
-
-            for company in validated_companies:
-                try:
-                    webhook_data = {
-                        'companyName': company  # Match exact structure expected by Make.com
-                    }
-                    
-                    logging.info(f"Sending request to Make.com webhook for company: {company}")
-                    logging.info(f"Webhook URL: {MAKE_WEBHOOK_URL}")
-                    logging.info(f"Callback URL: {callback_url}")
-                    logging.info(f"Request data: {json.dumps(webhook_data, indent=2)}")
-                    
-                    response = requests.post(
-                        MAKE_WEBHOOK_URL,
-                        json=webhook_data,
-                        headers={
-                            'Content-Type': 'application/json',
-                            'User-Agent': 'Pullup/1.0'
-                        },
-                        timeout=180  # Increased timeout to 3 minutes
-                    )
-                    
-                    logging.info(f"Make.com response status for {company}: {response.status_code}")
-                    try:
-                        response_json = response.json()
-                        logging.info(f"Make.com response body for {company}: {json.dumps(response_json, indent=2)}")
-                    except json.JSONDecodeError:
-                        logging.info(f"Make.com response body for {company} (raw): {response.text}")
-                    
-                    if response.status_code in (200, 201, 202):
-                        successful_requests.append(company)
-                    else:
-                        failed_requests.append({
-                            'company': company,
-                            'status': response.status_code,
-                            'error': response.text
-                        })
-                        logging.error(f"Make.com webhook failed for {company}: {response.status_code}")
-                
-                except requests.exceptions.RequestException as e:
-                    failed_requests.append({
-                        'company': company,
-                        'error': str(e)
-                    })
-                    logging.error(f"Error calling Make.com webhook for {company}: {str(e)}")
+            successful_requests, failed_requests, trace_ids = dispatch_scrape(validated_companies, callback_url)
 
             # Return response based on results
             if successful_requests:
                 status_code = 202 if not failed_requests else 207  # 207 Multi-Status if partial success
                 return Response({
                     'message': 'Scraping initiated',
+                    'companies': validated_companies,
+                    'company_ids': company_ids,
                     'successful_companies': successful_requests,
                     'failed_companies': failed_requests,
                     'callback_url': callback_url,
+                    'trace_ids': trace_ids,
                     'mode': 'production'
                 }, status=status_code)
             else:
                 return Response({
                     'error': 'Failed to initiate scraping for all companies',
-                    'failed_companies': failed_requests
+                    'companies': validated_companies,
+                    'company_ids': company_ids,
+                    'failed_companies': failed_requests,
+                    'trace_ids': trace_ids
                 }, status=503)
                     
     except Exception as e:
@@ -278,8 +295,137 @@ except Exception as e:
     logger.addHandler(console_handler)
     logger.error(f"Failed to set up file logging, falling back to console: {str(e)}")
 
+def queued_batches(request, batch_ids):
+    """
+    Status of freshly enqueued ingest batches, after writing them in this
+    request if INGEST_INLINE_DRAIN is on and no ingest_worker holds the
+    writer lease. Returns (batches, http status): 200 once all are written,
+    else 202.
+    """
+    if settings.INGEST_INLINE_DRAIN:
+        ingest_queue.drain_own(batch_ids)
+    batches = []
+    for batch_id in batch_ids:
+        batch = ingest_queue.queue.status(batch_id)
+        batch['status_url'] = request.build_absolute_uri(reverse('ingest-batch', args=[batch_id]))
+        batches.append(batch)
+    done = all(batch['status'] == 'done' for batch in batches)
+    return batches, (200 if done else 202)
+
+def stream_callback(request):
+    """
+    Ingest a callback body incrementally.
+
+    Products are parsed one at a time from the request stream (a JSON array
+    or NDJSON), validated and enqueued in INGEST_CHUNK_SIZE batches, so
+    memory stays bounded however large the Make.com batch is. Failed result
+    sets of a batched payload go with the next queued chunk. The scrape
+    traces come from the X-Trace-Id header, else from the companies in the
+    first chunk. A body that turns out malformed after some chunks were
+    queued keeps them queued and is answered with 207 and their batches.
+    """
+    received_at = timezone.now()
+    started = time.perf_counter()
+    logger.info("==================== STREAMING WEBHOOK CALLBACK START ====================")
+    logger.info(f"Request content type: {request.content_type}")
+    chunk_size = settings.INGEST_CHUNK_SIZE
+    totals = {
+        'queued_count': 0,
+        'invalid_count': 0,
+        'chunks': 0
+    }
+    batch_ids = []
+    chunk = []
+    invalid = [0]
+    failed = []
+    trace_ids = []
+    timings = {'validate': 0.0, 'enqueue': 0.0}
+
+    def flush():
+        if not chunk:
+            return
+        flush_started = time.perf_counter()
+        if not batch_ids:
+            trace_ids.extend(tracing.callback_traces(None, chunk, request.headers))
+            tracing.received(trace_ids, received_at)
+        for failure in failed:
+            logger.error(f"Scrape failed for {failure['company']}: {failure['error']}")
+        batch_ids.append(ingest_queue.queue.enqueue(
+            list(chunk), 'callback', invalid_count=invalid[0], failed_companies=list(failed), trace_ids=trace_ids
+        ))
+        timings['enqueue'] += time.perf_counter() - flush_started
+        totals['queued_count'] += len(chunk)
+        totals['chunks'] += 1
+        logger.info(f"Queued chunk {totals['chunks']} as ingest batch {batch_ids[-1]}: {len(chunk)} products")
+        chunk.clear()
+        failed.clear()
+        invalid[0] = 0
+
+    malformed = None
+    try:
+        for product_data in iter_products(request, failed=failed):
+            validate_started = time.perf_counter()
+            try:
+                chunk.append(normalize_product(product_data))
+            except InvalidProduct as e:
+                totals['invalid_count'] += 1
+                invalid[0] += 1
+                logger.error(f"Skipping invalid product: {str(e)}")
+            timings['validate'] += time.perf_counter() - validate_started
+            if len(chunk) >= chunk_size:
+                flush()
+        flush()
+    except StreamFormatError as e:
+        flush()
+        logger.error(f"Malformed streaming payload: {str(e)}")
+        malformed = {'error': f'Invalid data format: {str(e)}'}
+    finally:
+        # Parsing is what the stream loop spent outside validation and enqueueing
+        elapsed = time.perf_counter() - started
+        tracing.add_spans(
+            trace_ids,
+            parse=(elapsed - timings['validate'] - timings['enqueue']) * 1000,
+            validate=timings['validate'] * 1000
+        )
+
+    logger.info(f"Streaming callback queued: {totals}")
+    logger.info("==================== STREAMING WEBHOOK CALLBACK END ====================\n")
+    # Failures after the last queued chunk have no batch to report them
+    for failure in failed:
+        logger.error(f"Scrape failed for {failure['company']}: {failure['error']}")
+    unqueued_failures = {'failed_companies': failed} if failed else {}
+    if not totals['queued_count']:
+        return Response({
+            'message': 'No products were saved',
+            'error': 'No valid products received',
+            **totals,
+            **unqueued_failures,
+            **(malformed or {})
+        }, status=400)
+
+    batches, status_code = queued_batches(request, batch_ids)
+    return Response({
+        'message': f"Queued {totals['queued_count']} products in {len(batches)} ingest batches",
+        **totals,
+        **unqueued_failures,
+        **(malformed or {}),
+        'trace_ids': trace_ids,
+        'batches': batches
+    }, status=207 if malformed else status_code)
+
 @api_view(['POST'])
 def scrape_callback(request):
+    # Large batches: parse straight from the request stream instead of
+    # buffering request.body and request.data
+    if is_streaming_request(request):
+        try:
+            return stream_callback(request._request)
+        except Exception as e:
+            logger.exception("Error in streaming scrape_callback")
+            return Response({'error': str(e)}, status=500)
+
+    received_at = timezone.now()
+    started = time.perf_counter()
     try:
         # Log the incoming data
         logger.info("==================== WEBHOOK CALLBACK START ====================")
@@ -289,14 +435,18 @@ def scrape_callback(request):
         logger.info(f"Request headers: {dict(request.headers)}")
         
         try:
-            # Handle both direct array and wrapped object format
+            # Handle direct array, wrapped object and batched per-company
+            # result sets from a multi-company dispatch
+            products_data, failed_companies = flatten_result_sets(request.data)
             if isinstance(request.data, list):
-                products_data = request.data
                 logger.info("Received data as direct array")
+            elif 'results' in request.data:
+                logger.info(f"Received {len(request.data['results'])} per-company result sets")
             else:
-                products_data = request.data.get('products', [])
                 logger.info("Received data as wrapped object")
-                
+            for failure in failed_companies:
+                logger.error(f"Scrape failed for {failure['company']}: {failure['error']}")
+
             logger.info(f"Extracted products data: {json.dumps(products_data, indent=2)}")
             logger.info(f"Number of products received: {len(products_data)}")
         except Exception as e:
@@ -304,154 +454,144 @@ def scrape_callback(request):
             logger.error(f"Request data type: {type(request.data)}")
             logger.error(f"Request data content: {request.data}")
             return Response({'error': 'Invalid data format'}, status=400)
-        
+        parse_ms = (time.perf_counter() - started) * 1000
+        trace_ids = tracing.callback_traces(request.data, products_data, request.headers)
+        tracing.received(trace_ids, received_at)
+
         if not products_data:
             logger.error("No product data received in webhook callback")
-            return Response({'error': 'No product data received'}, status=400)
-
-        # Log current database state
-        existing_count = Product.objects.count()
-        logger.info(f"Current products in database: {existing_count}")
-
-        # Validate and save products to database
-        saved_products = []
+            response_data = {'error': 'No product data received'}
+            if failed_companies:
+                response_data['failed_companies'] = failed_companies
+            return Response(response_data, status=400)
+
+        # Validate products, then hand them to the single ingest writer
+        validate_started = time.perf_counter()
+        valid_products = []
+        invalid_count = 0
         for product_data in products_data:
             try:
-                # Log each product being processed
-                logger.info(f"\nProcessing product: {json.dumps(product_data, indent=2)}")
-                
-                # Validate required fields
-                required_fields = ['company_name', 'product_name', 'price', 'rating', 'reviews']
-                missing_fields = [field for field in required_fields if field not in product_data]
-                if missing_fields:
-                    logger.error(f"Missing required fields for product: {missing_fields}")
-                    continue
-
-                # Clean and convert numeric fields
-                try:
-                    # Handle price (might be already numeric from Make.com)
-                    if isinstance(product_data['price'], (int, float)):
-                        price = float(product_data['price'])
-                    else:
-                        price_str = str(product_data['price']).replace('$', '').replace(',', '').strip()
-                        price = float(price_str)
-                    product_data['price'] = price
-                    logger.info(f"Converted price: {price}")
-
-                    # Handle rating (might be already numeric from Make.com)
-                    if isinstance(product_data['rating'], (int, float)):
-                        rating = float(product_data['rating'])
-                    else:
-                        rating_str = str(product_data['rating']).strip()
-                        rating = float(rating_str)
-                    product_data['rating'] = rating
-                    logger.info(f"Converted rating: {rating}")
-
-                    # Handle reviews (might be string or number)
-                    if isinstance(product_data['reviews'], int):
-                        reviews = product_data['reviews']
-                    else:
-                        reviews_str = str(product_data['reviews']).replace(',', '').strip()
-                        reviews = int(reviews_str)
-                    product_data['reviews'] = reviews
-                    logger.info(f"Converted reviews: {reviews}")
-
-                except (ValueError, TypeError) as e:
-                    logger.error(f"Error converting numeric fields: {str(e)}")
-                    logger.error(f"Product data: {product_data}")
-                    continue
-
-                # Save to database
-                logger.info(f"Attempting to save product to database: {product_data}")
-                
-                try:
-                    # Check if product already exists in local database
-                    existing_product = Product.objects.filter(
-                        company_name=product_data['company_name'],
-                        product_name=product_data['product_name']
-                    ).first()
-                    
-                    if existing_product:
-                        # Update existing product in local database
-                        for key, value in product_data.items():
-                            setattr(existing_product, key, value)
-                        existing_product.save()
-                        saved_products.append(existing_product)
-                        logger.info(f"Updated existing product in local database: {existing_product.product_name}")
-                    else:
-                        # Create new product in local database
-                        new_product = Product.objects.create(**product_data)
-                        saved_products.append(new_product)
-                        logger.info(f"Created new product in local database: {new_product.product_name}")
-
-                    # Save to Supabase
-                    supabase_data = {
-                        'company_name': product_data['company_name'],
-                        'product_name': product_data['product_name'],
-                        'price': float(product_data['price']),
-                        'rating': float(product_data['rating']),
-                        'reviews': str(product_data['reviews'])
-                    }
-                    
-                    # Check if product exists in Supabase
-                    supabase_result = supabase.table('products').select('*').eq(
-                        'company_name', product_data['company_name']
-                    ).eq('product_name', product_data['product_name']).execute()
-                    
-                    if supabase_result.data:
-                        # Update existing product in Supabase
-                        supabase_id = supabase_result.data[0]['id']
-                        supabase.table('products').update(supabase_data).eq('id', supabase_id).execute()
-                        logger.info(f"Updated existing product in Supabase: {product_data['product_name']}")
-                    else:
-                        # Create new product in Supabase
-                        supabase.table('products').insert(supabase_data).execute()
-                        logger.info(f"Created new product in Supabase: {product_data['product_name']}")
-
-                except Exception as e:
-                    logger.error(f"Error saving product: {str(e)}")
-                    logger.error(f"Product data: {product_data}")
-                    continue
-
-            except Exception as e:
-                logger.error(f"Error saving product: {str(e)}")
-                logger.error(f"Product data that caused error: {product_data}")
-                continue
-
-        # Log final database state
-        new_count = Product.objects.count()
-        logger.info(f"\nFinal products in database: {new_count}")
-        logger.info(f"Change in product count: {new_count - existing_count}")
-
-        if not saved_products:
-            logger.warning("No products were saved to database")
+                valid_products.append(normalize_product(product_data))
+            except InvalidProduct as e:
+                invalid_count += 1
+                logger.error(f"Skipping invalid product: {str(e)}")
+                logger.error(f"Product data: {product_data}")
+        tracing.add_spans(trace_ids, parse=parse_ms, validate=(time.perf_counter() - validate_started) * 1000)
+
+        if not valid_products:
+            logger.warning("No valid products in webhook callback")
             return Response({
                 'message': 'No products were saved',
-                'error': 'Failed to save any products'
+                'error': 'No valid products received',
+                'invalid_count': invalid_count
             }, status=400)
 
-        # Return success response with saved products
+        try:
+            batch_id = ingest_queue.queue.enqueue(
+                valid_products, 'callback', invalid_count=invalid_count, failed_companies=failed_companies,
+                trace_ids=trace_ids
+            )
+        except Exception as e:
+            logger.error(f"Error queueing products: {str(e)}")
+            return Response({'error': f'Failed to queue products: {str(e)}'}, status=500)
+        logger.info(f"Queued {len(valid_products)} products as ingest batch {batch_id}")
+
+        batches, status_code = queued_batches(request, [batch_id])
         response_data = {
-            'message': f'Successfully processed {len(saved_products)} products',
-            'processed_count': len(saved_products),
-            'products': [
-                {
-                    'company_name': p.company_name,
-                    'product_name': p.product_name,
-                    'price': str(p.price),
-                    'rating': str(p.rating),
-                    'reviews': p.reviews
-                } for p in saved_products
-            ]
+            'message': f'Queued {len(valid_products)} products for ingest',
+            'trace_ids': trace_ids,
+            **batches[0]
         }
-        logger.info(f"Returning success response: {json.dumps(response_data, indent=2)}")
+        logger.info(f"Returning response: {json.dumps(response_data, indent=2)}")
         logger.info("==================== WEBHOOK CALLBACK END ====================\n")
-        return Response(response_data)
+        return Response(response_data, status=status_code)
 
     except Exception as e:
         logger.exception("Error in scrape_callback view")
         return Response({'error': str(e)}, status=500)
 
+def resolve_compare_names(names):
+    """
+    Resolve requested names through the alias map and the fuzzy index, so
+    "apple", "Apple" and "Appel" hit the same rows instead of scraping.
+
+    Returns (canonical names in order, {input: canonical} for corrected names).
+    """
+    resolved_names = resolve_names(names)
+    companies = list(dict.fromkeys(resolved_names.values()))
+    corrected = {name: canonical for name, canonical in resolved_names.items()
+                 if companies_module.alias_key(name) != companies_module.alias_key(canonical)}
+    return companies, corrected
+
+
+def load_best_products(companies):
+    """
+    Best product of each canonical company name, as {company: result}.
+
+    Known companies are read from the in-process product snapshot (or the
+    materialized CompanyBestProduct table when it is disabled); the rest
+    come from a single Supabase query, falling back to the local table
+    while Supabase is unavailable. Results also carry last_updated and
+    stale.
+    """
+    known_ids = {match[0]: match[1] for match in companies_module.resolve_many(companies).values() if match}
+    results = {}
+    if settings.PRODUCT_SNAPSHOT_ENABLED:
+        bests = product_snapshot.best(known_ids)
+    else:
+        bests = {company_id: {field: getattr(best, field) for field in ('product_name', 'price', 'rating', 'reviews')}
+                 for company_id, best in best_products.lookup(known_ids).items()}
+    for company_id, company in known_ids.items():
+        best = bests.get(company_id)
+        if best is not None:
+            results[company] = {
+                'company_name': company,
+                'product_name': best['product_name'],
+                'price': str(float(best['price'])),
+                'rating': str(float(best['rating'])),
+                'reviews': best['reviews']
+            }
+
+    remaining = [company for company in companies if company not in results]
+    if remaining:
+        # Supabase is keyed by name, so include aliases
+        query = supabase.table('products').select('*').in_('company_name', query_names(remaining))
+        response = supabase.execute(query, read=True, fallback=lambda: local_products(remaining))
+
+        # Group products by company
+        company_products = {}
+        for product in response.data or []:
+            match = resolve(product['company_name'])
+            company = match[1] if match else canonical_name(product['company_name'])
+            if company in results:
+                continue
+            if company not in company_products:
+                company_products[company] = []
+            company_products[company].append({
+                'company_name': company,
+                'product_name': product['product_name'],
+                'price': str(product['price']),
+                'rating': str(product['rating']),
+                'reviews': product['reviews']
+            })
+
+        # Get the best product for each company
+        for company, products in company_products.items():
+            if products:
+                results[company] = sorted(products, key=lambda x: (float(x['rating']), int(x['reviews'])), reverse=True)[0]
+
+    # Serve what we have, flagging data older than REFRESH_STALE_AFTER_HOURS;
+    # refresh_stale rescrapes it in the background
+    ages = freshness.last_scraped(list(known_ids))
+    scraped_at = {name: ages.get(company_id) for company_id, name in known_ids.items()}
+    cutoff = freshness.stale_before()
+    for company, result in results.items():
+        last_updated = scraped_at.get(company)
+        result['last_updated'] = last_updated.isoformat() if last_updated else None
+        result['stale'] = freshness.is_stale(last_updated, cutoff)
+    return results
+
+
 @api_view(['GET', 'POST'])
 def compare_products(request):
     try:
@@ -470,11 +610,12 @@ def compare_products(request):
                 'message': 'No company names provided. Use ?companies=company1,company2 for GET or {"companies": ["company1", "company2"]} for POST'
             }, status=400)
 
-        # Query Supabase directly for better performance
-        query = supabase.table('products').select('*').in_('company_name', companies)
-        response = query.execute()
-        
-        if not response.data:
+        companies, corrected = resolve_compare_names(companies)
+        # Request counts drive which stale companies refresh_stale rescrapes
+        freshness.record_hits(companies_module.company_ids(companies))
+
+        best = load_best_products(companies)
+        if not best:
             # Initiate scraper if no products found
             logging.info("No products found for companies, initiating scraping...")
             try:
@@ -494,32 +635,18 @@ def compare_products(request):
                     'status': 'error',
                     'message': f'Failed to initiate scraping: {str(scrape_error)}'
                 }, status=500)
-        
-        # Group products by company
-        company_products = {}
-        for product in response.data:
-            company = product['company_name']
-            if company not in company_products:
-                company_products[company] = []
-            company_products[company].append({
-                'company_name': product['company_name'],
-                'product_name': product['product_name'],
-                'price': str(product['price']),
-                'rating': str(product['rating']),
-                'reviews': product['reviews']
-            })
-        
-        # Get the best product for each company
-        comparison_results = []
-        for company, products in company_products.items():
-            if products:
-                best_product = sorted(products, key=lambda x: (float(x['rating']), int(x['reviews'])), reverse=True)[0]
-                comparison_results.append(best_product)
-        
-        return Response({
+
+        comparison_results = [best[company] for company in companies if company in best]
+        response_data = {
             'status': 'success',
             'data': comparison_results
-        })
+        }
+        stale_companies = [result['company_name'] for result in comparison_results if result['stale']]
+        if stale_companies:
+            response_data['stale_companies'] = stale_companies
+        if corrected:
+            response_data['resolved_companies'] = corrected
+        return Response(response_data)
 
     except Exception as e:
         logging.exception("Error in compare_products view")
@@ -528,16 +655,163 @@ def compare_products(request):
             'message': str(e)
         }, status=500)
 
+@api_view(['POST'])
+def compare_batch(request):
+    """
+    Compare many company groups in one request.
+
+    Body: {"groups": [["Apple", "Samsung"], ["Sony", "LG"], ...]}. The union
+    of all companies is loaded once and each group is answered from it.
+    Results keep request order; a bad or empty group gets its own error
+    entry instead of failing the batch. Unlike /api/compare/, missing data
+    never triggers a scrape.
+    """
+    try:
+        groups = request.data if isinstance(request.data, list) else request.data.get('groups')
+        if not isinstance(groups, list) or not groups:
+            return Response({
+                'status': 'error',
+                'message': 'Provide {"groups": [["company1", "company2"], ...]}'
+            }, status=400)
+        if len(groups) > settings.COMPARE_BATCH_MAX_GROUPS:
+            return Response({
+                'status': 'error',
+                'message': f'At most {settings.COMPARE_BATCH_MAX_GROUPS} groups per batch'
+            }, status=400)
+
+        # Resolve every distinct name once
+        names = []
+        for group in groups:
+            if isinstance(group, list):
+                names.extend(name for name in group if isinstance(name, str) and name.strip())
+        resolved = resolve_names(list(dict.fromkeys(names)))
+        union = list(dict.fromkeys(resolved.values()))
+        freshness.record_hits(companies_module.company_ids(union))
+        best = load_best_products(union)
+
+        results = []
+        for index, group in enumerate(groups):
+            if not isinstance(group, list) or not group or not all(isinstance(n, str) and n.strip() for n in group):
+                results.append({
+                    'index': index,
+                    'status': 'error',
+                    'message': 'A group must be a non-empty list of company names'
+                })
+                continue
+            companies = list(dict.fromkeys(resolved[name] for name in group))
+            data = [best[company] for company in companies if company in best]
+            result = {
+                'index': index,
+                'status': 'success' if data else 'error',
+                'companies': companies,
+                'data': data
+            }
+            missing = [company for company in companies if company not in best]
+            if not data:
+                result['message'] = 'No products found for these companies'
+            elif missing:
+                result['missing_companies'] = missing
+            stale_companies = [item['company_name'] for item in data if item['stale']]
+            if stale_companies:
+                result['stale_companies'] = stale_companies
+            corrected = {name: resolved[name] for name in group
+                         if companies_module.alias_key(name) != companies_module.alias_key(resolved[name])}
+            if corrected:
+                result['resolved_companies'] = corrected
+            results.append(result)
+
+        return Response({
+            'status': 'success',
+            'companies_loaded': len(best),
+            'results': results
+        })
+
+    except Exception as e:
+        logging.exception("Error in compare_batch view")
+        return Response({
+            'status': 'error',
+            'message': str(e)
+        }, status=500)
+
 @api_view(['GET'])
-@throttle_classes([AnonRateThrottle])
+def compare_insights(request):
+    """Relative positioning metrics over all products of the requested companies."""
+    try:
+        companies_param = request.GET.get('companies', '')
+        companies = [c.strip() for c in companies_param.split(',') if c.strip()]
+        if not companies:
+            return Response({
+                'status': 'error',
+                'message': 'No company names provided. Use ?companies=company1,company2'
+            }, status=400)
+
+        try:
+            limit = min(max(int(request.GET.get('limit', 100)), 1), 1000)
+            offset = max(int(request.GET.get('offset', 0)), 0)
+        except ValueError:
+            return Response({'status': 'error', 'message': 'limit and offset must be integers'}, status=400)
+
+        insights = build_insights(companies, limit=limit, offset=offset)
+        if not insights['total_products']:
+            return Response({
+                'status': 'error',
+                'message': 'No products found for the requested companies',
+                'companies': companies
+            }, status=404)
+
+        return Response({'status': 'success', **insights})
+
+    except Exception as e:
+        logging.exception("Error in compare_insights view")
+        return Response({
+            'status': 'error',
+            'message': str(e)
+        }, status=500)
+
+@api_view(['GET'])
+def suggest_companies(request):
+    """Autocomplete known company names from a partial or misspelled query."""
+    query = request.GET.get('q', '').strip()
+    if not query:
+        return Response({'status': 'error', 'message': 'Use ?q=<partial company name>'}, status=400)
+    try:
+        limit = min(max(int(request.GET.get('limit', 10)), 1), 50)
+    except ValueError:
+        return Response({'status': 'error', 'message': 'limit must be an integer'}, status=400)
+
+    return Response({
+        'status': 'success',
+        'query': query,
+        'suggestions': company_index.suggest(query, limit=limit)
+    })
+
+@api_view(['GET'])
+@throttle_classes([FetchRateThrottle])
 def fetch_products(request):
     try:
+        if settings.PRODUCT_SNAPSHOT_ENABLED:
+            # Served from the in-process snapshot, kept current by ingest
+            return Response({
+                'status': 'success',
+                'data': [
+                    {
+                        'id': str(product['id']),
+                        'company_name': product['company_name'],
+                        'product_name': product['product_name'],
+                        'price': product['price'],
+                        'rating': product['rating'],
+                        'reviews': product['reviews']
+                    }
+                    for product in product_snapshot.query()
+                ]
+            }, status=status.HTTP_200_OK)
+
         logging.info("Attempting to fetch products from Supabase...")
         logging.info(f"Supabase URL: {settings.SUPABASE_URL}")
         logging.info(f"Supabase key configured: {'Yes' if settings.SUPABASE_KEY else 'No'}")
         
         # Fetch products from Supabase
-        response = supabase.table('products').select("*").execute()
+        response = supabase.execute(supabase.table('products').select("*"), read=True, fallback=local_products)
         
         # Log the complete response for debugging
         logging.info("Supabase raw response:")
@@ -577,3 +851,104 @@ def fetch_products(request):
             'message': 'Failed to fetch products',
             'error': str(e)
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+def _float_param(request, name):
+    value = request.GET.get(name)
+    return float(value) if value not in (None, '') else None
+
+@api_view(['GET'])
+def catalog_query(request):
+    """
+    Filter and top-N queries over the in-process product snapshot.
+
+    ?companies=a,b&min_price=&max_price=&min_rating=&min_reviews=
+    &sort=rating|price|reviews&order=desc|asc&limit=50
+    """
+    if not settings.PRODUCT_SNAPSHOT_ENABLED:
+        return Response({'status': 'error', 'message': 'The product snapshot is disabled'}, status=503)
+    try:
+        companies_param = request.GET.get('companies', '')
+        company_ids = None
+        if companies_param:
+            names = [c.strip() for c in companies_param.split(',') if c.strip()]
+            company_ids = companies_module.company_ids(resolve_names(names).values())
+        sort = request.GET.get('sort') or None
+        if sort is not None and sort not in SORT_KEYS:
+            return Response({'status': 'error', 'message': f"sort must be one of {', '.join(SORT_KEYS)}"}, status=400)
+        limit = min(int(request.GET.get('limit', 50)), 1000)
+        min_reviews = request.GET.get('min_reviews')
+        products = product_snapshot.query(
+            company_ids=company_ids,
+            min_price=_float_param(request, 'min_price'),
+            max_price=_float_param(request, 'max_price'),
+            min_rating=_float_param(request, 'min_rating'),
+            min_reviews=int(min_reviews) if min_reviews else None,
+            sort=sort,
+            descending=request.GET.get('order', 'desc') != 'asc',
+            limit=limit
+        )
+    except ValueError as e:
+        return Response({'status': 'error', 'message': f'Invalid parameter: {str(e)}'}, status=400)
+    return Response({
+        'status': 'success',
+        'version': product_snapshot.version,
+        'count': len(products),
+        'data': products
+    })
+
+@api_view(['GET'])
+def ingest_batch_status(request, batch_id):
+    batch = ingest_queue.queue.status(batch_id)
+    if batch is None:
+        return Response({'error': 'Unknown ingest batch'}, status=404)
+    return Response(batch)
+
+@api_view(['GET'])
+def scrape_latency(request):
+    """End-to-end scrape latency, overall and per company, with per-span distributions."""
+    try:
+        hours = float(request.GET.get('hours', 24))
+    except ValueError:
+        return Response({'status': 'error', 'message': 'hours must be a number'}, status=400)
+    if hours <= 0:
+        return Response({'status': 'error', 'message': 'hours must be positive'}, status=400)
+    try:
+        return Response({'status': 'success', **tracing.latency(hours, request.GET.get('company'))})
+    except Exception as e:
+        logging.error(f"Error in scrape_latency: {str(e)}")
+        return Response({'status': 'error', 'message': str(e)}, status=500)
+
+@api_view(['GET'])
+def scrape_trace(request, trace_id):
+    trace = tracing.detail(trace_id)
+    if trace is None:
+        return Response({'error': 'Unknown scrape trace'}, status=404)
+    return Response(trace)
+
+@api_view(['GET'])
+def health(request):
+    try:
+        Product.objects.exists()
+        database = 'ok'
+    except Exception as e:
+        logging.error(f"Health check database error: {str(e)}")
+        database = 'error'
+
+    try:
+        queue = ingest_queue.queue.stats()
+    except Exception as e:
+        logging.error(f"Health check ingest queue error: {str(e)}")
+        queue = {'error': str(e)}
+
+    breaker = supabase.breaker.snapshot()
+    healthy = database == 'ok' and breaker['state'] == 'closed' and 'error' not in queue
+    return Response({
+        'status': 'ok' if healthy else 'degraded',
+        'database': database,
+        'supabase': breaker,
+        'ingest_queue': queue
+    }, status=200 if database == 'ok' else 503)
+
+@api_view(['GET'])
+def metrics_view(request):
+    return Response(metrics.snapshot())
@@ -13,4 +13,27 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'pullup.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported after Django is set up
+from api.events import scrape_events  # noqa: E402
+from api.snapshot import snapshot  # noqa: E402
+
+# Load the in-process product snapshot before the first request needs it
+snapshot.warm()
+
+# Long-lived scrape event streams are served by a plain coroutine instead
+# of a Django view, so idle watchers never hold a request thread.
+ASGI_ROUTES = {
+    '/api/scrape/events/': scrape_events,
+}
+
+
+async def application(scope, receive, send):
+    # Match with or without the trailing slash: Django has no URL for these
+    # paths, so APPEND_SLASH cannot redirect to them
+    route = ASGI_ROUTES.get(scope['path'].rstrip('/') + '/') if scope['type'] == 'http' else None
+    if route is not None:
+        await route(scope, receive, send)
+    else:
+        await django_application(scope, receive, send)
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'pullup.settings')
 
 application = get_wsgi_application()
+
+# Load the in-process product snapshot before the first request needs it
+from api.snapshot import snapshot  # noqa: E402
+
+snapshot.warm()
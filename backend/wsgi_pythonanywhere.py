@@ -42,6 +42,10 @@ try:
     application = get_wsgi_application()
     logging.debug('Successfully created WSGI application')
 
+    # Load the in-process product snapshot before the first request needs it
+    from api.snapshot import snapshot
+    snapshot.warm()
+
 except Exception as e:
     logging.exception('An error occurred in the WSGI script: %s', str(e))
     raise
@@ -23,6 +23,7 @@ import {
   getAllProducts,
   Product,
   checkSupabaseProducts,
+  waitForScrapeEvents,
 } from './services/api';
 
 const theme = createTheme();
@@ -84,10 +85,10 @@ function App() {
   }, []);
 
   const pollComparisonResults = useCallback(
-    async (companies: string[], attempts = 0) => {
+    async (companies: string[], companyIds: number[] = [], attempts = 0) => {
       try {
         console.log(`Polling attempt ${attempts + 1} for companies:`, companies);
-        const data = await getProductComparison(companies);
+        const data = await getProductComparison(companies, companyIds);
 
         if (data && data.length > 0) {
           console.log('Successfully received products:', data);
@@ -104,7 +105,7 @@ function App() {
         } else if (attempts < MAX_POLLING_ATTEMPTS) {
           console.log(`No data yet, retrying in ${POLLING_INTERVAL}ms...`);
           setTimeout(
-            () => pollComparisonResults(companies, attempts + 1),
+            () => pollComparisonResults(companies, companyIds, attempts + 1),
             POLLING_INTERVAL
           );
         } else {
@@ -165,9 +166,11 @@ function App() {
         const result = await initiateProductScraping(unavailableCompanies);
 
         if (result.success) {
-          console.log('Scraping initiated successfully. Starting polling...');
-          await new Promise(resolve => setTimeout(resolve, 60000));
-          pollComparisonResults(unavailableCompanies);
+          console.log('Scraping initiated successfully. Waiting for the results...');
+          // The fixed 60s wait is only the fallback when the event stream is unavailable
+          await waitForScrapeEvents(result.companies, result.companyIds, 120000, 60000);
+          // Products are stored under the canonical names the backend returned
+          pollComparisonResults(result.companies, result.companyIds);
         } else {
           throw new Error('Failed to initiate product scraping');
         }
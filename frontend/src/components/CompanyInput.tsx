@@ -1,13 +1,66 @@
-import React, { useState } from 'react';
-import { TextField, Button, Box, Typography, Paper } from '@mui/material';
+import React, { useEffect, useState } from 'react';
+import { Autocomplete, TextField, Button, Box, Typography, Paper } from '@mui/material';
 import AddIcon from '@mui/icons-material/Add';
 import DeleteIcon from '@mui/icons-material/Delete';
+import { suggestCompanies } from '../services/api';
 
 interface CompanyInputProps {
   onCompare: (companies: string[]) => void;
   disabled?: boolean;
 }
 
+interface CompanyNameFieldProps {
+  label: string;
+  value: string;
+  onChange: (value: string) => void;
+  disabled?: boolean;
+  error?: string;
+}
+
+// Free-text company field that suggests known companies as the user types
+const CompanyNameField: React.FC<CompanyNameFieldProps> = ({ label, value, onChange, disabled, error }) => {
+  const [options, setOptions] = useState<string[]>([]);
+
+  useEffect(() => {
+    if (!value.trim()) {
+      setOptions([]);
+      return;
+    }
+    let active = true;
+    const timer = setTimeout(async () => {
+      const suggestions = await suggestCompanies(value);
+      if (active) {
+        setOptions(suggestions.map(s => s.company_name));
+      }
+    }, 150);
+    return () => {
+      active = false;
+      clearTimeout(timer);
+    };
+  }, [value]);
+
+  return (
+    <Autocomplete
+      freeSolo
+      fullWidth
+      options={options}
+      filterOptions={(x) => x}
+      inputValue={value}
+      onInputChange={(_, newValue) => onChange(newValue)}
+      disabled={disabled}
+      renderInput={(params) => (
+        <TextField
+          {...params}
+          label={label}
+          variant="outlined"
+          error={!!error}
+          helperText={error}
+        />
+      )}
+    />
+  );
+};
+
 const CompanyInput: React.FC<CompanyInputProps> = ({ onCompare, disabled }) => {
   const [primaryCompany, setPrimaryCompany] = useState('');
   const [competitors, setCompetitors] = useState<string[]>(['']);
@@ -79,29 +132,23 @@ const CompanyInput: React.FC<CompanyInputProps> = ({ onCompare, disabled }) => {
       </Typography>
       
       <Box sx={{ mb: 3 }}>
-        <TextField
-          fullWidth
+        <CompanyNameField
           label="Primary Company"
           value={primaryCompany}
-          onChange={(e) => setPrimaryCompany(e.target.value)}
-          variant="outlined"
+          onChange={setPrimaryCompany}
           disabled={disabled}
-          error={!!errors.primary}
-          helperText={errors.primary}
+          error={errors.primary}
         />
       </Box>
 
       {competitors.map((competitor, index) => (
         <Box key={index} sx={{ mb: 2, display: 'flex', gap: 1 }}>
-          <TextField
-            fullWidth
+          <CompanyNameField
             label={`Competitor ${index + 1}`}
             value={competitor}
-            onChange={(e) => handleCompetitorChange(index, e.target.value)}
-            variant="outlined"
+            onChange={(value) => handleCompetitorChange(index, value)}
             disabled={disabled}
-            error={!!errors[`competitor${index}`]}
-            helperText={errors[`competitor${index}`]}
+            error={errors[`competitor${index}`]}
           />
           {competitors.length > 1 && (
             <Button
@@ -32,7 +32,9 @@ interface ApiResponse<T> {
 
 interface ScrapeResponse {
   message: string;
+  // Canonical names and their company ids, as the backend stores them
   companies: string[];
+  company_ids: Record<string, number>;
   error?: string;
 }
 
@@ -64,12 +66,12 @@ const processProductData = (products: Product[] | null | undefined): Product[] =
   }));
 };
 
-export const getProductComparison = async (companies: string[]): Promise<Product[]> => {
+export const getProductComparison = async (companies: string[], companyIds: number[] = []): Promise<Product[]> => {
   try {
     console.log('Fetching products for companies:', companies);
     
     // Use the checkAndRetryProductAvailability function which handles the webhook and waiting
-    return await checkAndRetryProductAvailability(companies);
+    return await checkAndRetryProductAvailability(companies, companyIds);
     
   } catch (error) {
     console.error('Error fetching product comparison:', error);
@@ -77,6 +79,27 @@ export const getProductComparison = async (companies: string[]): Promise<Product
   }
 };
 
+export interface CompanySuggestion {
+  company_name: string;
+  matched: string;
+  match: 'prefix' | 'fuzzy';
+  score: number;
+}
+
+export const suggestCompanies = async (query: string, limit: number = 8): Promise<CompanySuggestion[]> => {
+  if (!query.trim()) return [];
+  try {
+    const response = await api.get<{ status: string; suggestions: CompanySuggestion[] }>(
+      '/api/companies/suggest/',
+      { params: { q: query, limit } }
+    );
+    return response.data.suggestions;
+  } catch (error) {
+    console.error('Error fetching company suggestions:', error);
+    return [];
+  }
+};
+
 export const getAllProducts = async (): Promise<Product[]> => {
   try {
     const { data: supabaseData, error: supabaseError } = await supabase
@@ -118,6 +141,7 @@ export const initiateProductScraping = async (companies: string[]): Promise<{
   success: boolean;
   message: string;
   companies: string[];
+  companyIds: number[];
 }> => {
   try {
     const response = await api.post<ScrapeResponse>('/api/scrape/', {
@@ -128,6 +152,7 @@ export const initiateProductScraping = async (companies: string[]): Promise<{
       success: true,
       message: response.data.message,
       companies: response.data.companies,
+      companyIds: Object.values(response.data.company_ids || {}),
     };
   } catch (error) {
     console.error('Error initiating scraping:', error);
@@ -135,7 +160,52 @@ export const initiateProductScraping = async (companies: string[]): Promise<{
   }
 };
 
-export const checkAndRetryProductAvailability = async (companies: string[]): Promise<Product[]> => {
+// Resolves once the backend reports that every company's scrape results
+// were ingested, or after maxWaitMs. Watches the company ids returned by
+// initiateProductScraping when known, since the backend may have
+// canonicalized the names that were typed. Without an event stream it
+// resolves after fallbackWaitMs instead.
+export const waitForScrapeEvents = (
+  companies: string[],
+  companyIds: number[] = [],
+  maxWaitMs: number = 120000,
+  fallbackWaitMs: number = 20000
+): Promise<boolean> => {
+  return new Promise(resolve => {
+    const params = new URLSearchParams({
+      since: String(Math.floor(Date.now() / 1000) - 60),
+    });
+    if (companyIds.length > 0) {
+      params.set('company_ids', companyIds.join(','));
+    } else {
+      params.set('companies', companies.join(','));
+    }
+    const source = new EventSource(`${API_BASE_URL}/api/scrape/events/?${params.toString()}`);
+    const finish = (completed: boolean) => {
+      clearTimeout(timer);
+      source.close();
+      resolve(completed);
+    };
+    const timer = setTimeout(() => finish(false), maxWaitMs);
+
+    source.addEventListener('scrape', (event) => {
+      console.log('Scrape results ingested:', (event as MessageEvent).data);
+    });
+    source.addEventListener('done', () => finish(true));
+    source.addEventListener('timeout', () => finish(false));
+    // No event stream (e.g. a WSGI-only deployment): fall back to a fixed wait
+    source.onerror = () => {
+      clearTimeout(timer);
+      source.close();
+      setTimeout(() => resolve(false), fallbackWaitMs);
+    };
+  });
+};
+
+export const checkAndRetryProductAvailability = async (
+  companies: string[],
+  companyIds: number[] = []
+): Promise<Product[]> => {
   try {
     // First check in Supabase
     const { data: supabaseData, error: supabaseError } = await supabase
@@ -156,9 +226,9 @@ export const checkAndRetryProductAvailability = async (companies: string[]): Pro
     // console.log('No products found, initiating scrape request...');
     // await axios.post(`${API_BASE_URL}/api/scrape/`, { companies });
 
-    // Wait for 1 minute after webhook request
-    console.log('Waiting for 20 seconds before checking Supabase...');
-    await new Promise(resolve => setTimeout(resolve, 20000)); // Wait for 1 minute
+    // Wait for the backend to push scrape completion instead of polling
+    console.log('Waiting for scrape results before checking Supabase...');
+    await waitForScrapeEvents(companies, companyIds);
 
     // Check Supabase again after waiting
     console.log('Checking Supabase after waiting...');